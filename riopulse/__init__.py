@@ -1,4 +1,10 @@
 from .compilation import * 
 from .pulsegen import *
 from .sequence import *
-from .gui import *
\ No newline at end of file
+from .emulator import *
+from .template import *
+from .group import *
+from .gui import *
+from . import storage
+from . import metrics
+
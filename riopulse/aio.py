@@ -0,0 +1,138 @@
+import asyncio
+import functools
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Union
+
+from .sequence import Sequence
+from .compilation import MachineCode
+from .pulsegen import PulseGen, UploadStats
+
+
+class AsyncPulseGen:
+    """An asyncio interface to a PulseGen.
+
+    The calls to the board are executed one at a time in a thread
+    dedicated to the board, so that they do not block the event loop.
+    They are executed in the order in which they are made, except that
+    program calls with a Sequence enter the queue after the compilation.
+    Sequences are compiled in another thread, so the next sequence can be
+    compiled while the code of the current one is uploaded:
+
+        async with AsyncPulseGen(PulseGen('RIO0')) as ap:
+            await ap.program(seq1)
+            next_code = asyncio.ensure_future(ap.compile(seq2))
+            await ap.run_single()
+            ...
+            await ap.program(await next_code)
+
+    Every method accepts a timeout (s), after which it raises
+    asyncio.TimeoutError. A call that is cancelled or timed out before
+    it starts executing is skipped. A call to nifpga that has already
+    started cannot be interrupted; it completes in the background and
+    the next calls wait for it.
+
+    Attributes:
+        pulsegen (PulseGen):
+            The synchronous pulse generator. It should not be used directly
+            while the asynchronous one is in use.
+        timeout (float or None):
+            The default timeout (s) of the calls, None for no timeout.
+    """
+
+    def __init__(self, pulsegen: PulseGen, timeout: Union[float, None] = None):
+        self.pulsegen = pulsegen
+        self.timeout = timeout
+
+        name = f'riopulse {pulsegen.resource}'
+        self._board_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=name)
+        self._compile_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=f'{name} compile')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exception_type, exception_val, trace):
+        await self.close()
+
+    async def _run(self, executor, func, *args, timeout=None, **kwargs):
+        """Calls func in an executor and waits for the result."""
+
+        if timeout is None:
+            timeout = self.timeout
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            executor, functools.partial(func, *args, **kwargs))
+        return await asyncio.wait_for(future, timeout)
+
+    async def compile(self, seq: Sequence,
+                      timeout: Union[float, None] = None) -> MachineCode:
+        """Compiles a sequence in the same way as PulseGen.program does,
+        including the incremental recompilation of the latest programmed
+        sequence. The sequence should not be modified until the code
+        is returned."""
+        return await self._run(self._compile_executor,
+                               self.pulsegen._compile, seq, timeout=timeout)
+
+    async def program(self, data: Union[Sequence, MachineCode, list],
+                      force: bool = False, stream: bool = False,
+                      partial: bool = False,
+                      timeout: Union[float, None] = None) -> UploadStats:
+        """Compiles a sequence in the compilation thread and uploads it
+        in the board thread. See PulseGen.program for the arguments.
+        The timeout applies to the compilation and the upload separately.
+        """
+
+        if isinstance(data, Sequence) and not stream:
+            data = await self.compile(data, timeout=timeout)
+
+        return await self._run(self._board_executor, self.pulsegen.program,
+                               data, force=force, stream=stream,
+                               partial=partial, timeout=timeout)
+
+    async def play(self, data: Union[Sequence, MachineCode, list],
+                   dt: Union[float, None] = None,
+                   timeout: Union[float, None] = None) -> list:
+        """See PulseGen.play."""
+        return await self._run(self._board_executor, self.pulsegen.play,
+                               data, dt, timeout=timeout)
+
+    async def init_fpga(self, check: bool = False,
+                        timeout: Union[float, None] = None) -> None:
+        """See PulseGen.init_fpga."""
+        await self._run(self._board_executor, self.pulsegen.init_fpga,
+                        check, timeout=timeout)
+
+    async def check_state(self,
+                          timeout: Union[float, None] = None) -> bool:
+        """See PulseGen.check_state."""
+        return await self._run(self._board_executor,
+                               self.pulsegen.check_state, timeout=timeout)
+
+    async def run_continuous(self,
+                             timeout: Union[float, None] = None) -> None:
+        """See PulseGen.run_continuous."""
+        await self._run(self._board_executor, self.pulsegen.run_continuous,
+                        timeout=timeout)
+
+    async def run_single(self, timeout: Union[float, None] = None) -> None:
+        """See PulseGen.run_single."""
+        await self._run(self._board_executor, self.pulsegen.run_single,
+                        timeout=timeout)
+
+    async def stop(self, timeout: Union[float, None] = None) -> None:
+        """See PulseGen.stop."""
+        await self._run(self._board_executor, self.pulsegen.stop,
+                        timeout=timeout)
+
+    async def close(self) -> None:
+        """Closes the session of the PulseGen after the pending calls
+        complete, and stops the threads."""
+
+        try:
+            await self._run(self._board_executor, self.pulsegen.close)
+        finally:
+            self._board_executor.shutdown(wait=False)
+            self._compile_executor.shutdown(wait=False)
@@ -0,0 +1,272 @@
+"""Benchmarks of building, translating, compiling and uploading sequences.
+
+The benchmarks run without hardware: the code is uploaded to an Emulator,
+which stands in for nifpga.Session. Each benchmark is a stage of the
+pipeline applied to a synthetic sequence with a given total number of
+state transitions spread over a given number of channels.
+
+Usage:
+    python -m riopulse.benchmark run -o new.json
+    python -m riopulse.benchmark compare old.json new.json
+
+The compare command prints the ratios of the timings and the peak memory
+of the two runs and exits with status 1 if any benchmark regressed by
+more than the threshold.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import numpy as np
+
+from .sequence import Sequence
+from .compilation import MAX_COMMANDS, compile_, translate
+from .pulsegen import PulseGen
+from .emulator import Emulator
+
+
+FILE_VERSION = 1
+
+STAGES = ['build', 'translate', 'compile', 'upload']
+TRANSITIONS = [10, 1000, 10000]
+CHANNELS = [1, 4, 8]
+
+
+class Result(namedtuple('Result', ['stage', 'transitions', 'channels',
+                                   'times', 'peak_memory'])):
+    """The measurements of one benchmark.
+
+    Attributes:
+        stage: The name of the stage.
+        transitions: The total number of state transitions in the sequence.
+        channels: The number of channels of the sequence.
+        times: The durations of the repetitions (s).
+        peak_memory: The peak size of the memory allocated by Python
+            during the stage (bytes).
+    """
+
+    @property
+    def name(self) -> str:
+        return f'{self.stage}/{self.transitions}x{self.channels}'
+
+    @property
+    def best(self) -> float:
+        """The shortest duration, the least affected by the noise."""
+        return min(self.times)
+
+
+class Comparison(namedtuple('Comparison', ['name', 'time_ratio',
+                                           'memory_ratio', 'regressed'])):
+    """The change of a benchmark between two runs.
+
+    Attributes:
+        name: The name of the benchmark.
+        time_ratio: The ratio of the best durations, new/old.
+        memory_ratio: The ratio of the peak memory, new/old.
+        regressed: True if either ratio exceeds 1 + threshold.
+    """
+
+
+def pulse_trains(transitions: int, channels: int, seed: int = 0) -> list:
+    """Generates random pulses that together have the specified number
+    of transitions.
+
+    The pulses are on a grid of clock cycles, do not overlap within
+    a channel and rarely start or end at the same time in different
+    channels.
+
+    Returns:
+        A list of (channel, start time, duration) sorted by the start time.
+    """
+
+    rng = np.random.default_rng(seed)
+
+    npulses = max(transitions // 2, 1)
+    counts = np.bincount(rng.integers(channels, size=npulses),
+                         minlength=channels)
+
+    dt = 1e-8
+    span = 100 * transitions
+
+    pulses = []
+    for ch, n in enumerate(counts):
+        edges = np.sort(rng.choice(span, size=2*n, replace=False)) + 1
+        for t0, t1 in zip(edges[::2].tolist(), edges[1::2].tolist()):
+            pulses.append((ch, t0 * dt, (t1 - t0) * dt))
+
+    pulses.sort(key=lambda p: p[1])
+    return pulses
+
+
+def build(pulses: list, channels: int) -> Sequence:
+    """Makes a sequence by adding the pulses one by one."""
+
+    seq = Sequence(nchannels=channels)
+    for ch, t0, duration in pulses:
+        seq.add_pulse(ch, t0, duration)
+    return seq
+
+
+def run(stages=STAGES, transitions=TRANSITIONS, channels=CHANNELS,
+        repeat: int = 5, seed: int = 0) -> list:
+    """Runs the benchmarks for all combinations of the sizes.
+
+    Every stage is repeated and timed, and then run once more under
+    tracemalloc to measure the peak memory.
+
+    Returns:
+        A list of Result objects.
+    """
+
+    results = []
+
+    for n in transitions:
+        for nch in channels:
+            pulses = pulse_trains(n, nch, seed)
+            seq = build(pulses, nch)
+            code = compile_(seq, cache=False)
+
+            # The code of the largest sequences may exceed the memory of
+            # the board by a few commands. The emulated memory is enlarged
+            # to time the transfer nonetheless.
+            size = max(len(code), MAX_COMMANDS)
+            emu = Emulator(memory_size=size)
+            p = PulseGen('emulator', session_factory=emu.session)
+            p.max_commands = size
+
+            funcs = {'build': lambda: build(pulses, nch),
+                     'translate': lambda: translate(seq),
+                     'compile': lambda: compile_(seq, cache=False),
+                     'upload': lambda: p.program(code, force=True)}
+
+            for stage in stages:
+                func = funcs[stage]
+                times = [_timed(func) for _ in range(repeat)]
+                results.append(Result(stage, n, nch, times, _peak(func)))
+
+    return results
+
+
+def _timed(func) -> float:
+    t0 = time.perf_counter()
+    func()
+    return time.perf_counter() - t0
+
+
+def _peak(func) -> int:
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def save(path: str, results: list) -> None:
+    """Writes the results with a description of the environment
+    to a JSON file."""
+
+    data = {'version': FILE_VERSION,
+            'date': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'results': [r._asdict() for r in results]}
+
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=1)
+
+
+def load(path: str) -> list:
+    """Reads results written by save."""
+
+    with open(path) as f:
+        data = json.load(f)
+
+    if data.get('version') != FILE_VERSION:
+        raise ValueError(f'Unsupported benchmark file version '
+                         f'{data.get("version")}.')
+
+    return [Result(**r) for r in data['results']]
+
+
+def compare(old: list, new: list, threshold: float = 0.1) -> list:
+    """Compares the benchmarks present in both runs.
+
+    Args:
+        old, new:
+            Lists of Result objects.
+        threshold:
+            The relative increase of the duration or the peak memory
+            considered a regression.
+
+    Returns:
+        A list of Comparison objects in the order of the new results.
+    """
+
+    old = {r.name: r for r in old}
+
+    comparisons = []
+    for r in new:
+        if r.name not in old:
+            continue
+
+        o = old[r.name]
+        time_ratio = r.best / o.best if o.best > 0 else 1.
+        memory_ratio = (r.peak_memory / o.peak_memory
+                        if o.peak_memory > 0 else 1.)
+        regressed = max(time_ratio, memory_ratio) > 1 + threshold
+        comparisons.append(Comparison(r.name, time_ratio, memory_ratio,
+                                      regressed))
+
+    return comparisons
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m riopulse.benchmark',
+                                     description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_run = sub.add_parser('run', help='run the benchmarks')
+    p_run.add_argument('-o', '--output', help='the JSON file for the results')
+    p_run.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    p_run.add_argument('--transitions', nargs='+', type=int,
+                       default=TRANSITIONS)
+    p_run.add_argument('--channels', nargs='+', type=int, default=CHANNELS)
+    p_run.add_argument('--repeat', type=int, default=5)
+
+    p_cmp = sub.add_parser('compare', help='compare two runs')
+    p_cmp.add_argument('old')
+    p_cmp.add_argument('new')
+    p_cmp.add_argument('--threshold', type=float, default=0.1)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        results = run(args.stages, args.transitions, args.channels,
+                      args.repeat)
+        for r in results:
+            print(f'{r.name:<24}{r.best*1e3:10.3f} ms'
+                  f'{r.peak_memory/1024:12.1f} KiB')
+        if args.output:
+            save(args.output, results)
+        return 0
+
+    comparisons = compare(load(args.old), load(args.new), args.threshold)
+    for c in comparisons:
+        flag = '  REGRESSION' if c.regressed else ''
+        print(f'{c.name:<24}time x{c.time_ratio:6.2f}'
+              f'   memory x{c.memory_ratio:6.2f}{flag}')
+
+    return int(any(c.regressed for c in comparisons))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,18 +1,40 @@
+import hashlib
+import heapq
+import itertools
+import os
+import time
 import numpy as np
 
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, namedtuple
 from typing import Union
 
 from .sequence import Sequence
+from . import metrics
 
 
-def translate(seq: Sequence, dt: float = 1e-8) -> list:
+__all__ = ['DEFAULT_CLOCK_PERIOD', 'COMMAND_NO', 'MAX_COMMANDS', 'translate',
+           'MachineCode', 'compile_', 'PackedSequence', 'pack',
+           'compile_many', 'compress', 'segment', 'recompile', 'CompileCache',
+           'compile_cache', 'sequence_key', 'translate_stream',
+           'compile_stream', 'count_commands', 'segment_stream',
+           'flip_bit']
+
+
+# The clock period (s) of the FPGA target.
+DEFAULT_CLOCK_PERIOD = 1e-8
+
+
+@metrics.timed('translate')
+def translate(seq: Sequence, dt: Union[float, None] = None) -> list:
     """Produces a set of readable commands for the FPGA state machine.
 
     Args:
         seq: 
             A pulse sequence.
         dt: 
-            Clock period (s).
+            Clock period (s). The default is the clock period of 
+            the sequence if it has one, and DEFAULT_CLOCK_PERIOD otherwise.
 
     Returns:
         A list of commands and their arguments of the format 
@@ -20,79 +42,961 @@ def translate(seq: Sequence, dt: float = 1e-8) -> list:
         where cmd is a string and args are integers.
     """
 
-    # Makes a combned list of state switch times for all channels and
-    # a list of channel numbers in which the switches occurred.
-    times = []
-    channel_numbers = []
-    for i, c in enumerate(seq.channels):
-        times += c.switch_times
-        channel_numbers += [i]*len(c.switch_times)
-
-    # Sorts in the order of incresing time.
-    sidx = np.argsort(times)
-    times = [times[i] for i in sidx]
-    channel_numbers = [channel_numbers[i] for i in sidx]
+    dt = _clock_period(seq, dt)
 
-    # Converts switch times to numbers of clock cycles.
-    t0 = seq.start_time
-    clock_cycles = [round((t-t0)/dt) for t in times]
+    cycles, signals = _transitions(seq, dt)
+    stop_cycle = int(_to_cycles(seq, seq.stop_time, dt))
+    sig, n = _cout_arrays(cycles, signals, _default_signal(seq), stop_cycle)
 
     commands = []
 
     # Adds a command to wait for a trigger to start the sequence.
     commands.append(['trigwait', 0, 0])
 
-    # The outputs start in the default state.
-    sig = 0b0
+    # Adds continuous outputs of sig for (n+1) clock cycles.
+    commands += [['cout', s, k] for s, k in zip(sig.tolist(), n.tolist())]
+
+    # Returns to the beginning of the instruction list.
+    commands.append(['init', 0, 0])
+
+    return commands
+
+
+# The numbers of the state machine commands.
+#
+# ['loop', L, k] repeats the block of L commands preceding it k more times.
+# The jump takes no clock cycles, and loops cannot be nested. The loop 
+# command requires a bitfile that implements it, and is only emitted by 
+# compile_ with compress=True.
+COMMAND_NO = {'init': 0, 'cout': 1, 'trigwait': 2, 'loop': 3}
+
+# The maximum number of commands in one program, limited by the size of 
+# the command memory of the FPGA.
+MAX_COMMANDS = 10000
+
+
+class MachineCode:
+    """State machine code stored in a contiguous array of 64-bit words.
+
+    Each word has the format: command number (8 bits), arg1 (8 bits), 
+    arg2 (48 bits).
+
+    Attributes:
+        words (numpy.ndarray):
+            A one-dimensional array of type uint64.
+    """
+
+    def __init__(self, words):
+        """Inits the code from an array or a list of 64-bit integers."""
+
+        self.words = np.ascontiguousarray(words, dtype=np.uint64).ravel()
+
+    @classmethod
+    def from_commands(cls, commands: list) -> 'MachineCode':
+        """Packs a list of readable commands of the format 
+        [..., [cmd, arg1, arg2], ...] (e.g. produced by translate).
+        """
+
+        n = [COMMAND_NO[cmd[0]] for cmd in commands]
+        arg1 = [cmd[1] for cmd in commands]
+        arg2 = [cmd[2] for cmd in commands]
+
+        return cls.from_arrays(n, arg1, arg2)
+
+    @classmethod
+    def from_arrays(cls, n, arg1, arg2) -> 'MachineCode':
+        """Packs arrays of command numbers and arguments into machine code."""
+
+        n = np.asarray(n, dtype=np.int64)
+        arg1 = np.asarray(arg1, dtype=np.int64)
+        arg2 = np.asarray(arg2, dtype=np.int64)
+
+        if np.any((arg1 < 0) | (arg1 >= (1 << 8))):
+            raise ValueError('arg1 must fit in 8 bits.')
+        if np.any((arg2 < 0) | (arg2 >= (1 << 48))):
+            raise ValueError('arg2 must fit in 48 bits.')
+
+        words = ((n.astype(np.uint64) << np.uint64(56))
+                 | (arg1.astype(np.uint64) << np.uint64(48))
+                 | arg2.astype(np.uint64))
+
+        return cls(words)
+
+    def decode(self) -> tuple:
+        """Splits the words into fields.
+
+        Returns:
+            (n, arg1, arg2), arrays of the command numbers and the arguments.
+        """
+
+        w = self.words
+        n = (w >> np.uint64(56)).astype(np.int64)
+        arg1 = ((w >> np.uint64(48)) & np.uint64(0xff)).astype(np.int64)
+        arg2 = (w & np.uint64((1 << 48) - 1)).astype(np.int64)
+
+        return n, arg1, arg2
+
+    @property
+    def cycles(self) -> int:
+        """The number of clock cycles taken by the cout commands, including 
+        their repetitions by loop commands."""
+
+        n, arg1, arg2 = self.decode()
+
+        durations = np.where(n == COMMAND_NO['cout'], arg2 + 1, 0)
+        total = int(np.sum(durations))
+
+        loops = np.flatnonzero(n == COMMAND_NO['loop'])
+        if loops.size:
+            cum = np.concatenate([[0], np.cumsum(durations)])
+            block = cum[loops] - cum[np.maximum(loops - arg1[loops], 0)]
+            total += int(np.sum(block * arg2[loops]))
+
+        return total
+
+    def chunks(self, size: int):
+        """Iterates over consecutive slices of the code of at most size words.
+        The slices are views of the underlying array, not copies."""
+
+        for i in range(0, len(self.words), size):
+            yield self.words[i: i+size]
+
+    def save(self, path: str) -> None:
+        """Writes the code to a binary file (see the storage module)."""
+
+        from . import storage
+        storage.save(path, code=self)
+
+    @classmethod
+    def load(cls, path: str) -> 'MachineCode':
+        """Memory-maps the code stored in a file written by save or by 
+        Sequence.save. The words are a read-only view of the file."""
+
+        from . import storage
+
+        code = storage.load(path).code
+        if code is None:
+            raise ValueError(f'{path} does not contain machine code.')
+
+        return code
+
+    def tolist(self) -> list:
+        """Returns the code as a list of python integers."""
+        return self.words.tolist()
+
+    def __len__(self):
+        return len(self.words)
+
+    def __iter__(self):
+        return iter(self.words.tolist())
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return type(self)(self.words[key])
+        return int(self.words[key])
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None:
+            return self.words
+        return self.words.astype(dtype)
+
+    def __eq__(self, other):
+        """Machine code is equal to another code, or to a list or an array of 
+        integers with the same values."""
+
+        if isinstance(other, MachineCode):
+            other = other.words
+        elif not isinstance(other, (list, tuple, np.ndarray)):
+            return NotImplemented
+
+        return bool(np.array_equal(self.words, np.asarray(other)))
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, self.tolist())
+
+
+@metrics.timed('compile')
+def compile_(data: Union[Sequence, list], dt: Union[float, None] = None,
+             cache: bool = True, compress: bool = False) -> MachineCode:
+    """Produces state machine code (an array of 64-bit integers) from 
+    a Sequence or a list of readable state machine commands. Readable commands
+    generated by the translate method.
+
+    Args:
+        data:
+            A Sequence object or a list of readable commands.
+        dt:
+            Clock period (s), only used when data is a Sequence. See 
+            translate for the default.
+        cache:
+            If True, the code compiled from a Sequence is looked up in and
+            stored to compile_cache. The cached code is read-only.
+        compress:
+            If True, repeated blocks of cout commands are replaced by loop 
+            commands (see the compress function). The compressed code 
+            can only be played by a bitfile that implements loops.
+    """
+
+    if isinstance(data, Sequence):
+        dt = _clock_period(data, dt)
+
+    if isinstance(data, Sequence) and cache:
+        key = sequence_key(data, dt) + bytes([compress])
+        mcode = compile_cache.get(key)
+
+        if mcode is None:
+            mcode = _compile(data, dt, compress)
+            mcode.words.flags.writeable = False
+            compile_cache.put(key, mcode)
+
+        return mcode
+
+    return _compile(data, dt, compress)
+
+
+def _compile(data: Union[Sequence, list], dt: float, 
+             compress: bool) -> MachineCode:
+    """Implements compile_ without the cache."""
+
+    if isinstance(data, Sequence):
+        mcode = _compile_packed(pack(data), dt)
+    else:
+        mcode = MachineCode.from_commands(data)
+
+    if compress:
+        mcode = _compress(mcode)
+
+    return mcode
+
+
+class PackedSequence(namedtuple('PackedSequence', 
+                                ['start_time', 'stop_time', 'clock_period', 
+                                 'defaults', 'counts', 'times'])):
+    """A compact representation of a Sequence by arrays, which is quick 
+    to pickle and to send to other processes.
+
+    Attributes:
+        start_time, stop_time, clock_period:
+            See Sequence.
+        defaults:
+            A boolean array of the default states of the channels.
+        counts:
+            An array of the numbers of state switches in the channels.
+        times:
+            The switch times of all channels, concatenated in the order of 
+            the channels.
+    """
+
+
+def pack(seq: Sequence) -> PackedSequence:
+    """Converts a sequence to its array representation."""
+
+    times = np.concatenate([np.asarray(c.switch_times, dtype=c.time_type)
+                            for c in seq.channels]
+                           + [np.empty(0, seq._time_type)])
+
+    return PackedSequence(seq.start_time, seq.stop_time, seq.clock_period,
+                          np.array([c.default for c in seq.channels], bool),
+                          np.array([len(c.switch_times) for c in seq.channels],
+                                   dtype=np.int64),
+                          times)
+
+
+def _compile_packed(packed: PackedSequence, dt: float) -> MachineCode:
+    """Compiles a packed sequence in the same way as compile_."""
+
+    nchannels = len(packed.counts)
+    masks = np.repeat(np.left_shift(1, np.arange(nchannels, dtype=np.int64)),
+                      packed.counts)
+    sig0 = int(np.sum(packed.defaults.astype(np.int64) 
+                      << np.arange(nchannels, dtype=np.int64)))
+
+    # Packs the arrays produced by the translation directly, without 
+    # making the readable list of commands.
+    cycles, signals = _combine(packed, packed.times, masks, sig0, dt)
+    stop_cycle = int(_to_cycles(packed, packed.stop_time, dt))
+    sig, n = _cout_arrays(cycles, signals, sig0, stop_cycle)
+
+    ncout = len(sig)
+    cmd = np.full(ncout + 2, COMMAND_NO['cout'])
+    cmd[0] = COMMAND_NO['trigwait']
+    cmd[-1] = COMMAND_NO['init']
+
+    return MachineCode.from_arrays(cmd, np.concatenate([[0], sig, [0]]),
+                                   np.concatenate([[0], n, [0]]))
+
+
+def compile_many(sequences, workers: Union[int, None] = None,
+                 dt: Union[float, None] = None, executor=None) -> tuple:
+    """Compiles many sequences in parallel in a pool of processes.
+
+    The sequences are sent to the processes in the packed form (see pack),
+    and the compiled code is returned as arrays.
+
+    Args:
+        sequences:
+            An iterable of Sequence objects.
+        workers:
+            The number of processes. The default is the number of CPUs. 
+            With one worker, the sequences are compiled in the calling 
+            process.
+        dt:
+            Clock period (s). See translate for the default.
+        executor:
+            A ProcessPoolExecutor to use instead of creating a pool for 
+            this call. It is not shut down, so it can be reused by 
+            the next calls. workers is then only used to split the jobs.
+
+    Returns:
+        (programs, timings), a list of MachineCode objects in the order of 
+        the sequences and an array of the compilation times (s) of each of 
+        them in the worker processes.
+    """
+
+    jobs = [(pack(seq), _clock_period(seq, dt)) for seq in sequences]
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers == 1 or len(jobs) <= 1:
+        results = [_compile_job(job) for job in jobs]
+    elif executor is not None:
+        chunksize = max(1, len(jobs) // (4*workers))
+        results = list(executor.map(_compile_job, jobs, chunksize=chunksize))
+    else:
+        # The import of the process pool takes a notable fraction of 
+        # the import time of the package.
+        from concurrent.futures import ProcessPoolExecutor
+
+        chunksize = max(1, len(jobs) // (4*workers))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_compile_job, jobs, 
+                                        chunksize=chunksize))
+
+    programs = [MachineCode(words) for words, _ in results]
+    timings = np.array([t for _, t in results], dtype=float)
+
+    return programs, timings
+
+
+def _compile_job(job: tuple) -> tuple:
+    """Compiles a packed sequence in a worker process.
+
+    Returns:
+        (words, the duration of the compilation)
+    """
+
+    packed, dt = job
+
+    t0 = time.perf_counter()
+    words = _compile_packed(packed, dt).words
+
+    return words, time.perf_counter() - t0
+
+
+@metrics.timed('compress')
+def compress(data: Union[MachineCode, list], 
+             max_block: int = 64) -> MachineCode:
+    """Replaces repeated blocks of consecutive cout commands by one copy 
+    of the block followed by a loop command. A periodic pulse train thus 
+    compiles into a few commands regardless of its duration.
+
+    The blocks are chosen greedily from the beginning of the code, each 
+    time taking the block length that removes the most commands.
+
+    Args:
+        data:
+            State machine code or a list of readable commands.
+        max_block:
+            The maximum length of a repeated block, at most 255.
+    """
+
+    if not isinstance(data, MachineCode):
+        data = MachineCode.from_commands(data)
+
+    return _compress(data, max_block)
+
+
+def _compress(mcode: MachineCode, max_block: int = 64) -> MachineCode:
+    """Implements compress for machine code."""
+
+    if not 1 <= max_block < (1 << 8):
+        raise ValueError('max_block must be between 1 and 255.')
+
+    words = mcode.words
+    nw = len(words)
+
+    # Commands are compared by their words. Commands other than cout get 
+    # unique keys, so that they never become parts of repeated blocks.
+    n, _, _ = mcode.decode()
+    keys = np.where(n == COMMAND_NO['cout'], words.astype(np.int64),
+                    -1 - np.arange(nw))
+
+    # The largest number of commands saved by a loop starting at each 
+    # position, and the block length and the number of repetitions 
+    # that achieve it.
+    best_saved = np.zeros(nw, dtype=np.int64)
+    best_len = np.ones(nw, dtype=np.int64)
+    best_reps = np.ones(nw, dtype=np.int64)
+
+    for length in range(1, min(max_block, nw // 2) + 1):
+        # A block of commands starting at i repeats r times if 
+        # keys[j+length] == keys[j] for (r-1)*length consecutive j from i.
+        run = _run_lengths(keys[length:] == keys[:-length])
+        reps = 1 + run // length
+        saved = (reps - 1) * length - 1
+
+        better = saved > best_saved[:nw-length]
+        idx = np.flatnonzero(better)
+        best_saved[idx] = saved[idx]
+        best_len[idx] = length
+        best_reps[idx] = reps[idx]
+
+    loop = np.uint64(COMMAND_NO['loop'] << 56)
+    starts = np.flatnonzero(best_saved > 0)
+    pieces = []
+    i = 0
+    while i < nw:
+        k = np.searchsorted(starts, i)
+        j = int(starts[k]) if k < len(starts) else nw
+
+        if j > i:
+            # Copies the commands up to the next repeated block.
+            pieces.append(words[i:j])
+            i = j
+            continue
+
+        length, reps = int(best_len[i]), int(best_reps[i])
+        pieces.append(words[i: i+length])
+        pieces.append(np.array([loop | np.uint64((length << 48) | (reps-1))],
+                               dtype=np.uint64))
+        i += length * reps
+
+    if not pieces:
+        return MachineCode(words)
+
+    return MachineCode(np.concatenate(pieces))
+
+
+def _run_lengths(mask: np.ndarray) -> np.ndarray:
+    """Returns the numbers of consecutive True values of a boolean array 
+    starting at every position."""
+
+    idx = np.arange(len(mask))
+    next_false = np.where(mask, len(mask), idx)
+    next_false = np.minimum.accumulate(next_false[::-1])[::-1]
+    return next_false - idx
+
+
+def segment(data: Union[Sequence, MachineCode, list], 
+            max_commands: int = MAX_COMMANDS, 
+            dt: Union[float, None] = None) -> list:
+    """Splits the state machine code of a long sequence into programs that 
+    fit in the command memory. Played one after another, the programs 
+    produce the same outputs as the whole sequence, except for the gaps 
+    between them.
+
+    Args:
+        data:
+            A Sequence object or state machine code, which must consist of 
+            cout commands between a trigwait and an init command.
+        max_commands:
+            The maximum number of commands in one program.
+        dt:
+            Clock period (s), only used when data is a Sequence. See 
+            translate for the default.
+
+    Returns:
+        A list of MachineCode objects. Every program starts with waiting for 
+        a trigger and ends by returning to its beginning at the boundary 
+        between two cout commands.
+    """
+
+    if isinstance(data, Sequence):
+        mcode = compile_(data, dt)
+    elif isinstance(data, MachineCode):
+        mcode = data
+    else:
+        mcode = MachineCode(data)
+
+    if len(mcode) <= max_commands:
+        return [mcode]
+
+    n, _, _ = mcode.decode()
+    if (n[0] != COMMAND_NO['trigwait'] or n[-1] != COMMAND_NO['init'] 
+            or np.any(n[1:-1] != COMMAND_NO['cout'])):
+        raise ValueError('Only programs that consist of cout commands '
+                         'between trigwait and init can be segmented.')
+
+    if max_commands < 3:
+        raise ValueError('max_commands must be at least 3.')
+
+    head, body, tail = mcode.words[:1], mcode.words[1:-1], mcode.words[-1:]
+    size = max_commands - 2
+
+    return [MachineCode(np.concatenate([head, body[i: i+size], tail]))
+            for i in range(0, len(body), size)]
+
+
+@metrics.timed('recompile')
+def recompile(seq: Sequence, previous: MachineCode, version: int,
+              dt: Union[float, None] = None) -> MachineCode:
+    """Updates the code compiled from an earlier version of a sequence. 
+    Only the commands in the time window modified after that version 
+    (see Sequence.changed_window) are regenerated and spliced between 
+    the unchanged commands before and after the window. The result is 
+    the same as compile_(seq, dt).
+
+    Args:
+        seq:
+            A pulse sequence.
+        previous:
+            The code compiled from the sequence when its version was 
+            the specified one.
+        version:
+            See above.
+        dt:
+            Clock period (s). See translate for the default.
+    """
+
+    dt = _clock_period(seq, dt)
+
+    window = seq.changed_window(version)
+    if window is None:
+        return previous
+
+    t0, t1 = window
+    if not t0 > seq.start_time:
+        # The modifications may have changed the start time.
+        return _compile(seq, dt, False)
+
+    n, _, arg2 = previous.decode()
+    if (len(n) < 2 or n[0] != COMMAND_NO['trigwait'] 
+            or n[-1] != COMMAND_NO['init']
+            or np.any(n[1:-1] != COMMAND_NO['cout'])):
+        return _compile(seq, dt, False)
+
+    # The clock cycles at which the commands of the previous code end.
+    ends = np.cumsum(arg2[1:-1] + 1)
+    starts = ends - (arg2[1:-1] + 1)
+
+    first = int(_to_cycles(seq, t0, dt))
+
+    # The unchanged commands before the window end before its first cycle. 
+    # The last command, which ends at the stop time, is always regenerated.
+    i0 = min(int(np.searchsorted(ends, first, side='left')), 
+             max(len(ends) - 1, 0))
+    c0 = int(ends[i0-1]) if i0 else 0
+
+    # The unchanged commands after the window begin after its last cycle.
+    if np.isfinite(t1):
+        last = int(_to_cycles(seq, t1, dt))
+        i1 = int(np.searchsorted(starts, last, side='right'))
+    else:
+        i1 = len(starts)
+
+    if i1 < len(starts):
+        c1 = int(starts[i1])
+    else:
+        c1 = None
+        stop_cycle = int(_to_cycles(seq, seq.stop_time, dt))
+
+    # The output states after the updates at the cycle c0, and the updates 
+    # between c0 and c1.
+    sig0 = _default_signal(seq)
+    times, masks = [], []
     for i, c in enumerate(seq.channels):
-        sig = sig | (c.default << i)
+        lo = _switch_index(seq, c, c0, dt)
+        hi = (_switch_index(seq, c, c1 - 1, dt) if c1 is not None 
+              else len(c.switch_times))
+
+        if lo % 2 == 1:
+            sig0 ^= 1 << i
+        times.append(np.asarray(c.switch_times[lo:hi], dtype=c.time_type))
+        masks.append(np.full(hi - lo, 1 << i, np.int64))
+
+    cycles, signals = _combine(
+        seq, np.concatenate(times + [np.empty(0, seq._time_type)]),
+        np.concatenate(masks + [np.empty(0, np.int64)]), sig0, dt)
+
+    if c1 is None:
+        sig, dur = _cout_arrays(cycles, signals, sig0, stop_cycle, c0)
+    else:
+        # The last regenerated command ends at the beginning of 
+        # the unchanged ones.
+        sig = np.concatenate([[sig0], signals])
+        dur = np.diff(np.concatenate([[c0], cycles, [c1]])) - 1
+
+    middle = MachineCode.from_arrays(np.full(len(sig), COMMAND_NO['cout']),
+                                     sig, dur)
+
+    words = previous.words
+    return MachineCode(np.concatenate([words[:1 + i0], middle.words, 
+                                       words[1 + i1:]]))
+
+
+def _switch_index(seq: Sequence, channel, cycle: int, dt: float) -> int:
+    """Returns the number of the state switches of a channel that fall 
+    on or before the clock cycle."""
+
+    swt = channel.switch_times
+
+    # The switches more than one clock period away from the cycle are 
+    # found by time, and the remaining ones by their cycles.
+    if seq.clock_period is None:
+        t = seq.start_time + cycle*dt
+        lo, hi = bisect_left(swt, t - dt), bisect_right(swt, t + dt)
+    else:
+        t = seq.start_time + cycle
+        lo, hi = bisect_left(swt, t - 1), bisect_right(swt, t + 1)
+
+    cycles = _to_cycles(seq, swt[lo:hi], dt)
+    return lo + int(np.searchsorted(cycles, cycle, side='right'))
+
+
+class CompileCache:
+    """A bounded cache of compiled machine code, which discards the least 
+    recently used entries when full.
+
+    Attributes:
+        maxsize (int):
+            The maximum number of entries.
+        hits (int):
+            The number of successful lookups.
+        misses (int):
+            The number of failed lookups.
+    """
+
+    def __init__(self, maxsize: int = 64):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key: bytes):
+        """Returns the entry for the key or None if there is no such entry."""
+
+        value = self._entries.get(key)
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+
+        return value
+
+    def put(self, key: bytes, value) -> None:
+        """Adds an entry, discarding the least recently used entries if 
+        the size limit is exceeded."""
+
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Removes all entries and resets the counters."""
+
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# The cache used by compile_.
+compile_cache = CompileCache()
+
+
+def sequence_key(seq: Sequence, dt: float) -> bytes:
+    """Returns a hash of everything that determines the machine code 
+    compiled from a sequence: the channel defaults and switch times, 
+    the start and stop times, and the clock period."""
+
+    h = hashlib.blake2b(digest_size=20)
+
+    h.update(repr((seq.start_time, seq.stop_time, dt,
+                   seq.clock_period)).encode())
+    h.update(np.array([c.default for c in seq.channels]).tobytes())
+
+    for c in seq.channels:
+        swt = np.asarray(c.switch_times, dtype=c.time_type)
+        h.update(np.int64(len(swt)).tobytes())
+        h.update(swt.tobytes())
+
+    return h.digest()
+
+
+def translate_stream(seq: Sequence, dt: Union[float, None] = None):
+    """Generates the same readable commands as translate one by one, 
+    without making combined lists of the state switches and the commands.
+
+    Args:
+        seq, dt:
+            See translate.
+
+    Yields:
+        Commands of the format [cmd, arg1, arg2].
+    """
+
+    yield ['trigwait', 0, 0]
+
+    for sig, n in _stream_couts(seq, _clock_period(seq, dt)):
+        yield ['cout', sig, n]
+
+    yield ['init', 0, 0]
+
+
+def compile_stream(seq: Sequence, dt: Union[float, None] = None):
+    """Generates the same state machine code as compile_ word by word. 
+    The memory used by the generator does not depend on the length of 
+    the sequence.
+
+    Args:
+        seq, dt:
+            See translate.
+
+    Yields:
+        64-bit integers.
+    """
+
+    yield COMMAND_NO['trigwait'] << 56
+
+    cout = COMMAND_NO['cout'] << 56
+    for sig, n in _checked_couts(seq, _clock_period(seq, dt)):
+        yield cout | (sig << 48) | n
+
+    yield COMMAND_NO['init'] << 56
+
+
+def count_commands(seq: Sequence, dt: Union[float, None] = None) -> int:
+    """Returns the number of commands produced by the translation of 
+    a sequence, computed without storing them. 
+
+    Raises:
+        ValueError: 
+            If the arguments of a command do not fit in the machine code,
+            which compile_stream would raise while generating it.
+    """
+
+    return sum(1 for _ in _checked_couts(seq, _clock_period(seq, dt))) + 2
+
+
+def segment_stream(seq: Sequence, max_commands: int = MAX_COMMANDS,
+                   dt: Union[float, None] = None):
+    """Generates the same programs as segment one by one from the stream 
+    of commands of a sequence. Only one program is stored at a time, 
+    so the memory used does not depend on the length of the sequence.
+
+    Args:
+        seq:
+            A Sequence object.
+        max_commands:
+            The maximum number of commands in one program.
+        dt:
+            Clock period (s). See translate for the default.
+
+    Yields:
+        MachineCode objects.
+    """
+
+    if max_commands < 3:
+        raise ValueError('max_commands must be at least 3.')
+
+    cout = COMMAND_NO['cout'] << 56
+    words = (cout | (sig << 48) | n 
+             for sig, n in _checked_couts(seq, _clock_period(seq, dt)))
+
+    head = np.array([COMMAND_NO['trigwait'] << 56], dtype=np.uint64)
+    tail = np.array([COMMAND_NO['init'] << 56], dtype=np.uint64)
+    size = max_commands - 2
+
+    # A sequence without output commands still makes one program.
+    body = np.fromiter(itertools.islice(words, size), dtype=np.uint64)
+    while True:
+        yield MachineCode(np.concatenate([head, body, tail]))
 
+        body = np.fromiter(itertools.islice(words, size), dtype=np.uint64)
+        if not len(body):
+            return
+
+
+def _checked_couts(seq: Sequence, dt: float):
+    """Generates the arguments of the cout commands as _stream_couts does, 
+    checking that they fit in the machine code."""
+
+    for sig, n in _stream_couts(seq, dt):
+        if not 0 <= sig < (1 << 8):
+            raise ValueError('arg1 must fit in 8 bits.')
+        if n >= (1 << 48):
+            raise ValueError('arg2 must fit in 48 bits.')
+
+        yield sig, n
+
+
+def _stream_couts(seq: Sequence, dt: float):
+    """Generates the arguments (sig, n) of the cout commands of a sequence by 
+    merging the ordered switch times of its channels."""
+
+    t0 = seq.start_time
+
+    if seq.clock_period is None:
+        def to_cycles(t):
+            return round((t-t0)/dt)
+    else:
+        def to_cycles(t):
+            return int(t - t0)
+
+    # Merges the switches of all channels in the order of increasing time. 
+    # The items are (time, channel bitmask).
+    switches = heapq.merge(*[zip(c.switch_times, itertools.repeat(1 << i))
+                             for i, c in enumerate(seq.channels)])
+
+    sig = _default_signal(seq)
     cc = 0
-    for ch, cc_next in zip(channel_numbers, clock_cycles):
-        if cc_next > cc:
+    for t, mask in switches:
+        cc_next = to_cycles(t)
 
-            # Adds a continuous output of sig for (cc_next-cc) clock cycles
-            # and moves to the clock cycle of the next switch.
-            commands.append(['cout', sig, cc_next-cc-1])
+        if cc_next > cc:
+            # Outputs sig for (cc_next-cc) clock cycles and moves to 
+            # the clock cycle of the next switch.
+            yield sig, cc_next-cc-1
             cc = cc_next
 
         # Accumulates the changes of outputs over the current clock cycle.
-        sig = flip_bit(sig, ch)
+        sig = sig ^ mask
 
-    cc_next = round((seq.stop_time - seq.start_time)/dt)
+    cc_next = to_cycles(seq.stop_time)
     if cc_next-cc > 1:
-        commands.append(['cout', sig, cc_next-cc-1])
+        yield sig, cc_next-cc-1
 
-    # Returns to the beginning of the instruction list.
-    commands.append(['init', 0, 0])
 
-    return commands
+def _clock_period(seq: Sequence, dt: Union[float, None]) -> float:
+    """Returns the clock period used to compile a sequence."""
 
+    if seq.clock_period is None:
+        if dt is None:
+            return DEFAULT_CLOCK_PERIOD
+        return dt
 
-def compile_(data: Union[Sequence, list]) -> list:
-    """Produces state machine code (a list of 64-bit integers) from 
-    a Sequence or a list of readable state machine commands. Readable commands
-    generated by the translate method.
+    if dt is not None and dt != seq.clock_period:
+        raise ValueError(f'The clock period dt={dt} is different from '
+                         f'the clock period of the sequence '
+                         f'({seq.clock_period}).')
+
+    return seq.clock_period
+
+
+def _to_cycles(seq: Sequence, times, dt: float) -> np.ndarray:
+    """Converts times to numbers of clock cycles counted from the start of 
+    the sequence."""
+
+    if seq.clock_period is not None:
+        # The times are already integer numbers of cycles.
+        return np.asarray(times, dtype=np.int64) - seq.start_time
+
+    # np.rint rounds half to even in the same way as the python round.
+    t = np.asarray(times, dtype=float)
+    return np.rint((t - seq.start_time)/dt).astype(np.int64)
+
+
+def _default_signal(seq: Sequence) -> int:
+    """Returns the output bitmask with all channels in their default states."""
+
+    sig = 0b0
+    for i, c in enumerate(seq.channels):
+        sig = sig | (c.default << i)
+    return sig
+
+
+def _transitions(seq: Sequence, dt: float) -> tuple:
+    """Quantizes the state switches of all channels of a sequence to clock 
+    cycles and combines the switches that fall on the same cycle.
+
+    Returns:
+        (cycles, signals), where cycles is an ordered array of the clock 
+        cycles (counted from the start of the sequence) at which the outputs 
+        are updated, and signals is an array of the output bitmasks after 
+        the updates.
     """
 
-    command_no = {'init': 0, 'cout': 1, 'trigwait': 2}
+    # Makes a combined array of state switch times for all channels and
+    # an array of the channel bitmasks in which the switches occurred.
+    times = np.concatenate([np.asarray(c.switch_times, dtype=c.time_type)
+                            for c in seq.channels] 
+                           + [np.empty(0, seq._time_type)])
+    masks = np.concatenate([np.full(len(c.switch_times), 1 << i, np.int64)
+                            for i, c in enumerate(seq.channels)]
+                           + [np.empty(0, np.int64)])
 
-    if isinstance(data, Sequence):
-        commands = translate(data)
-    else:
-        commands = data
+    return _combine(seq, times, masks, _default_signal(seq), dt)
 
-    # Each element of the array is an integer of the format: 
-    # command number (8 bits), arg1 (8 bits), arg2 (48 bits)
-    mcode = []
-    for cmd in commands:
-        n = command_no[cmd[0]]
-        arg1 = cmd[1]
-        arg2 = cmd[2]
 
-        mcode.append((n << 56) + (arg1 << 48) + arg2)
+def _combine(seq: Sequence, times, masks, sig0: int, dt: float) -> tuple:
+    """Implements _transitions for arrays of switch times and masks, 
+    starting from the output states sig0."""
 
-    return mcode
+    if times.size == 0:
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+
+    clock_cycles = _to_cycles(seq, times, dt)
+
+    # Sorts in the order of incresing time.
+    sidx = np.argsort(clock_cycles, kind='stable')
+    clock_cycles = clock_cycles[sidx]
+    masks = masks[sidx]
+
+    # Accumulates the changes of outputs over every clock cycle.
+    cycles, idx = np.unique(clock_cycles, return_index=True)
+    changes = np.bitwise_xor.reduceat(masks, idx)
+    signals = sig0 ^ np.bitwise_xor.accumulate(changes)
+
+    return cycles, signals
+
+
+def _cout_arrays(cycles, signals, sig0: int, stop_cycle: int,
+                 start_cycle: int = 0) -> tuple:
+    """Converts the output updates to the arguments of cout commands.
+
+    Args:
+        cycles, signals:
+            See _transitions.
+        sig0:
+            The outputs in the beginning of the sequence.
+        stop_cycle:
+            The clock cycle of the end of the sequence.
+        start_cycle:
+            The clock cycle of the beginning of the first command.
+
+    Returns:
+        (sig, n), arrays of the outputs and the durations in clock cycles 
+        minus one of the cout commands.
+    """
+
+    # Each output state lasts from the previous update until the next one.
+    prev_cycles = np.concatenate([[start_cycle], cycles])[:-1]
+    prev_signals = np.concatenate([[sig0], signals])[:-1]
+
+    # A switch at the zero cycle only changes the initial outputs.
+    keep = cycles > prev_cycles
+    sig = prev_signals[keep]
+    n = (cycles - prev_cycles)[keep] - 1
+
+    if cycles.size:
+        cc = int(cycles[-1])
+        sig_last = int(signals[-1])
+    else:
+        cc = start_cycle
+        sig_last = sig0
+
+    if stop_cycle - cc > 1:
+        sig = np.append(sig, sig_last)
+        n = np.append(n, stop_cycle - cc - 1)
+
+    return sig.astype(np.int64), n.astype(np.int64)
 
 
 def flip_bit(value, bit):
@@ -0,0 +1,374 @@
+import numpy as np
+
+from collections import namedtuple
+from typing import Union
+
+from .sequence import Sequence
+from .compilation import COMMAND_NO, MAX_COMMANDS, MachineCode, compile_
+from .compilation import _clock_period, _to_cycles
+
+
+__all__ = ['Emulator', 'Trace', 'emulate']
+
+
+class Emulator:
+    """A software model of the FPGA state machine that can replace the board
+    in PulseGen.
+
+    The emulator mimics the registers ('prog ncmd', 'persistent trig',
+    'software trig', 'default out') and the 'command' FIFO of the FPGA
+    target. Writing a non-zero number to 'prog ncmd' puts the machine in
+    the programming state, in which it moves the words from the FIFO to
+    the command memory until the specified number of words is received.
+    After that, 'prog ncmd' is reset to zero and the machine returns to
+    the execution of commands.
+
+    The execution is not simulated cycle by cycle. Instead, every rising
+    edge of 'software trig' records a pass through the program in `played`,
+    which can be rendered as a list of output states or per clock cycle.
+
+    Example:
+        emu = Emulator()
+        p = PulseGen('emulator', session_factory=emu.session)
+        p.program(seq)
+        p.run_single()
+        trace = emu.played[-1]
+
+    Attributes:
+        memory (numpy.ndarray):
+            The command memory, an array of type uint64.
+        ncmd (int):
+            The number of commands written to the memory by the latest
+            completed programming.
+        registers (dict):
+            The emulated registers by name.
+        fifos (dict):
+            The emulated FIFOs by name.
+        played (List[Trace]):
+            The passes through the program initiated by software triggers.
+    """
+
+    def __init__(self, memory_size: int = MAX_COMMANDS, 
+                 fifo_depth: int = 8192):
+        """Inits the emulator in the state of a freshly loaded bitfile.
+
+        Args:
+            memory_size:
+                The size of the command memory in 64-bit words.
+            fifo_depth:
+                The default depth of the host memory part of the command FIFO.
+        """
+
+        self.memory = np.zeros(memory_size, dtype=np.uint64)
+        self.ncmd = 0
+
+        self.registers = {name: _Register(self, name, value) for name, value
+                          in [('prog ncmd', 0), ('persistent trig', False),
+                              ('software trig', False), ('default out', 0)]}
+        self.fifos = {'command': _Fifo(self, fifo_depth)}
+
+        self.played = []
+
+        self._address = 0  # The memory address in the programming state
+
+    def session(self, bitfile: str = '', resource: str = '') -> '_Session':
+        """Opens a session to the emulator. Has the signature of
+        nifpga.Session, so that it can be used as a session factory
+        for PulseGen."""
+        return _Session(self)
+
+    def reset(self) -> None:
+        """Clears the memory, the registers and the FIFO as loading
+        the bitfile does."""
+
+        self.__init__(len(self.memory), self.fifos['command'].default_depth)
+
+    @property
+    def program(self) -> MachineCode:
+        """The machine code in the memory up to the first init command, 
+        which is executed by the machine. A programming may overwrite only 
+        the beginning of the previous program."""
+
+        init = np.flatnonzero(self.memory >> np.uint64(56) 
+                              == COMMAND_NO['init'])
+        end = int(init[0]) + 1 if init.size else len(self.memory)
+        return MachineCode(self.memory[:end])
+
+    def trace(self) -> 'Trace':
+        """Returns one pass through the program in the memory."""
+        return emulate(self.program)
+
+    def verify(self, seq: Sequence, dt: Union[float, None] = None) -> bool:
+        """Checks if the program in the memory reproduces the sequence."""
+        return self.trace().matches(seq, dt)
+
+    def _register_written(self, name, old, new) -> None:
+        """Updates the state of the machine after a register write."""
+
+        if name == 'prog ncmd' and new != 0:
+            # Enters the programming state.
+            self._address = 0
+            self._transfer()
+        elif name == 'software trig' and new and not old:
+            if self.registers['prog ncmd'].value == 0:
+                self.played.append(self.trace())
+
+    def _transfer(self) -> None:
+        """Moves the commands from the FIFO to the memory in
+        the programming state."""
+
+        ncmd = self.registers['prog ncmd'].value
+        if ncmd == 0:
+            return
+
+        if ncmd > len(self.memory):
+            raise ValueError(f'The number of commands ({ncmd}) exceeds '
+                             f'the memory size ({len(self.memory)}).')
+
+        words = self.fifos['command'].pop(ncmd - self._address)
+        self.memory[self._address: self._address + len(words)] = words
+        self._address += len(words)
+
+        if self._address == ncmd:
+            # Returns to the execution state.
+            self.ncmd = ncmd
+            self.registers['prog ncmd'].value = 0
+
+
+class Trace(namedtuple('Trace', ['cycles', 'outputs', 'length'])):
+    """A pass of the state machine through a program.
+
+    Attributes:
+        cycles:
+            An array of the clock cycles at which the outputs are set,
+            counted from the first cycle after the trigger.
+        outputs:
+            An array of the output bitmasks set at these cycles.
+        length:
+            The number of clock cycles until the program returns to its
+            beginning.
+    """
+
+    def waveform(self) -> np.ndarray:
+        """Returns the outputs at every clock cycle of the pass."""
+
+        durations = np.diff(np.append(self.cycles, self.length))
+        return np.repeat(self.outputs, durations)
+
+    def matches(self, seq: Sequence, dt: Union[float, None] = None) -> bool:
+        """Checks if the outputs are the states of the channels of
+        the sequence quantized to clock cycles.
+
+        The comparison covers the cycles from the start of the sequence until
+        the end of the last output command, which may be one cycle before
+        the end of the sequence. See translate for the default dt.
+        """
+
+        dt = _clock_period(seq, dt)
+        stop_cycle = int(_to_cycles(seq, seq.stop_time, dt))
+
+        if not stop_cycle - 1 <= self.length <= stop_cycle:
+            return False
+
+        # The expected outputs at the cycles when the outputs are set.
+        expected = np.zeros(len(self.cycles), dtype=np.int64)
+        changes = []
+        for i, c in enumerate(seq.channels):
+            swc = _to_cycles(seq, c.switch_times, dt)
+
+            # The state after all switches at or before the cycle.
+            n = np.searchsorted(swc, self.cycles, side='right')
+            st = (n % 2 == 1) ^ c.default
+            expected |= st.astype(np.int64) << i
+
+            # The cycles at which the channel state changes.
+            ucyc, counts = np.unique(swc, return_counts=True)
+            changes.append(ucyc[counts % 2 == 1])
+
+        changes = np.concatenate(changes)
+        changes = changes[(changes > 0) & (changes < self.length)]
+
+        return bool(np.array_equal(expected, self.outputs)
+                    and np.all(np.isin(changes, self.cycles)))
+
+
+def emulate(data: Union[Sequence, MachineCode, list]) -> Trace:
+    """Executes one pass through a program starting from the first command
+    until the program returns to its beginning. Waiting for a trigger is
+    assumed to complete in one clock cycle.
+
+    Args:
+        data:
+            A Sequence object or state machine code.
+    """
+
+    if isinstance(data, Sequence):
+        data = compile_(data)
+
+    if not isinstance(data, MachineCode):
+        data = MachineCode(data)
+
+    cmd, arg1, arg2 = data.decode()
+
+    # The program returns to its beginning at the first init command.
+    init = np.flatnonzero(cmd == COMMAND_NO['init'])
+    if init.size:
+        end = init[0]
+        cmd, arg1, arg2 = cmd[:end], arg1[:end], arg2[:end]
+
+    if np.any(cmd == COMMAND_NO['loop']):
+        order = _execution_order(cmd, arg1, arg2)
+        cmd, arg1, arg2 = cmd[order], arg1[order], arg2[order]
+
+    # The commands that set the outputs and the clock cycles they take.
+    is_cout = cmd == COMMAND_NO['cout']
+    durations = np.where(is_cout, arg2 + 1, 1)
+    starts = np.concatenate([[0], np.cumsum(durations)])
+
+    # The outputs change one cycle after waiting for the trigger.
+    offset = 1 if cmd.size and cmd[0] == COMMAND_NO['trigwait'] else 0
+
+    cycles = starts[:-1][is_cout] - offset
+    outputs = arg1[is_cout]
+    length = int(starts[-1]) - offset
+
+    return Trace(cycles, outputs, length)
+
+
+def _execution_order(cmd, arg1, arg2) -> np.ndarray:
+    """Executes the jumps of loop commands in the same way as the state 
+    machine, with one loop counter.
+
+    Returns:
+        The indices of the commands other than loop in the order in which 
+        they are executed.
+    """
+
+    order = []
+    counter = 0
+    i = 0
+    while i < len(cmd):
+        if cmd[i] != COMMAND_NO['loop']:
+            order.append(i)
+            i += 1
+        elif counter < arg2[i]:
+            if not 0 < arg1[i] <= i:
+                raise ValueError(f'Invalid loop block length {arg1[i]} '
+                                 f'at command {i}.')
+            counter += 1
+            i -= int(arg1[i])
+        else:
+            counter = 0
+            i += 1
+
+    return np.array(order, dtype=np.int64)
+
+
+class _Session:
+    """Emulates nifpga.Session for an Emulator."""
+
+    def __init__(self, emulator: Emulator):
+        self.emulator = emulator
+
+    @property
+    def registers(self) -> dict:
+        return self.emulator.registers
+
+    @property
+    def fifos(self) -> dict:
+        return self.emulator.fifos
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_val, trace):
+        self.close()
+
+    def close(self) -> None:
+        pass
+
+    def download(self) -> None:
+        self.emulator.reset()
+
+    def run(self) -> None:
+        pass
+
+    def reset(self) -> None:
+        self.download()
+
+    @property
+    def fpga_vi_state(self) -> str:
+        return 'Running'
+
+
+class _Register:
+    """Emulates a register of the FPGA target."""
+
+    def __init__(self, emulator: Emulator, name: str, value):
+        self._emulator = emulator
+        self.name = name
+        self.value = value
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, self.value)
+
+    def read(self):
+        return self.value
+
+    def write(self, data) -> None:
+        old = self.value
+        self.value = data
+        self._emulator._register_written(self.name, old, data)
+
+
+class _Fifo:
+    """Emulates the host-to-target command FIFO."""
+
+    def __init__(self, emulator: Emulator, depth: int):
+        self._emulator = emulator
+        self.default_depth = depth
+        self.depth = depth
+        self._data = []  # Arrays of words waiting to be read by the target
+        self.words_written = 0
+
+    def configure(self, requested_depth: int) -> int:
+        self.depth = requested_depth
+        return self.depth
+
+    def start(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        # Stopping a FIFO discards its content.
+        self._data = []
+
+    def write(self, data, timeout_ms: int = 0) -> int:
+        data = np.array(data, dtype=np.uint64, ndmin=1)
+
+        self._data.append(data)
+        self.words_written += len(data)
+        self._emulator._transfer()
+
+        return max(self.depth - self.size, 0)
+
+    @property
+    def size(self) -> int:
+        """The number of words in the FIFO."""
+        return sum(len(d) for d in self._data)
+
+    def pop(self, n: int) -> np.ndarray:
+        """Removes up to n words from the beginning of the FIFO."""
+
+        out = []
+        while n > 0 and self._data:
+            d = self._data[0]
+            out.append(d[:n])
+            if len(d) > n:
+                self._data[0] = d[n:]
+            else:
+                self._data.pop(0)
+            n -= len(out[-1])
+
+        if out:
+            return np.concatenate(out)
+        return np.empty(0, dtype=np.uint64)
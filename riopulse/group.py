@@ -0,0 +1,315 @@
+import time
+
+from collections import namedtuple
+from typing import Union
+
+from .sequence import Sequence
+from .compilation import MachineCode, compile_many, compress
+
+
+__all__ = ['PulseGenGroup', 'BoardTiming', 'BOARD_CHANNELS']
+
+
+# The number of output channels of one board.
+BOARD_CHANNELS = 8
+
+
+class BoardTiming(namedtuple('BoardTiming', ['compile_time', 'upload_time',
+                                             'upload'])):
+    """The timing of programming one board of a group.
+
+    Attributes:
+        compile_time: The compilation time (s), 0 if code was given.
+        upload_time: The duration of the program call (s), which includes
+            opening the session if it was not open.
+        upload: The UploadStats returned by the program call.
+    """
+
+
+class PulseGenGroup:
+    """Several boards that are programmed in parallel and triggered
+    together.
+
+    The sequences of the boards are compiled in a pool of processes
+    (see compile_many), which is started on the first use and kept until
+    the group is closed, and uploaded from a pool of threads, one per
+    board. The triggers are written to all boards from these threads
+    at once, after the sessions are open and the boards are prepared,
+    which minimizes the skew between the boards.
+
+    Example:
+        group = PulseGenGroup({'a': PulseGen('RIO0'), 'b': PulseGen('RIO1')})
+        group.program(wide_seq)  # Channels 0-7 to 'a', 8-15 to 'b'
+        group.run_single()
+
+    Attributes:
+        boards (dict):
+            The PulseGen objects by name.
+        channel_map (dict or None):
+            The channels of a wide sequence output by each board, a list
+            of channel numbers by the name of the board. The channel k of
+            the list is output to DIO k of the board. Every channel of
+            a wide sequence must be output by exactly one board. If None,
+            the boards output consecutive blocks of 8 channels in their
+            order, and the boards beyond the width of the sequence output
+            nothing.
+        workers (int or None):
+            The number of processes used for compilation, see compile_many.
+        last_trigger (dict):
+            The times (s) at which the trigger of the latest run_single or
+            run_continuous was written to each board, relative to
+            the earliest of them.
+    """
+
+    def __init__(self, boards: Union[dict, list],
+                 channel_map: Union[dict, None] = None,
+                 workers: Union[int, None] = None):
+        """Inits a group without opening sessions.
+
+        Args:
+            boards:
+                PulseGen objects in a dict by name, or in a list, in which
+                case their names are the indices.
+            channel_map, workers:
+                See the class attributes.
+        """
+
+        if not isinstance(boards, dict):
+            boards = dict(enumerate(boards))
+        self.boards = boards
+
+        for name, channels in (channel_map or {}).items():
+            if name not in boards:
+                raise KeyError(f'Unknown board {name!r} in channel_map.')
+            if len(channels) > BOARD_CHANNELS:
+                raise ValueError(f'Board {name!r} cannot output more than '
+                                 f'{BOARD_CHANNELS} channels.')
+
+        self.channel_map = channel_map
+        self.workers = workers
+        self.last_trigger = {}
+
+        self._pool = None
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_val, trace):
+        self.close()
+
+    def _map(self, func, names) -> dict:
+        """Calls func(name, board) for the boards in the thread pool and
+        returns the results by name."""
+
+        if self._executor is None:
+            # Imported here, as concurrent.futures and threading would
+            # be loaded on every import of the package otherwise.
+            from concurrent.futures import ThreadPoolExecutor
+            self._executor = ThreadPoolExecutor(
+                max_workers=len(self.boards),
+                thread_name_prefix='riopulse group')
+
+        futures = {name: self._executor.submit(func, name, self.boards[name])
+                   for name in names}
+        return {name: f.result() for name, f in futures.items()}
+
+    def split(self, seq: Sequence) -> dict:
+        """Splits a wide sequence into the sequences of the boards
+        according to channel_map. All the sequences have the start and
+        the stop time of the wide sequence, so that they are played
+        in sync.
+
+        Raises:
+            ValueError: If the boards do not output every channel of
+                the sequence exactly once.
+        """
+
+        nch = len(seq.channels)
+
+        channel_map = self.channel_map
+        if channel_map is None:
+            if nch > BOARD_CHANNELS*len(self.boards):
+                raise ValueError(f'The sequence has {nch} channels, more '
+                                 f'than the {len(self.boards)} boards '
+                                 f'can output.')
+            channel_map = {
+                name: list(range(i*BOARD_CHANNELS, 
+                                 min((i + 1)*BOARD_CHANNELS, nch)))
+                for i, name in enumerate(self.boards)}
+
+        out = {}
+        for name, channels in channel_map.items():
+            if any(not 0 <= ch < nch for ch in channels):
+                raise ValueError(f'The sequence has no channels '
+                                 f'{channels} of board {name!r}.')
+
+            sub = Sequence(nchannels=len(channels),
+                           defaults=[seq.channels[ch].default
+                                     for ch in channels],
+                           start_time=seq.start_time,
+                           stop_time=seq.stop_time,
+                           clock_period=seq.clock_period)
+            for c, ch in zip(sub.channels, channels):
+                c.add_state_switches(seq.channels[ch].switch_times)
+
+            out[name] = sub
+
+        mapped = sorted(ch for channels in channel_map.values()
+                        for ch in channels)
+        if mapped != list(range(nch)):
+            raise ValueError('channel_map must include every channel of '
+                             'the sequence exactly once.')
+
+        return out
+
+    def program(self, data: Union[Sequence, dict, list],
+                force: bool = False, partial: bool = False) -> dict:
+        """Compiles the sequences of the boards in parallel and uploads
+        them concurrently.
+
+        Args:
+            data:
+                A wide Sequence, which is split using channel_map, or
+                the Sequence objects or machine code of the boards in
+                a dict by name or a list in the order of the boards.
+                The boards not included are not programmed.
+            force, partial:
+                See PulseGen.program.
+
+        Returns:
+            A dictionary of BoardTiming by the name of the board.
+        """
+
+        if isinstance(data, Sequence):
+            data = self.split(data)
+        elif not isinstance(data, dict):
+            data = dict(zip(self.boards, data))
+
+        codes = {}
+        compile_times = dict.fromkeys(data, 0.)
+
+        names = [name for name, d in data.items() if isinstance(d, Sequence)]
+        pool = self._compile_pool() if len(names) > 1 else None
+        programs, timings = compile_many([data[name] for name in names],
+                                         self.workers, executor=pool)
+        for name, mcode, t in zip(names, programs, timings):
+            if self.boards[name].loops:
+                t0 = time.perf_counter()
+                mcode = compress(mcode)
+                t += time.perf_counter() - t0
+            codes[name] = mcode
+            compile_times[name] = float(t)
+
+        for name, d in data.items():
+            if isinstance(d, MachineCode):
+                codes[name] = d
+            elif name not in codes:
+                codes[name] = MachineCode(d)
+
+        def upload(name, p):
+            t0 = time.perf_counter()
+            stats = p.program(codes[name], force=force, partial=partial)
+            return time.perf_counter() - t0, stats
+
+        uploads = self._map(upload, codes)
+
+        return {name: BoardTiming(compile_times[name], *uploads[name])
+                for name in codes}
+
+    def _compile_pool(self):
+        """Returns the process pool for compilation, starting it if
+        necessary, or None if workers is 1."""
+
+        if self.workers == 1:
+            return None
+
+        if self._pool is None:
+            # The pool is kept for the next calls, as starting the worker
+            # processes can take longer than compiling the sequences.
+            from concurrent.futures import ProcessPoolExecutor
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+
+        return self._pool
+
+    def _trigger(self, prepare, trigger) -> dict:
+        """Prepares all boards, then calls trigger(session) on all of them
+        at the same moment, and records the times.
+
+        The sessions are used through PulseGen._execute, so a lost
+        session is reopened while preparing, and the boards that are not
+        persistent hold a session only for the duration of the call.
+        """
+
+        import threading
+
+        barrier = threading.Barrier(len(self.boards))
+
+        def fire(se):
+            # Releases the triggers when all boards are ready.
+            barrier.wait()
+            trigger(se)
+            return time.perf_counter()
+
+        def run(name, p):
+            try:
+                p._execute(prepare)
+
+                # Retrying could trigger the sequence twice.
+                return p._execute(fire, retry=False)
+            except BaseException:
+                # Releases the other threads with BrokenBarrierError.
+                barrier.abort()
+                raise
+
+        times = self._map(run, self.boards)
+
+        t0 = min(times.values())
+        self.last_trigger = {name: t - t0 for name, t in times.items()}
+        return self.last_trigger
+
+    def run_single(self) -> dict:
+        """Initiates the generation of a single sequence on all boards.
+
+        Returns:
+            last_trigger
+        """
+
+        def prepare(se):
+            se.registers['persistent trig'].write(False)
+            se.registers['software trig'].write(False)
+
+        def trigger(se):
+            se.registers['software trig'].write(True)
+
+        return self._trigger(prepare, trigger)
+
+    def run_continuous(self) -> dict:
+        """Initiates the periodic generation of sequences on all boards.
+
+        Returns:
+            last_trigger
+        """
+
+        def trigger(se):
+            se.registers['persistent trig'].write(True)
+
+        return self._trigger(lambda se: None, trigger)
+
+    def stop(self) -> None:
+        """Stops the generation of pulses on all boards."""
+        self._map(lambda name, p: p.stop(), self.boards)
+
+    def close(self) -> None:
+        """Closes the sessions of the boards and stops the threads and
+        the compilation processes."""
+
+        try:
+            self._map(lambda name, p: p.close(), self.boards)
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
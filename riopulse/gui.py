@@ -1,15 +1,20 @@
 import sys
 import os
 
-from PyQt5 import QtCore, uic
-from PyQt5.QtWidgets import QApplication, QWidget
-
 from .pulsegen import PulseGen
 
 
+__all__ = ['gui']
+
+
 def gui(p: PulseGen):
     """Creates a simple GUI for a pulse generator object."""
 
+    # PyQt5 is imported only when the GUI is created, so that the package 
+    # can be used on machines without Qt.
+    from PyQt5 import QtCore, uic
+    from PyQt5.QtWidgets import QApplication, QWidget
+
     # Determines if the app has been run from an ipython console.
     try:
         from IPython import get_ipython
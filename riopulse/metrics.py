@@ -0,0 +1,177 @@
+"""Timing of the stages of compiling and programming sequences.
+
+The compilation functions and PulseGen report every stage they execute
+as an Event to the listeners registered by add_listener. With no
+listeners, which is the default, the instrumentation only checks that
+the listener tuple is empty.
+
+The stages are:
+    translate, compile, recompile, compress:
+        The compilation functions of the same names.
+    digest:
+        Hashing the code to check if the board already holds it.
+    session open:
+        Opening an FPGA session.
+    prog ncmd:
+        Writing or reading the 'prog ncmd' register.
+    fifo transfer:
+        Writing the code to the command FIFO.
+    program:
+        The whole PulseGen.program call, which includes the stages above.
+
+Stages can be nested, e.g. compile in program, so the durations of all
+events do not add up to the elapsed time.
+
+Example:
+    with metrics.profile() as m:
+        p.program(seq)
+    print(m.report())
+"""
+
+import functools
+import time
+
+from collections import namedtuple
+from contextlib import contextmanager
+from typing import Union
+
+
+class Event(namedtuple('Event', ['stage', 'duration', 'commands',
+                                 'nbytes'])):
+    """A completed stage.
+
+    Attributes:
+        stage: The name of the stage.
+        duration: The duration (s).
+        commands: The number of state machine commands produced or
+            transferred, 0 if not applicable.
+        nbytes: The number of bytes of machine code produced or
+            transferred, 0 if not applicable.
+    """
+
+
+class StageTotals(namedtuple('StageTotals', ['calls', 'duration',
+                                             'commands', 'nbytes'])):
+    """The sums over the events of one stage."""
+
+
+_listeners = ()
+
+
+def add_listener(callback) -> None:
+    """Registers a callable that is called with every Event."""
+
+    global _listeners
+    _listeners = _listeners + (callback,)
+
+
+def remove_listener(callback) -> None:
+    """Unregisters a callable registered by add_listener."""
+
+    global _listeners
+    listeners = list(_listeners)
+    listeners.remove(callback)
+    _listeners = tuple(listeners)
+
+
+def enabled() -> bool:
+    """Returns True if there are listeners."""
+    return bool(_listeners)
+
+
+def start() -> Union[float, None]:
+    """Returns the start time of a stage, or None if there are no
+    listeners."""
+
+    if _listeners:
+        return time.perf_counter()
+    return None
+
+
+def stop(stage: str, t0: Union[float, None], commands: int = 0,
+         nbytes: int = 0) -> None:
+    """Reports a stage started at t0, which was returned by start."""
+
+    if t0 is None:
+        return
+
+    event = Event(stage, time.perf_counter() - t0, commands, nbytes)
+    for callback in _listeners:
+        callback(event)
+
+
+def timed(stage: str):
+    """Makes a decorator that reports every call of a function returning
+    a list of commands or MachineCode as the stage."""
+
+    def decorator(func):
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _listeners:
+                return func(*args, **kwargs)
+
+            t0 = time.perf_counter()
+            result = func(*args, **kwargs)
+            words = getattr(result, 'words', None)
+            stop(stage, t0, len(result),
+                 0 if words is None else words.nbytes)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+class Metrics:
+    """Collects events. An instance is a callback for add_listener.
+
+    Attributes:
+        events (List[Event]):
+            The events in the order of their completion.
+    """
+
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, event: Event) -> None:
+        self.events.append(event)
+
+    def clear(self) -> None:
+        self.events = []
+
+    def summary(self) -> dict:
+        """Returns a dictionary of StageTotals by the name of the stage,
+        in the order of the first completion of the stages."""
+
+        totals = {}
+        for e in self.events:
+            calls, duration, commands, nbytes = totals.get(e.stage,
+                                                           (0, 0., 0, 0))
+            totals[e.stage] = StageTotals(calls + 1, duration + e.duration,
+                                          commands + e.commands,
+                                          nbytes + e.nbytes)
+        return totals
+
+    def report(self) -> str:
+        """Returns the summary as a table."""
+
+        lines = [f'{"stage":<16}{"calls":>8}{"time (ms)":>12}'
+                 f'{"commands":>10}{"bytes":>12}']
+        for stage, t in self.summary().items():
+            lines.append(f'{stage:<16}{t.calls:>8}{t.duration*1e3:>12.3f}'
+                         f'{t.commands:>10}{t.nbytes:>12}')
+        return '\n'.join(lines)
+
+
+@contextmanager
+def profile():
+    """Collects the events reported inside a with block into a Metrics
+    object."""
+
+    m = Metrics()
+    add_listener(m)
+    try:
+        yield m
+    finally:
+        remove_listener(m)
@@ -1,85 +1,603 @@
+import hashlib
+import itertools
 import os
+import sys
+import time
+import weakref
 
+from collections import namedtuple
 from typing import Union
-from nifpga import Session
+
+import numpy as np
 
 from .sequence import Sequence
-from .compilation import compile_
+from .compilation import compile_, compile_stream, count_commands
+from .compilation import MachineCode, MAX_COMMANDS, segment, recompile
+from .compilation import segment_stream
+from .compilation import DEFAULT_CLOCK_PERIOD, _clock_period
+from . import metrics
+
+
+__all__ = ['PulseGen', 'UploadStats', 'get_bitfile']
 
 
 class PulseGen:
     """A class that communicates with the FPGA board. It programs pulse
     sequences to execute, initiates and stops pulse generation etc.
 
+    By default, an FPGA session is opened on the first call that 
+    communicates with the board and is reused by subsequent calls until 
+    close is called. If an operation on the session fails, the session is 
+    reopened and the operation is repeated once. A PulseGen object can be 
+    used as a context manager that closes the session on exit.
+
     Attributes:
         bitfile (str): 
             Full name of the bitfile. 
         resource (str): 
             Address of the FPGA target.
+        persistent (bool):
+            If False, a new session is opened and closed for every call.
+        fifo_depth (int):
+            The requested depth (in 64-bit words) of the host memory part of
+            the command FIFO. 
+        timeout_ms (int):
+            The timeout for writing to the command FIFO.
+        loops (bool):
+            If True, the bitfile implements the loop command, and sequences 
+            are compiled with repeated blocks of commands compressed 
+            into loops.
+        last_upload (UploadStats or None):
+            The statistics of the latest upload by program.
     """
 
-    def __init__(self, resource: str, bitfile: str = ''):
+    # The size of the FPGA-side part of the command FIFO in 64-bit words.
+    # The FIFO is written in batches not smaller than this.
+    fpga_fifo_depth = 128
+
+    # The maximum number of commands in one program.
+    max_commands = MAX_COMMANDS
+
+    def __init__(self, resource: str, bitfile: str = '', 
+                 persistent: bool = True, session_factory=None,
+                 fifo_depth: int = 8192, timeout_ms: int = 5000,
+                 loops: bool = False):
         """Inits a class instance without opening an FPGA session.
 
         Args:
             bitfile, resource: 
                 Arguments required by nifpga.Session
+            persistent:
+                Keep one session open between calls.
+            session_factory (callable, optional):
+                A callable with the signature of nifpga.Session, which is
+                used to open sessions instead of it.
+            fifo_depth, timeout_ms, loops:
+                See the class attributes.
         """
         
         if not bitfile:
             bitfile = get_bitfile()
         self.bitfile = bitfile
         self.resource = resource
+        self.persistent = persistent
+
+        if session_factory is None:
+            session_factory = _nifpga_session
+        self._session_factory = session_factory
+        self._session = None
+
+        self.fifo_depth = fifo_depth
+        self.timeout_ms = timeout_ms
+        self.loops = loops
+        self.last_upload = None
+
+        # The session for which the command FIFO was configured and 
+        # the actual depth of its host memory part.
+        self._fifo_config = (None, 0)
+
+        # The digest of the machine code held by the board, or None if it 
+        # is unknown, and the code itself if it is stored.
+        self._programmed = None
+        self._programmed_code = None
+
+        # The latest programmed sequence (a weak reference), its version and
+        # the code compiled from it, which is updated by recompile when 
+        # the same sequence is programmed again.
+        self._compiled = (None, 0, None)
+
+    def open(self):
+        """Returns the persistent FPGA session, opening it if necessary."""
+
+        if self._session is None:
+            t0 = metrics.start()
+            self._session = self._session_factory(self.bitfile, self.resource)
+            metrics.stop('session open', t0)
+        return self._session
+
+    def close(self) -> None:
+        """Closes the persistent FPGA session if it is open."""
+
+        se = self._session
+        self._session = None
+        self._fifo_config = (None, 0)
+
+        if se is not None:
+            se.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_val, trace):
+        self.close()
 
-    def program(self, data: Union[Sequence, list]) -> None:
+    def _execute(self, func, retry: bool = True):
+        """Calls func with an FPGA session as the argument and returns 
+        the result.
+
+        If retry is True and func fails with a communication error 
+        (see _is_session_error), the session is reopened and func is 
+        called once more. Other errors are raised immediately.
+        """
+
+        if not self.persistent:
+            t0 = metrics.start()
+            se = self._session_factory(self.bitfile, self.resource)
+            metrics.stop('session open', t0)
+            with se:
+                return func(se)
+
+        if not retry:
+            return func(self.open())
+
+        try:
+            return func(self.open())
+        except Exception as e:
+            if not _is_session_error(e):
+                raise
+
+            # The session may have been invalidated, e.g. by a lost 
+            # connection or a reset of the target. Discards the session 
+            # and retries once with a new one.
+            first_error = e
+            try:
+                self.close()
+            except Exception:
+                pass
+
+        try:
+            return func(self.open())
+        except Exception as e:
+            raise e from first_error
+
+    def program(self, data: Union[Sequence, MachineCode, list],
+                force: bool = False, stream: bool = False,
+                partial: bool = False) -> 'UploadStats':
         """Converts a Sequence object to state machine code and programs it to  
         the FPGA memory.
 
         Args:
             data: 
-                A Sequence object, or directly a list of state machine code 
-                (e.g. produced by compile). 
+                A Sequence object, or directly state machine code 
+                (e.g. produced by compile_ or a list of 64-bit integers). 
+            force:
+                If True, uploads the code even if the board already holds it.
+            stream:
+                If True, the code is generated from the Sequence chunk by 
+                chunk while it is uploaded, using compile_stream, so that 
+                the code is never stored as a whole. The sequence is 
+                translated twice, first by count_commands to count and 
+                check the commands before the upload starts, so this is 
+                slower than compiling the code. The code must still fit 
+                in the command memory; longer sequences are streamed by 
+                play. The check whether the board already holds the code 
+                is not performed, and the code is not compressed into 
+                loops in this case.
+            partial:
+                If True and the board holds code programmed earlier by this 
+                object, only the beginning of the new code up to the last 
+                word that differs from the old code is uploaded. The board 
+                keeps the rest of the memory, which is the same.
+
+                Programming the same Sequence object again recompiles only 
+                the time window modified after the previous programming, 
+                so that a small change of a long sequence is fast to 
+                compile and, if it is close to the beginning, to upload.
+
+        Returns:
+            The statistics of the upload. If the upload was skipped, the 
+            number of transferred words is zero.
+
+        Raises:
+            ValueError: 
+                If the code does not fit in the command memory. Such 
+                sequences can be played using play.
+        """
+
+        t0 = metrics.start()
+        stats = self._program(data, force, stream, partial)
+        metrics.stop('program', t0, stats.words, 8*stats.words)
+        return stats
+
+    def _program(self, data, force: bool, stream: bool, 
+                 partial: bool) -> 'UploadStats':
+        """Implements program."""
+
+        if stream:
+            if not isinstance(data, Sequence):
+                raise TypeError('Only a Sequence can be streamed.')
+
+            # Also checks the whole code before the board is put in 
+            # the programming state.
+            ncmd = count_commands(data)
+
+            def get_chunks(size):
+                words = compile_stream(data)
+                while True:
+                    chunk = np.fromiter(itertools.islice(words, size), 
+                                        dtype=np.uint64)
+                    if not len(chunk):
+                        return
+                    yield chunk
+        else:
+            if isinstance(data, Sequence):
+                mcode = self._compile(data)
+            elif isinstance(data, MachineCode):
+                mcode = data
+            else:
+                mcode = MachineCode(data)
+
+            t0 = metrics.start()
+            h = _hash()
+            h.update(mcode.words.tobytes())
+            digest = h.digest()
+            metrics.stop('digest', t0, len(mcode), mcode.words.nbytes)
+
+            if not force and digest == self._programmed:
+                self.last_upload = UploadStats(0, 0., 0)
+                return self.last_upload
+
+            ncmd = len(mcode)
+            get_chunks = mcode.chunks
+
+            if (partial and not force and self._programmed is not None 
+                    and self._programmed_code is not None):
+                ncmd = _changed_prefix(self._programmed_code, mcode)
+                if ncmd == 0:
+                    # The digest differs, so the stored code does not 
+                    # describe the memory. Uploads the whole code.
+                    ncmd = len(mcode)
+                get_chunks = mcode[:ncmd].chunks
+
+        if ncmd > self.max_commands:
+            raise ValueError(f'The program ({ncmd} commands) does not fit in '
+                             f'the command memory ({self.max_commands} '
+                             'commands). Use play to run it in segments.')
+
+        # The content of the board memory is undefined until the upload 
+        # is completed.
+        self._programmed = None
+        self._programmed_code = None
+
+        ncmd_left, uploaded = self._execute(
+            lambda se: self._upload(se, ncmd, get_chunks))
+        if ncmd_left != 0:
+            print(f'Warning ncmd = {ncmd_left}.')
+        elif stream:
+            self._programmed = uploaded
+        else:
+            self._programmed = digest
+
+            # A copy is stored because the code may be modified in place, 
+            # e.g. by SequenceTemplate.update.
+            self._programmed_code = MachineCode(mcode.words.copy())
+
+        return self.last_upload
+
+    def _compile(self, seq: Sequence) -> MachineCode:
+        """Compiles a sequence, updating the code compiled from it earlier 
+        if the sequence is the latest one programmed."""
+
+        ref, version, mcode = self._compiled
+
+        if self.loops:
+            mcode = compile_(seq, compress=True)
+        elif ref is not None and ref() is seq:
+            mcode = recompile(seq, mcode, version)
+        else:
+            mcode = compile_(seq)
+
+        self._compiled = (weakref.ref(seq), seq.version, mcode)
+        return mcode
+
+    def play(self, data: Union[Sequence, MachineCode, list],
+             dt: Union[float, None] = None) -> list:
+        """Plays a sequence that may be too long to fit in the command memory.
+
+        The code is split into segments using compilation.segment, which are 
+        programmed and triggered one after another. The segments of 
+        a Sequence are generated one at a time using segment_stream while 
+        the previous segment plays, so the code of the whole sequence is 
+        never stored. An error in the sequence found while generating 
+        a segment stops the playback after the segments played before it.
+
+        While a segment plays, the beginning of the next one is written to 
+        the command FIFO, where it waits until the board is switched to 
+        programming after the current segment is finished. The segments are 
+        therefore separated by short gaps, during which the board reads 
+        the rest of the next segment and the outputs are in the default 
+        state of the board.
+
+        Args:
+            data:
+                A Sequence object, state machine code, or a list of 
+                segments (MachineCode objects).
+            dt:
+                The clock period (s). See translate for the default.
+
+        Returns:
+            A list of the upload statistics of the segments.
+
+        Raises:
+            ValueError:
+                If there are no segments or a segment does not fit in 
+                the command memory.
+            RuntimeError:
+                If the board does not read a whole segment from the FIFO
+                within timeout_ms.
         """
 
         if isinstance(data, Sequence):
-            mcode = compile_(data)
+            dt = _clock_period(data, dt)
+            segments = segment_stream(data, self.max_commands, dt)
         else:
-            mcode = data
+            if dt is None:
+                dt = DEFAULT_CLOCK_PERIOD
+            if isinstance(data, list) and all(isinstance(d, MachineCode) 
+                                              for d in data):
+                segments = data
+            else:
+                segments = segment(data, self.max_commands)
+
+            if not segments:
+                raise ValueError('There are no segments to play.')
+
+        # Playing cannot be repeated without side effects, so it is not 
+        # retried on errors.
+        self._programmed = None
+        self._programmed_code = None
+        stats, last = self._execute(lambda se: self._play(se, segments, dt), 
+                                    retry=False)
+
+        h = _hash()
+        h.update(last.words.tobytes())
+        self._programmed = h.digest()
+
+        # A copy is stored because the segments may belong to the caller.
+        self._programmed_code = MachineCode(last.words.copy())
+
+        return stats
+
+    def _play(self, se, segments, dt: float) -> tuple:
+        """Plays the segments in a session and clears the FIFO if this 
+        fails."""
+
+        chunk_size = max(self._configure_fifo(se) // 2, self.fpga_fifo_depth)
+        fifo = se.fifos['command']
+
+        se.registers['persistent trig'].write(False)
+
+        try:
+            return self._play_segments(se, segments, dt, chunk_size)
+        except BaseException:
+            # Discards the words of the next segment that may have been 
+            # written to the FIFO in advance.
+            fifo.stop()
+            self._fifo_config = (None, 0)
+            raise
+
+    def _play_segments(self, se, segments, dt: float, 
+                       chunk_size: int) -> tuple:
+        """Programs and triggers the segments, an iterable of MachineCode, 
+        one after another.
+
+        Returns:
+            (the list of the upload statistics, the last segment)
+        """
+
+        fifo = se.fifos['command']
+
+        stats = []
+        t_end = time.perf_counter()  # The end of the current segment
+        nprefilled = 0  # The number of words written to the FIFO in advance
+
+        segments = iter(segments)
+        following = next(segments)
+
+        for i in itertools.count():
+            mcode = following
+            if len(mcode) > self.max_commands:
+                raise ValueError(f'Segment {i} ({len(mcode)} commands) does '
+                                 'not fit in the command memory.')
+
+            # Waits until the previous segment is finished.
+            time.sleep(max(t_end - time.perf_counter(), 0))
+
+            t0 = time.perf_counter()
 
-        with Session(self.bitfile, self.resource) as se:
             se.registers['prog ncmd'].write(len(mcode))
+            for chunk in MachineCode(mcode.words[nprefilled:]).chunks(
+                    chunk_size):
+                fifo.write(chunk, timeout_ms=self.timeout_ms)
+
+            ncmd = self._wait_programmed(se)
+            if ncmd != 0:
+                raise RuntimeError(f'Programming of segment {i} did not '
+                                   f'complete, ncmd = {ncmd}.')
 
-            # Sends the data to the board in batches not exceeding one half
-            # of the FPGA-side buffer (1024 byte = 128 64-bit integers).
-            while True:
-                if len(mcode) > 128:
-                    se.fifos['command'].write(mcode[:128])
-                    mcode = mcode[128:]
-                else:
-                    se.fifos['command'].write(mcode)
-                    break
+            stats.append(UploadStats(len(mcode), time.perf_counter() - t0,
+                                     chunk_size))
 
+            # Makes a rising edge on the software trigger.
+            se.registers['software trig'].write(False)
+            se.registers['software trig'].write(True)
+
+            # The segment is followed by init and trigwait commands, which
+            # take one clock cycle each.
+            t_end = time.perf_counter() + (mcode.cycles + 2)*dt
+
+            # The next segment is generated while the current one plays.
+            following = next(segments, None)
+            if following is None:
+                return stats, mcode
+
+            # Prefills the FIFO with the beginning of the next segment.
+            # The amount does not exceed one half of the host buffer, 
+            # which is empty at this point, so the write does not wait.
+            nprefilled = min(len(following), chunk_size)
+            fifo.write(following.words[:nprefilled], 
+                       timeout_ms=self.timeout_ms)
+
+    def _wait_programmed(self, se) -> int:
+        """Waits up to timeout_ms until the board has read the whole code
+        from the command FIFO, which can take a while after the last write
+        returns.
+
+        Returns:
+            The value of the 'prog ncmd' register, 0 if the programming 
+            is completed.
+        """
+
+        t_end = time.perf_counter() + self.timeout_ms/1000
+        while True:
             ncmd = se.registers['prog ncmd'].read()
-            if ncmd != 0:
-                print(f'Warning ncmd = {ncmd}.')
+            if ncmd == 0 or time.perf_counter() >= t_end:
+                return ncmd
+            time.sleep(1e-3)
+
+    def check_state(self) -> bool:
+        """Checks that the FPGA VI is running and is not waiting for 
+        the rest of an interrupted upload. If this is not the case, 
+        the digest of the programmed code is discarded, so that the next
+        program call uploads the code even if it is unchanged.
+
+        Returns:
+            True if the check passed.
+        """
+
+        def check(se):
+            state = se.fpga_vi_state
+            running = getattr(state, 'name', state) == 'Running'
+            return running and se.registers['prog ncmd'].read() == 0
+
+        ok = self._execute(check)
+        if not ok:
+            self._programmed = None
+            self._programmed_code = None
+
+        return ok
+
+    def _configure_fifo(self, se) -> int:
+        """Configures the depth of the host memory part of the command FIFO
+        if this has not been done in the session, and returns the actual 
+        depth."""
+
+        if self._fifo_config[0] is not se:
+            fifo = se.fifos['command']
+            fifo.stop()
+            depth = fifo.configure(self.fifo_depth)
+            fifo.start()
+
+            self._fifo_config = (se, depth)
+
+        return self._fifo_config[1]
+
+    def _upload(self, se, ncmd: int, get_chunks) -> tuple:
+        """Writes machine code to the command FIFO.
+
+        Args:
+            se:
+                FPGA session.
+            ncmd:
+                The number of words of the code.
+            get_chunks:
+                A callable that takes the batch size and returns an iterator 
+                over consecutive batches of the code (arrays of uint64).
+
+        Returns:
+            (the value of the 'prog ncmd' register after the transfer, 
+            the digest of the transferred code)
+        """
 
-    def init_fpga(self) -> None:
-        """Loads the bitfile to the FPGA target and runs it."""
+        # Sends the data in batches of one half of the host buffer, so that
+        # the next batch is written while the previous one is transferred 
+        # to the FPGA. The writes wait for free space in the buffer instead
+        # of failing when it is full.
+        chunk_size = max(self._configure_fifo(se) // 2, self.fpga_fifo_depth)
+        fifo = se.fifos['command']
 
-        with Session(self.bitfile, self.resource) as se:
+        t0 = time.perf_counter()
+
+        t = metrics.start()
+        se.registers['prog ncmd'].write(ncmd)
+        metrics.stop('prog ncmd', t)
+
+        t = metrics.start()
+        h = _hash()
+        try:
+            for chunk in get_chunks(chunk_size):
+                fifo.write(chunk, timeout_ms=self.timeout_ms)
+                h.update(chunk.tobytes())
+        except BaseException:
+            # Discards the words of the incomplete code.
+            fifo.stop()
+            self._fifo_config = (None, 0)
+            raise
+        metrics.stop('fifo transfer', t, ncmd, 8*ncmd)
+
+        t = metrics.start()
+        ncmd_left = se.registers['prog ncmd'].read()
+        metrics.stop('prog ncmd', t)
+
+        self.last_upload = UploadStats(ncmd, time.perf_counter() - t0, 
+                                       chunk_size)
+        return ncmd_left, h.digest()
+
+    def init_fpga(self, check: bool = False) -> None:
+        """Loads the bitfile to the FPGA target and runs it.
+
+        Args:
+            check:
+                If True, checks the state of the board afterwards using 
+                check_state and raises RuntimeError if the check fails.
+        """
+
+        def init(se):
             se.download()
             se.run()
 
+            # The command FIFO is configured again before the next upload.
+            self._fifo_config = (None, 0)
+
+        # Loading the bitfile clears the command memory.
+        self._programmed = None
+        self._programmed_code = None
+        self._execute(init)
+
+        if check and not self.check_state():
+            raise RuntimeError('The FPGA VI is not running or is in '
+                               'an unexpected state after initialization.')
+
     def run_continuous(self) -> None:
         """Initiates the periodic generation of pulse sequences."""
 
-        with Session(self.bitfile, self.resource) as se:
-            se.registers['persistent trig'].write(True)
+        self._execute(
+            lambda se: se.registers['persistent trig'].write(True))
 
     def run_single(self) -> None:
         """Initiates the generation of a single pulse sequence."""
 
-        with Session(self.bitfile, self.resource) as se:
+        def trig(se):
             # Switches off the continuous trigger.
             se.registers['persistent trig'].write(False)
 
@@ -87,18 +605,80 @@ class PulseGen:
             se.registers['software trig'].write(False)
             se.registers['software trig'].write(True)
 
+        # Retrying could trigger the sequence twice.
+        self._execute(trig, retry=False)
+
     def stop(self) -> None:
         """Stops the generation of pulses and sets the outputs of channels to 
         the default state.
         """
 
-        with Session(self.bitfile, self.resource) as se:
-            # Eventially the machine will finish the current sequence and
-            # return to the first instruction, which is always waiting for
-            # a trigger with all outputs in the default states. Switching off
-            # the persistent trigger will make the machine stay there unitil
-            # further command.
-            se.registers['persistent trig'].write(False)
+        # Eventially the machine will finish the current sequence and
+        # return to the first instruction, which is always waiting for
+        # a trigger with all outputs in the default states. Switching off
+        # the persistent trigger will make the machine stay there unitil
+        # further command.
+        self._execute(
+            lambda se: se.registers['persistent trig'].write(False))
+
+
+class UploadStats(namedtuple('UploadStats', 
+                             ['words', 'duration', 'chunk_size'])):
+    """The statistics of a transfer of machine code to the board.
+
+    Attributes:
+        words: The number of 64-bit words transferred.
+        duration: The duration of the transfer (s).
+        chunk_size: The number of words per write to the FIFO.
+    """
+
+    @property
+    def rate(self) -> float:
+        """The transfer throughput (words/s)."""
+
+        if self.words == 0:
+            return 0.
+        if self.duration > 0:
+            return self.words / self.duration
+        return float('inf')
+
+
+def _changed_prefix(old: MachineCode, new: MachineCode) -> int:
+    """Returns the length of the beginning of the new code that needs to be 
+    written over the old code to obtain the new code in the memory."""
+
+    if len(new) > len(old):
+        return len(new)
+
+    diff = np.flatnonzero(old.words[:len(new)] != new.words)
+    if diff.size:
+        return int(diff[-1]) + 1
+    return 0
+
+
+def _is_session_error(e: Exception) -> bool:
+    """Checks if an exception is an error of the communication with 
+    the board, after which the session may be invalid."""
+
+    if isinstance(e, OSError):
+        return True
+
+    # nifpga is only imported if a session has been opened with it.
+    nifpga = sys.modules.get('nifpga')
+    return nifpga is not None and isinstance(e, nifpga.ErrorStatus)
+
+
+def _nifpga_session(bitfile: str, resource: str):
+    """Opens an nifpga session. nifpga is imported when the first session 
+    is opened rather than with the package."""
+
+    from nifpga import Session
+    return Session(bitfile, resource)
+
+
+def _hash():
+    """Returns a new hash object for digests of machine code."""
+    return hashlib.blake2b(digest_size=20)
 
 
 def get_bitfile() -> str:
@@ -1,5 +1,22 @@
+import itertools
+
+from bisect import bisect_left, bisect_right
+from numbers import Integral
 from typing import Union
-import matplotlib.pyplot as plt
+
+import numpy as np
+
+
+__all__ = ['Sequence', 'DigitalChannel']
+
+
+# Stamps that order the modifications of all channels and sequences.
+_stamps = itertools.count(1)
+
+# The maximum number of modifications remembered by a channel or 
+# a sequence. Changes older than that are reported as changes of 
+# the entire sequence.
+MAX_CHANGE_LOG = 1000
 
 
 class Sequence:
@@ -16,6 +33,16 @@ class Sequence:
     the start and the stop times are automatically updated to accommodate all
     pulses.
 
+    Every modification is recorded with the time window that it affects, 
+    so that the code compiled from an earlier version of the sequence can be 
+    updated only in the changed window (see version and changed_window).
+
+    If the sequence is created with a clock period, all times (the arguments
+    of the methods, the start and stop times, and the switch times of 
+    the channels) are integer numbers of clock cycles instead of seconds. 
+    In this mode, the compilation does not need to round the times, and 
+    the cancellation of coinciding state switches is exact.
+
     Attributes:
         channels:
             A list of DigitalChannel objects containing the channel state
@@ -24,13 +51,16 @@ class Sequence:
             See the __init__ args.
         stop_time:
             See the __init__ args.
+        clock_period:
+            See the __init__ args.
     """
 
     def __init__(self,
                  nchannels: int = 8,
                  defaults: list = None,
                  start_time: float = 0,
-                 stop_time: Union[float, None] = None):
+                 stop_time: Union[float, None] = None,
+                 clock_period: Union[float, None] = None):
         """Creates an empty pulse sequence.
 
         Args:
@@ -48,8 +78,14 @@ class Sequence:
                 The end time of the pulse sequence (in seconds). When new
                 pulses are added, this time is automatically updated to
                 accomodate them.
+            clock_period:
+                The clock period (s). If specified, the times are measured 
+                in integer numbers of clock cycles.
         """
 
+        self.clock_period = clock_period
+
+        self._check_time(start_time)
         if stop_time is None:
             # The sequence duration is zero on creation. Usually, it means that
             # the sequence will be extended by adding pulses or by specifying
@@ -57,6 +93,7 @@ class Sequence:
             stop_time = start_time
         else:
             # Checks the consistency of the start and the stop time.
+            self._check_time(stop_time)
             if not stop_time >= start_time:
                 raise ValueError('stop_time must be >= start_time')
 
@@ -70,7 +107,58 @@ class Sequence:
         else:
             defaults = [False]*nchannels
 
-        self.channels = [DigitalChannel(defaults[i]) for i in range(nchannels)]
+        self.channels = [DigitalChannel(defaults[i], self._time_type)
+                         for i in range(nchannels)]
+
+        # The changes of the start and the stop times.
+        self._changes = _ChangeLog()
+
+    @property
+    def _time_type(self) -> type:
+        """The type of the times."""
+
+        if self.clock_period is None:
+            return float
+        return np.int64
+
+    def _check_time(self, t) -> None:
+        """Checks that t is a valid time value in the integer mode."""
+
+        if self.clock_period is not None and not isinstance(t, Integral):
+            raise TypeError('Times must be integer numbers of clock cycles '
+                            'in a sequence with a clock period.')
+
+    def _as_times(self, t) -> np.ndarray:
+        """Converts t to a one-dimensional array of times."""
+
+        t = np.asarray(t)
+
+        if self.clock_period is not None and t.dtype.kind not in 'iu':
+            raise TypeError('Times must be integer numbers of clock cycles '
+                            'in a sequence with a clock period.')
+
+        return np.atleast_1d(t.astype(self._time_type))
+
+    def ticks(self, t):
+        """Converts time (s) to the nearest integer number of clock cycles.
+
+        Args:
+            t (float or array-like):
+                Time in seconds.
+
+        Returns:
+            An integer or an array of integers.
+        """
+
+        if self.clock_period is None:
+            raise ValueError('The sequence has no clock period.')
+
+        n = np.rint(np.asarray(t, dtype=float)/self.clock_period)
+        n = n.astype(np.int64)
+
+        if n.ndim == 0:
+            return int(n)
+        return n
 
     def add_pulse(self, ch: int, t0: float, duration: float) -> None:
         """Adds a pulse to the specified channel. A pulse consists of switching
@@ -86,6 +174,9 @@ class Sequence:
                 The duration of the pulse (s) - the interval between the front
                 and the back edges.
         """
+        self._check_time(t0)
+        self._check_time(duration)
+
         if not duration > 0:
             raise ValueError('Duration must be greater than zero.')
 
@@ -110,6 +201,9 @@ class Sequence:
                 The duration (s) of the pulse - the interval between the front
                 and the back edges.
         """
+        self._check_time(delay)
+        self._check_time(duration)
+
         if not delay >= 0:
             raise ValueError('Delay must be greater or equal to zero.')
         if not duration > 0:
@@ -129,6 +223,75 @@ class Sequence:
         c.add_state_switch(t0)
         c.add_state_switch(t1)
 
+    def add_pulses(self, ch: int, t0, duration) -> None:
+        """Adds multiple pulses to the specified channel in one step.
+        The result is the same as calling add_pulse for every pair of 
+        elements of t0 and duration, but the state switches are merged 
+        into the channel at once.
+
+        Args:
+            ch:
+                Channel number.
+            t0 (array-like):
+                The times of the front edges of the pulses (s).
+            duration (array-like or float):
+                The durations of the pulses (s). A single value is applied to
+                all pulses.
+        """
+        t0, duration = np.broadcast_arrays(self._as_times(t0),
+                                           self._as_times(duration))
+        t0 = t0.ravel()
+        duration = duration.ravel()
+
+        if not np.all(duration > 0):
+            raise ValueError('Duration must be greater than zero.')
+
+        t1 = t0 + duration  # The back edges of the pulses
+
+        self.channels[ch].add_state_switches(np.concatenate([t0, t1]))
+
+    def append_pulses(self, ch: int, delay, duration) -> None:
+        """Appends multiple pulses to the specified channel one after 
+        another. The result is the same as calling append_pulse for every pair
+        of elements of delay and duration.
+
+        Args:
+            ch:
+                Channel number.
+            delay (array-like or float):
+                The delays (s) between the back edge of the preceding pulse
+                (or the latest existing state transition in the channel for 
+                the first pulse) and the front edges of the new pulses.
+            duration (array-like or float):
+                The durations (s) of the pulses.
+        """
+        delay, duration = np.broadcast_arrays(self._as_times(delay),
+                                              self._as_times(duration))
+        delay = delay.ravel()
+        duration = duration.ravel()
+
+        if not np.all(delay >= 0):
+            raise ValueError('Delay must be greater or equal to zero.')
+        if not np.all(duration > 0):
+            raise ValueError('Duration must be greater than zero.')
+
+        c = self.channels[ch]  # A short-hand notation
+
+        if c.switch_times:
+            t_start = c.switch_times[-1]
+        else:
+            t_start = self.start_time
+
+        # The edge times are accumulated in the same order as by repeated
+        # append_pulse calls: t0 = t1_prev + delay, t1 = t0 + duration, 
+        # which gives identical floating point values.
+        increments = np.empty(2*len(delay) + 1, dtype=self._time_type)
+        increments[0] = t_start
+        increments[1::2] = delay
+        increments[2::2] = duration
+
+        c.add_state_switches(np.cumsum(increments)[1:])
+
     @property
     def start_time(self):
 
@@ -143,6 +306,8 @@ class Sequence:
 
     @start_time.setter
     def start_time(self, value):
+        self._check_time(value)
+
         for i, c in enumerate(self.channels):
             if c.switch_times and value > c.switch_times[0]:
                 raise ValueError('The start time cannot be greater than '
@@ -153,6 +318,10 @@ class Sequence:
             raise ValueError('The start time cannot be greater than '
                              'the stop time.')
 
+        if value != self.start_time:
+            # Shifts all clock cycles.
+            self._changes.record(-np.inf, np.inf)
+
         self._interval[0] = value
 
     @property
@@ -169,6 +338,8 @@ class Sequence:
 
     @stop_time.setter
     def stop_time(self, value):
+        self._check_time(value)
+
         for i, c in enumerate(self.channels):
             if c.switch_times and value < c.switch_times[-1]:
                 raise ValueError('The stop time cannot be smaller than '
@@ -179,19 +350,65 @@ class Sequence:
             raise ValueError('The stop time cannot be smaller than '
                              'the start time.')
 
+        if value != self.stop_time:
+            self._changes.record(min(value, self.stop_time), np.inf)
+
         self._interval[1] = value
 
-    def plot(self, fig=None) -> None:
+    @property
+    def version(self) -> int:
+        """A number that increases with every modification of the sequence."""
+        return max([self._changes.stamp] 
+                   + [c._changes.stamp for c in self.channels])
+
+    def changed_window(self, version: int) -> Union[tuple, None]:
+        """Returns the time interval (t0, t1) that contains all modifications 
+        of the sequence made after the version, or None if the sequence was 
+        not modified. 
+        
+        t1 is infinite if the modifications change the states of channels 
+        until the end of the sequence (e.g. if a single state switch was 
+        added), and the interval is (-inf, inf) if the modifications affect 
+        the entire sequence (e.g. a change of the start time or of 
+        the default state of a channel).
+        """
+
+        windows = [self._changes.since(version)]
+        for c in self.channels:
+            w = c._changes.since(version)
+            if w is not None and w[2]:
+                # An odd number of switches changes the states of 
+                # the channel after the window.
+                w = (w[0], np.inf, True)
+            windows.append(w)
+
+        windows = [w for w in windows if w is not None]
+        if not windows:
+            return None
+
+        return (min(w[0] for w in windows), max(w[1] for w in windows))
+
+    def plot(self, fig=None, decimate: bool = False) -> None:
         """Plots the channel states versus time using matplotlib.
 
         Args:
             fig (matplotlib Figure, optional)
+            decimate:
+                If True, the states are reduced to the minimum and 
+                the maximum in every pixel of the axes, and recomputed when 
+                the axes are zoomed or panned. The intervals with 
+                switches shorter than a pixel are shaded. This keeps 
+                the plots of long sequences fast.
         """
 
         if not self.channels:
             # There needs to be at least one channel to plot.
             return
 
+        # matplotlib is imported on the first plot to keep the import of 
+        # the package fast.
+        import matplotlib.pyplot as plt
+
         channel_no = len(self.channels)
 
         if not fig:
@@ -205,9 +422,16 @@ class Sequence:
 
         fig.suptitle('Channel states')
 
+        # The times are plotted in seconds.
+        scale = self.clock_period or 1
+
+        color = (6/255, 85/255, 170/255)
+
         for i in range(channel_no):
-            axs[i, 0].plot(*self.channels[i].curve(interval=tlim),
-                           color=(6/255, 85/255, 170/255), linewidth=1)
+            if not decimate:
+                times, states = self.channels[i].curve(interval=tlim)
+                axs[i, 0].plot(np.multiply(times, scale), states,
+                               color=color, linewidth=1)
 
             # Configures the axes appearance.
             axs[i, 0].set_ylabel(f'Ch {i}')
@@ -216,19 +440,244 @@ class Sequence:
             axs[i, 0].tick_params(axis='both', direction='in', which='both',
                                   bottom=True, top=False, left=True, right=True)
 
-        axs[-1, 0].set_xlim(tlim)
+        axs[-1, 0].set_xlim([t*scale for t in tlim])
         axs[-1, 0].set_xlabel('Time (s)')
         axs[-1, 0].set_yticks([0, 1])
         axs[-1, 0].set_ylim(-0.1, 1.1)
 
         fig.tight_layout()
+
+        if decimate:
+            # The envelopes are computed for the final size of the axes.
+            for i in range(channel_no):
+                _plot_envelope(axs[i, 0], self.channels[i], scale, color)
+
         plt.show()
 
+    def sample(self, times, packed: bool = False) -> np.ndarray:
+        """Returns the states of all channels at multiple times. The state 
+        at the time of a transition is the value before the transition.
+
+        Args:
+            times (array-like):
+                A one-dimensional array of times (s).
+            packed:
+                If True, the states at each time are packed into bits of 
+                uint8 bytes, channel i in bit (i % 8) of byte (i // 8).
+
+        Returns:
+            A boolean array of the shape (len(times), nchannels), or 
+            a uint8 array of the shape (len(times), ceil(nchannels/8)) if
+            packed is True.
+        """
+
+        times = np.asarray(times).ravel()
+
+        states = np.empty((len(times), len(self.channels)), dtype=bool)
+        for i, c in enumerate(self.channels):
+            states[:, i] = c.states_at(times)
+
+        if packed:
+            return np.packbits(states, axis=1, bitorder='little')
+        return states
+
+    def shift(self, dt) -> 'Sequence':
+        """Returns a copy of the sequence delayed by dt (s), including its 
+        start and stop times."""
+
+        self._check_time(dt)
+
+        return self._derived(
+            [c.default for c in self.channels],
+            [self._switch_array(c) + dt for c in self.channels],
+            self.start_time + dt, self.stop_time + dt)
+
+    def concat(self, *others: 'Sequence') -> 'Sequence':
+        """Returns a sequence in which the others follow this one. Can be 
+        called as Sequence.concat(seq1, seq2, ...).
+
+        Every block is shifted so that its start time coincides with 
+        the stop time of the previous block, and reproduces its channel 
+        states over its interval [start_time, stop_time]. The channels
+        are switched at the boundaries where the state at the end of 
+        the previous block differs from the default state of the next 
+        one. Such a switch cancels a switch of a block at the same time.
+        The defaults of the result are those of the first block.
+
+        The blocks must have the same number of channels and clock period.
+        """
+
+        seqs = (self,) + others
+        self._check_compatible(others)
+
+        arrays = {}
+        for seq in seqs:
+            if id(seq) not in arrays:
+                arrays[id(seq)] = [seq._switch_array(c) 
+                                   for c in seq.channels]
+
+        # The boundaries of the blocks in the result.
+        bounds = [self.start_time]
+        for seq in seqs:
+            bounds.append(bounds[-1] + (seq.stop_time - seq.start_time))
+
+        times = []
+        for i, c in enumerate(self.channels):
+            parts = []
+            state = c.default
+            for k, seq in enumerate(seqs):
+                default = seq.channels[i].default
+                if state != default:
+                    parts.append(np.array([bounds[k]], dtype=self._time_type))
+
+                t = arrays[id(seq)][i]
+                parts.append(seq._moved(t, bounds[k], bounds[k+1]))
+                state = default ^ (len(t) % 2 == 1)
+
+            times.append(_odd_times(_sorted(np.concatenate(parts))))
+
+        return self._derived([c.default for c in self.channels], times,
+                             bounds[0], bounds[-1])
+
+    def repeat(self, n: int) -> 'Sequence':
+        """Returns the sequence concatenated with itself n times 
+        (see concat)."""
+
+        if n < 1:
+            raise ValueError('The number of repetitions must be at least 1.')
+
+        # The boundaries are accumulated in the same way as by concat.
+        duration = self.stop_time - self.start_time
+        bounds = np.full(n + 1, duration, dtype=self._time_type)
+        bounds[0] = self.start_time
+        bounds = np.cumsum(bounds)
+
+        times = []
+        for c in self.channels:
+            t = self._switch_array(c)
+
+            block = np.empty((n, len(t) + 1), dtype=self._time_type)
+            block[:, 0] = bounds[:-1]
+            block[:, 1:] = self._moved(t, bounds[:-1], bounds[1:])
+
+            # The blocks after the first start with a switch if a block 
+            # ends in the state other than the default.
+            if len(t) % 2 == 1:
+                t = block.ravel()[1:]
+            else:
+                t = block[:, 1:].ravel()
+
+            times.append(_odd_times(_sorted(t)))
+
+        return self._derived([c.default for c in self.channels], times,
+                             bounds[0], bounds[-1])
+
+    def merge(self, other: 'Sequence') -> 'Sequence':
+        """Returns the overlay of two sequences. The switches of the channels
+        are combined in the same way as by adding them to one sequence, 
+        so that overlapping pulses subtract, and the default states are 
+        combined by exclusive or. The interval of the result covers 
+        the intervals of both sequences.
+
+        The sequences must have the same number of channels and clock 
+        period.
+        """
+
+        self._check_compatible([other])
+
+        times = [_odd_times(np.sort(np.concatenate([
+                    self._switch_array(c1), self._switch_array(c2)]), 
+                    kind='stable'))
+                 for c1, c2 in zip(self.channels, other.channels)]
+
+        return self._derived(
+            [c1.default ^ c2.default 
+             for c1, c2 in zip(self.channels, other.channels)],
+            times, min(self.start_time, other.start_time), 
+            max(self.stop_time, other.stop_time))
+
+    def _moved(self, times: np.ndarray, start, stop) -> np.ndarray:
+        """Shifts switch times of the sequence to the interval starting at 
+        start, or to several intervals if start and stop are arrays.
+        The switches at the start and the stop time are placed 
+        exactly at start and stop, so that they coincide with the switches
+        at the same boundary in the adjacent blocks despite rounding."""
+
+        out = np.add.outer(np.subtract(start, self.start_time), times)
+        if len(times):
+            if times[0] == self.start_time:
+                out[..., 0] = start
+            if times[-1] == self.stop_time:
+                out[..., -1] = stop
+        return out
+
+    def _switch_array(self, c: 'DigitalChannel') -> np.ndarray:
+        """Returns the switch times of a channel as an array."""
+        return np.asarray(c.switch_times, dtype=self._time_type)
+
+    def _check_compatible(self, others) -> None:
+        """Checks that sequences can be composed with this one."""
+
+        for seq in others:
+            if len(seq.channels) != len(self.channels):
+                raise ValueError('The sequences must have the same number '
+                                 'of channels.')
+            if seq.clock_period != self.clock_period:
+                raise ValueError('The sequences must have the same clock '
+                                 'period.')
+
+    def _derived(self, defaults: list, times: list, start_time, 
+                 stop_time) -> 'Sequence':
+        """Makes a sequence with the clock period of this one from 
+        the sorted arrays of the switch times of its channels."""
+
+        seq = Sequence(nchannels=len(defaults), defaults=defaults,
+                       start_time=_scalar(start_time), 
+                       stop_time=_scalar(stop_time),
+                       clock_period=self.clock_period)
+        for c, t in zip(seq.channels, times):
+            c.switch_times = t.tolist()
+
+        return seq
+
+    def save(self, path: str, code: bool = True, 
+             dt: Union[float, None] = None) -> None:
+        """Writes the sequence to a binary file (see the storage module).
+
+        Args:
+            path:
+                The name of the file.
+            code:
+                If True, the machine code compiled from the sequence is 
+                stored along with it, so that it can be replayed without 
+                compilation.
+            dt:
+                The clock period (s) for the compilation.
+        """
+
+        from . import storage
+        from .compilation import compile_
+
+        storage.save(path, self, compile_(self, dt) if code else None)
+
+    @classmethod
+    def load(cls, path: str) -> 'Sequence':
+        """Reads a sequence from a file written by save."""
+
+        from . import storage
+
+        data = storage.load(path)
+        if data.sequence is None:
+            raise ValueError(f'{path} does not contain a sequence.')
+
+        return storage.unpack(data.sequence)
+
     def __eq__(self, other):
         """Two sequences are equal if their start and stop times are 
         the same and the states of their channels are the same."""
 
         b = (type(self) == type(other)
+             and self.clock_period == other.clock_period
              and self.start_time == other.start_time
              and self.stop_time == other.stop_time
              and self.channels == other.channels)
@@ -246,33 +695,74 @@ class DigitalChannel:
         switch_times (List[float]):
             An ordered list containing times (in seconds) at which the channel
             state is flipped. This list should only be modified by using
-            add_state_switch method.
+            add_state_switch method. The list is kept sorted, so that
+            the position of a time in it is found by binary search.
+        time_type (type):
+            The type of the times, float for seconds or numpy.int64 for
+            integer numbers of clock cycles.
     """
 
-    def __init__(self, default=False):
+    def __init__(self, default=False, time_type: type = float):
         """Inits a channel instance with a given default state."""
 
-        self.default = bool(default)
+        self._changes = _ChangeLog()
+        self._default = bool(default)
         self.switch_times = []
+        self.time_type = time_type
+
+    @property
+    def default(self) -> bool:
+        return self._default
+
+    @default.setter
+    def default(self, value):
+        if bool(value) != self._default:
+            self._changes.record(-np.inf, np.inf)
+        self._default = bool(value)
 
     def add_state_switch(self, t: float) -> None:
         """Adds a state switch at the time t (s)."""
 
-        if t in self.switch_times:
+        self._changes.record(t, t, odd=True)
+
+        ind = bisect_left(self.switch_times, t)
+
+        if ind < len(self.switch_times) and self.switch_times[ind] == t:
 
             # Two state switches at the same time cancel each other.
-            self.switch_times.remove(t)
+            del self.switch_times[ind]
         else:
 
             # Adds a new state switch in a way that keeps the list time-ordered.
-            ind = len([t1 for t1 in self.switch_times if t1 < t])
             self.switch_times.insert(ind, t)
 
+    def add_state_switches(self, times) -> None:
+        """Adds multiple state switches at the times (s) given by an array. 
+        The result is the same as adding the switches one by one using 
+        add_state_switch."""
+
+        new_times = np.asarray(times, dtype=self.time_type).ravel()
+
+        if new_times.size == 0:
+            return
+
+        self._changes.record(new_times.min(), new_times.max(), 
+                             odd=len(new_times) % 2 == 1)
+
+        times = np.concatenate([
+            np.asarray(self.switch_times, dtype=self.time_type), new_times])
+
+        # An even number of switches at the same time cancel each other, so
+        # only the times that occur an odd number of times are retained.
+        times, counts = np.unique(times, return_counts=True)
+        self.switch_times = times[counts % 2 == 1].tolist()
+
     def state(self, t: float) -> bool:
         """Returns the state at the time t (s). If there is a state transition
         at t, returns the value before the transition."""
 
-        ind = len([t1 for t1 in self.switch_times if t1 < t])
+        # The number of state switches that happened before t.
+        ind = bisect_left(self.switch_times, t)
         if ind % 2 == 0:
             st = self.default
         else:
@@ -292,6 +782,52 @@ class DigitalChannel:
 
         return new_states
 
+    def states_at(self, times) -> np.ndarray:
+        """Returns the states at multiple times. As in state, the state at 
+        the time of a transition is the value before the transition.
+
+        Args:
+            times (array-like):
+                The times (s).
+
+        Returns:
+            A boolean array of the shape of times.
+        """
+
+        swt = np.asarray(self.switch_times, dtype=self.time_type)
+
+        # The number of state switches that happened before each time.
+        n = np.searchsorted(swt, np.asarray(times), side='left')
+        return (n % 2 == 1) ^ self.default
+
+    def envelope(self, interval, nbins: int) -> tuple:
+        """Returns the minimum and the maximum states in equal bins of 
+        a time interval.
+
+        Args:
+            interval: 
+                A time interval [t0, t1].
+            nbins:
+                The number of bins.
+
+        Returns:
+            (edges, low, high), where edges is an array of nbins+1 bin 
+            edges, and low and high are boolean arrays of the minimum and 
+            the maximum states in the bins.
+        """
+
+        t0, t1 = min(interval), max(interval)
+        edges = np.linspace(t0, t1, nbins + 1)
+
+        swt = np.asarray(self.switch_times, dtype=self.time_type)
+        idx = np.searchsorted(swt, edges, side='left')
+
+        # The state is constant in the bins without switches.
+        st = (idx[:-1] % 2 == 1) ^ self.default
+        busy = np.diff(idx) > 0
+
+        return edges, st & ~busy, st | busy
+
     def curve(self, interval=None) -> tuple:
         """Returns the channel state as a function of time over the specified
         time interval.
@@ -306,49 +842,49 @@ class DigitalChannel:
         if interval:
             t0 = min(interval)
             t1 = max(interval)
-            swt = [t for t in self.switch_times if (t >= t0) and (t <= t1)]
+            lo = bisect_left(self.switch_times, t0)
+            hi = bisect_right(self.switch_times, t1)
         else:
             # Sets the interval to cover all switch times.
             if self.switch_times:
                 t0 = self.switch_times[0]
                 t1 = self.switch_times[-1]
-                swt = self.switch_times
+                lo, hi = 0, len(self.switch_times)
             else:
                 return ([], [])
 
-        times = []
-        states = []
-
-        if t0 not in swt:
-            # Appends the state in the beginning of the interval.
-            times.append(t0)
-            states.append(self.state(t0))
-
-        for t in swt:
-            st = self.state(t)
+        swt = np.asarray(self.switch_times[lo:hi], dtype=self.time_type)
+        st = self.states_at(swt)
 
-            # Appends the state before the switch.
-            times.append(t)
-            states.append(st)
+        # Every switch adds the states before and after it.
+        times = np.repeat(swt, 2)
+        states = np.repeat(st, 2)
+        states[1::2] = ~st
 
-            # Appends the state after the switch.
-            times.append(t)
-            states.append(not st)
+        if not swt.size or swt[0] != t0:
+            # Adds the state in the beginning of the interval.
+            times = np.concatenate([[t0], times])
+            states = np.concatenate([self.states_at([t0]), states])
 
-        if t1 not in swt:
-            # Appends the state in the end of the interval.
-            times.append(t1)
-            states.append(self.state(t1))
+        if not swt.size or swt[-1] != t1:
+            # Adds the state in the end of the interval.
+            times = np.concatenate([times, [t1]])
+            states = np.concatenate([states, self.states_at([t1])])
 
-        return (times, states)
+        return (times.astype(self.time_type).tolist(), states.tolist())
 
     def __repr__(self):
         """Displays the list of state transitions in a readable form."""
 
-        switches = []
-        for t in self.switch_times:
-            st = self.state(t)
-            switches.append('t=%gs\t%i->%i' % (t, st, not st))
+        if self.time_type is float:
+            fmt = 't=%gs\t%i->%i'
+        else:
+            fmt = 't=%i\t%i->%i'  # Clock cycles
+
+        st = self.states_at(np.asarray(self.switch_times, 
+                                       dtype=self.time_type))
+        switches = [fmt % (t, s, not s) 
+                    for t, s in zip(self.switch_times, st.tolist())]
 
         string_form = ('%s:\n%s' %
                        (type(self).__name__, '\n'.join(switches)))
@@ -362,3 +898,93 @@ class DigitalChannel:
              and self.switch_times == other.switch_times)
 
         return b
+
+
+def _sorted(times: np.ndarray) -> np.ndarray:
+    """Sorts an array that is expected to be sorted already, except for 
+    rounding at the boundaries of blocks."""
+
+    if np.any(times[1:] < times[:-1]):
+        return np.sort(times, kind='stable')
+    return times
+
+
+def _odd_times(times: np.ndarray) -> np.ndarray:
+    """Returns the times that occur an odd number of times in a sorted 
+    array, which remain after coinciding switches cancel in pairs."""
+
+    if times.size == 0:
+        return times
+
+    starts = np.flatnonzero(np.concatenate([[True], times[1:] != times[:-1]]))
+    counts = np.diff(np.append(starts, times.size))
+    return times[starts[counts % 2 == 1]]
+
+
+def _scalar(t):
+    """Converts a numpy scalar time to a Python number."""
+    return t.item() if isinstance(t, np.generic) else t
+
+
+def _plot_envelope(ax, channel: DigitalChannel, scale: float, color) -> None:
+    """Plots the envelope of the states of a channel at the resolution of 
+    the axes, updating it when the x limits change."""
+
+    lines = [ax.plot([], [], color=color, linewidth=1, 
+                     drawstyle='steps-post')[0] for _ in range(2)]
+    fill = []
+
+    def update(ax):
+        x0, x1 = ax.get_xlim()
+        nbins = max(int(ax.get_window_extent().width), 1)
+
+        edges, low, high = channel.envelope([x0/scale, x1/scale], nbins)
+        x = edges*scale
+        low = np.append(low, low[-1]).astype(float)
+        high = np.append(high, high[-1]).astype(float)
+
+        lines[0].set_data(x, low)
+        lines[1].set_data(x, high)
+
+        for f in fill:
+            f.remove()
+        fill[:] = [ax.fill_between(x, low, high, step='post', color=color, 
+                                   alpha=0.5, linewidth=0)]
+
+    ax.callbacks.connect('xlim_changed', update)
+    update(ax)
+
+
+class _ChangeLog:
+    """Records the time windows of modifications together with increasing 
+    stamps."""
+
+    def __init__(self):
+        self.stamp = 0  # The stamp of the latest modification
+        self._entries = []  # (stamp, t0, t1, odd)
+        self._dropped = 0  # The stamp of the latest forgotten modification
+
+    def record(self, t0, t1, odd: bool = False) -> None:
+        self.stamp = next(_stamps)
+        self._entries.append((self.stamp, t0, t1, odd))
+
+        if len(self._entries) > MAX_CHANGE_LOG:
+            n = len(self._entries) // 2
+            self._dropped = self._entries[n-1][0]
+            del self._entries[:n]
+
+    def since(self, stamp: int) -> Union[tuple, None]:
+        """Returns (t0, t1, odd), the window containing the modifications 
+        made after the stamp and whether the total number of added and 
+        removed switches is odd, or None if there were no modifications."""
+
+        if stamp >= self.stamp:
+            return None
+
+        if stamp < self._dropped:
+            return (-np.inf, np.inf, True)
+
+        entries = [e for e in self._entries if e[0] > stamp]
+        odd = sum(e[3] for e in entries) % 2 == 1
+
+        return (min(e[1] for e in entries), max(e[2] for e in entries), odd)
@@ -0,0 +1,166 @@
+import struct
+
+from collections import namedtuple
+from typing import Union
+
+import numpy as np
+
+from .sequence import Sequence
+from .compilation import MachineCode, PackedSequence, pack
+
+
+# The file layout. All numbers are little-endian, and every array starts
+# at a multiple of 8 bytes from the beginning of the file.
+#
+# header (80 bytes):
+#     magic (8s), format version (I), flags (I), number of channels (I),
+#     integer times (I), start time (d), stop time (d), clock period
+#     (d, NaN if None), number of switches (q), number of code words (q),
+#     start time (q), stop time (q)
+# defaults (uint8 x number of channels, padded to 8 bytes)
+# switch counts (int64 x number of channels)
+# switch times (float64 or int64 x number of switches)
+# machine code (uint64 x number of code words)
+
+MAGIC = b'RIOPULSE'
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct('<8sIIIIdddqqqq')
+
+_HAS_SEQUENCE = 0b1
+_HAS_CODE = 0b10
+
+
+class StoredData(namedtuple('StoredData', ['sequence', 'code'])):
+    """The content of a file.
+
+    Attributes:
+        sequence:
+            A PackedSequence, whose arrays are memory-mapped, or None.
+        code:
+            A MachineCode object with memory-mapped words, or None.
+    """
+
+
+def save(path: str, seq: Union[Sequence, PackedSequence, None] = None,
+         code: Union[MachineCode, None] = None) -> None:
+    """Writes a sequence and/or machine code to a binary file.
+
+    Args:
+        path:
+            The name of the file.
+        seq:
+            A sequence, or None to save only the code.
+        code:
+            Machine code, or None to save only the sequence.
+    """
+
+    if seq is None and code is None:
+        raise ValueError('Nothing to save.')
+
+    flags = 0
+    if seq is not None:
+        flags |= _HAS_SEQUENCE
+        if isinstance(seq, Sequence):
+            seq = pack(seq)
+    else:
+        seq = PackedSequence(0, 0, None, np.empty(0, bool),
+                             np.empty(0, np.int64), np.empty(0, np.float64))
+
+    if code is not None:
+        flags |= _HAS_CODE
+        words = np.asarray(code, dtype=np.uint64)
+    else:
+        words = np.empty(0, dtype=np.uint64)
+
+    is_int = seq.times.dtype.kind in 'iu'
+    clock_period = np.nan if seq.clock_period is None else seq.clock_period
+
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, flags, len(seq.counts),
+                          is_int, float(seq.start_time), float(seq.stop_time),
+                          clock_period, len(seq.times), len(words),
+                          int(seq.start_time) if is_int else 0,
+                          int(seq.stop_time) if is_int else 0)
+
+    time_dtype = '<i8' if is_int else '<f8'
+
+    with open(path, 'wb') as f:
+        f.write(header)
+        f.write(_padded(np.asarray(seq.defaults, dtype=np.uint8).tobytes()))
+        f.write(np.asarray(seq.counts, dtype='<i8').tobytes())
+        f.write(np.asarray(seq.times, dtype=time_dtype).tobytes())
+        f.write(words.astype('<u8').tobytes())
+
+
+def load(path: str) -> StoredData:
+    """Memory-maps a file written by save. The arrays are read-only views
+    of the file, and are read from the disk when they are accessed."""
+
+    mm = np.memmap(path, dtype=np.uint8, mode='r')
+
+    if len(mm) < _HEADER.size:
+        raise ValueError(f'{path} is not a riopulse file.')
+
+    (magic, version, flags, nchannels, is_int, start, stop, clock_period,
+     nswitches, nwords, start_int, stop_int) = _HEADER.unpack(
+         bytes(mm[:_HEADER.size]))
+
+    if magic != MAGIC:
+        raise ValueError(f'{path} is not a riopulse file.')
+    if version != FORMAT_VERSION:
+        raise ValueError(f'Unsupported format version {version}.')
+
+    size = (_HEADER.size + nchannels + (-nchannels % 8) + 8*nchannels 
+            + 8*nswitches + 8*nwords)
+    if len(mm) != size:
+        raise ValueError(f'The size of {path} does not match its header.')
+
+    offset = _HEADER.size
+
+    def take(dtype, n):
+        nonlocal offset
+        nbytes = np.dtype(dtype).itemsize * n
+        a = mm[offset: offset + nbytes].view(dtype)
+        offset += nbytes
+        return a
+
+    defaults = take(np.uint8, nchannels).view(bool)
+    offset += -nchannels % 8
+    counts = take('<i8', nchannels)
+    times = take('<i8' if is_int else '<f8', nswitches)
+    words = take('<u8', nwords)
+
+    sequence = None
+    if flags & _HAS_SEQUENCE:
+        if is_int:
+            start, stop = start_int, stop_int
+        sequence = PackedSequence(
+            start, stop, None if np.isnan(clock_period) else clock_period,
+            defaults, counts, times)
+
+    code = None
+    if flags & _HAS_CODE:
+        code = MachineCode(words)
+
+    return StoredData(sequence, code)
+
+
+def unpack(packed: PackedSequence) -> Sequence:
+    """Makes a Sequence from its array representation."""
+
+    seq = Sequence(nchannels=len(packed.counts),
+                   defaults=[bool(d) for d in packed.defaults],
+                   start_time=packed.start_time,
+                   stop_time=packed.stop_time,
+                   clock_period=packed.clock_period)
+
+    bounds = np.concatenate([[0], np.cumsum(packed.counts)])
+    for i, c in enumerate(seq.channels):
+        c.add_state_switches(packed.times[bounds[i]: bounds[i+1]])
+
+    return seq
+
+
+def _padded(b: bytes) -> bytes:
+    """Pads bytes with zeros to a multiple of 8."""
+    return b + b'\0' * (-len(b) % 8)
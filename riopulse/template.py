@@ -0,0 +1,542 @@
+import numpy as np
+
+from numbers import Real
+from typing import Union
+
+from .sequence import Sequence
+from .compilation import DEFAULT_CLOCK_PERIOD, MachineCode, compile_
+
+
+__all__ = ['Parameter', 'SequenceTemplate']
+
+
+class Parameter:
+    """A symbolic time: a linear combination of named parameters plus
+    a constant. Parameters can be added to and subtracted from each other
+    and numbers, and multiplied by numbers, e.g. 2*Parameter('delay') + 1e-6.
+
+    Attributes:
+        terms (dict):
+            The coefficients of the parameters by name.
+        const (float):
+            The constant term.
+    """
+
+    def __init__(self, name: Union[str, None] = None):
+        """Inits the parameter with the given name, or the zero constant
+        if the name is None."""
+
+        self.terms = {} if name is None else {name: 1.}
+        self.const = 0.
+
+    @classmethod
+    def cast(cls, value) -> 'Parameter':
+        """Converts a name, a number or a Parameter to a Parameter."""
+
+        if isinstance(value, Parameter):
+            return value
+        if isinstance(value, str):
+            return cls(value)
+        if isinstance(value, Real):
+            p = cls()
+            p.const = float(value)
+            return p
+
+        raise TypeError(f'Cannot use {value!r} as a time.')
+
+    @property
+    def names(self) -> list:
+        """The names of the parameters on which the time depends."""
+        return [name for name, k in self.terms.items() if k != 0]
+
+    def evaluate(self, values: dict) -> float:
+        """Returns the value of the time for the given parameter values."""
+
+        t = self.const
+        for name, k in self.terms.items():
+            t = t + k*values[name]
+        return t
+
+    def __add__(self, other):
+        other = Parameter.cast(other)
+
+        p = Parameter()
+        p.terms = dict(self.terms)
+        for name, k in other.terms.items():
+            p.terms[name] = p.terms.get(name, 0.) + k
+        p.const = self.const + other.const
+
+        return p
+
+    __radd__ = __add__
+
+    def __neg__(self):
+        return self*(-1)
+
+    def __sub__(self, other):
+        return self + (-Parameter.cast(other))
+
+    def __rsub__(self, other):
+        return Parameter.cast(other) - self
+
+    def __mul__(self, other):
+        if not isinstance(other, Real):
+            return NotImplemented
+
+        p = Parameter()
+        p.terms = {name: k*other for name, k in self.terms.items()}
+        p.const = self.const*other
+
+        return p
+
+    __rmul__ = __mul__
+
+    def __repr__(self):
+        items = ['%g*%s' % (k, name) for name, k in self.terms.items()]
+        if self.const or not items:
+            items.append('%g' % self.const)
+        return '%s(%s)' % (type(self).__name__, ' + '.join(items))
+
+
+class SequenceTemplate:
+    """A pulse sequence with symbolic timings, which is compiled once and
+    then updated by patching the machine code.
+
+    The times of the pulses are numbers, parameter names or Parameter
+    objects. The compilation records which output commands depend on
+    which parameters. When the parameters are updated, only the durations
+    (arg2) of these commands are recomputed and patched, as long as
+    the order of the state switches and their grouping into clock cycles
+    stay the same. Otherwise, the sequence is recompiled from scratch.
+
+    Example:
+        tmpl = SequenceTemplate(nchannels=2,
+                                params={'delay': 1e-6, 'width': 2e-6})
+        tmpl.add_pulse(0, 0, 'width')
+        tmpl.add_pulse(1, 'delay', 'width')
+        mcode = tmpl.compile()
+        mcode = tmpl.update(delay=1.5e-6)
+
+    Attributes:
+        values (dict):
+            The current values of the parameters.
+        stop_time (float, str, Parameter or None):
+            The end time of the sequence. The sequence is extended to
+            accommodate all pulses, as Sequence is.
+        code (MachineCode or None):
+            The latest compiled or patched machine code.
+        patched (numpy.ndarray or None):
+            The indices of the words changed by the latest update, or None
+            if the latest update recompiled the code.
+        dependencies (dict):
+            The indices of the words whose durations depend on each
+            parameter, or an empty dict if the code cannot be patched.
+    """
+
+    def __init__(self, nchannels: int = 8, defaults: list = None,
+                 start_time: float = 0, stop_time=None,
+                 params: Union[dict, None] = None):
+        """Creates an empty template.
+
+        Args:
+            nchannels, defaults, start_time:
+                See Sequence.
+            stop_time:
+                See the class attributes.
+            params:
+                The initial values of the parameters.
+        """
+
+        self.nchannels = nchannels
+        self.defaults = defaults
+        self.start_time = start_time
+        self._stop_time = stop_time
+        self.values = dict(params or {})
+
+        self.code = None
+        self.patched = None
+        self.dependencies = {}
+
+        self._pulses = []  # (ch, t0, duration)
+        self._dt = None
+        self._arrays = None
+        self._structure = None
+
+    @property
+    def stop_time(self):
+        return self._stop_time
+
+    @stop_time.setter
+    def stop_time(self, value):
+        self._stop_time = value
+        self.code = None
+
+    def add_pulse(self, ch: int, t0, duration) -> None:
+        """Adds a pulse to the specified channel. The times are numbers (s),
+        parameter names or Parameter objects."""
+
+        if not 0 <= ch < self.nchannels:
+            raise ValueError(f'Invalid channel number {ch}.')
+
+        self._pulses.append((ch, Parameter.cast(t0),
+                             Parameter.cast(duration)))
+        self.code = None
+        self._arrays = None
+
+    def sequence(self, **values) -> Sequence:
+        """Returns the sequence for the current parameter values updated
+        with the given ones."""
+
+        self._set_values(values)
+        return self._sequence()
+
+    def compile(self, dt: Union[float, None] = None, **values) -> MachineCode:
+        """Compiles the sequence for the current parameter values updated
+        with the given ones, and records the dependencies of the commands
+        on the parameters.
+
+        Args:
+            dt:
+                Clock period (s). See translate for the default.
+        """
+
+        previous = dict(self.values)
+        self._set_values(values)
+
+        dt = DEFAULT_CLOCK_PERIOD if dt is None else dt
+        try:
+            code = compile_(self._sequence(), dt, cache=False)
+        except BaseException:
+            self.values = previous
+            raise
+
+        self._dt = dt
+        self.code = code
+        self.patched = None
+        self._structure = self._analyze()
+
+        if self._structure is None:
+            self.dependencies = {}
+        else:
+            self.dependencies = self._structure['dependencies']
+
+        return self.code
+
+    def update(self, **values) -> MachineCode:
+        """Sets the values of parameters and updates the machine code
+        in place. If the values are rejected, the values and the code are
+        left unchanged.
+
+        Returns:
+            The updated code.
+        """
+
+        if self.code is None:
+            # The clock period of the latest compilation is kept.
+            return self.compile(self._dt, **values)
+
+        changed = [name for name, v in values.items()
+                   if name not in self.values or self.values[name] != v]
+        previous = dict(self.values)
+        self._set_values(values)
+
+        if not changed:
+            self.patched = np.empty(0, dtype=np.int64)
+            return self.code
+
+        try:
+            patch = self._patch(changed)
+            if patch is None:
+                return self.compile(self._dt)
+        except BaseException:
+            self.values = previous
+            raise
+
+        idx, n = patch
+        words = self.code.words
+        mask = np.uint64((1 << 48) - 1)
+        words[idx] = (words[idx] & ~mask) | n.astype(np.uint64)
+
+        self.patched = idx
+        return self.code
+
+    def _set_values(self, values: dict) -> None:
+        names = (set(self.values) | set(self._stop_names())
+                 | set(self._get_arrays()['names']))
+
+        for name in values:
+            if name not in names:
+                raise KeyError(f'Unknown parameter {name!r}.')
+
+        self.values.update(values)
+
+    def _stop_names(self) -> list:
+        if self.stop_time is None:
+            return []
+        return Parameter.cast(self.stop_time).names
+
+    def _get_arrays(self) -> dict:
+        """Returns the pulses as arrays of coefficients of the parameters."""
+
+        if self._arrays is not None:
+            return self._arrays
+
+        names = sorted({name for _, t0, d in self._pulses
+                        for name in t0.names + d.names})
+        col = {name: i for i, name in enumerate(names)}
+
+        npulses = len(self._pulses)
+        a = {'names': names,
+             'ch': np.array([p[0] for p in self._pulses], dtype=np.int64),
+             't0_const': np.array([p[1].const for p in self._pulses]),
+             'd_const': np.array([p[2].const for p in self._pulses]),
+             't0_coef': np.zeros((npulses, len(names))),
+             'd_coef': np.zeros((npulses, len(names)))}
+
+        for i, (_, t0, d) in enumerate(self._pulses):
+            for name in t0.names:
+                a['t0_coef'][i, col[name]] = t0.terms[name]
+            for name in d.names:
+                a['d_coef'][i, col[name]] = d.terms[name]
+
+        self._arrays = a
+        return a
+
+    def _evaluate(self, pulses=slice(None)) -> tuple:
+        """Evaluates the front edge times and the durations of pulses.
+
+        The terms are summed in the same order for any selection of pulses,
+        so that the results are identical to the last bit.
+        """
+
+        a = self._get_arrays()
+
+        t0 = a['t0_const'][pulses]
+        d = a['d_const'][pulses]
+        for i, name in enumerate(a['names']):
+            v = self.values[name]
+            t0 = t0 + a['t0_coef'][pulses, i]*v
+            d = d + a['d_coef'][pulses, i]*v
+
+        return t0, d
+
+    def _stop_value(self):
+        if self.stop_time is None:
+            return None
+        return Parameter.cast(self.stop_time).evaluate(self.values)
+
+    def _sequence(self) -> Sequence:
+        a = self._get_arrays()
+        t0, d = self._evaluate()
+
+        seq = Sequence(self.nchannels, self.defaults, self.start_time)
+        for ch in np.unique(a['ch']).tolist():
+            sel = a['ch'] == ch
+            seq.add_pulses(ch, t0[sel], d[sel])
+
+        stop = self._stop_value()
+        if stop is not None:
+            seq.stop_time = max(stop, seq.stop_time)
+
+        return seq
+
+    def _cycles(self, times) -> np.ndarray:
+        """Converts times to clock cycles in the same way as the compilation
+        of the sequence."""
+
+        t = np.asarray(times, dtype=float)
+        return np.rint((t - self.start_time)/self._dt).astype(np.int64)
+
+    def _analyze(self) -> Union[dict, None]:
+        """Groups the state switches into clock cycles and finds
+        the dependencies of the output commands on the parameters.
+
+        Returns:
+            A dict describing the structure of the code, or None if the code
+            cannot be patched.
+        """
+
+        a = self._get_arrays()
+        npulses = len(self._pulses)
+
+        t0, d = self._evaluate()
+        times = np.concatenate([t0, t0 + d])
+        if times.size and np.min(times) < self.start_time:
+            # Moving the earliest pulse would shift all clock cycles.
+            return None
+
+        ch = np.concatenate([a['ch'], a['ch']])
+        cycles = self._cycles(times)
+
+        order = np.argsort(cycles, kind='stable')
+        sc = cycles[order]
+        first = np.flatnonzero(np.diff(sc, prepend=-1) > 0)
+        gcycles = sc[first]
+        group = np.empty(len(times), dtype=np.int64)
+        group[order] = np.cumsum(np.diff(sc, prepend=-1) > 0) - 1
+
+        if _has_coinciding(times, ch, group):
+            return None
+
+        # The boundaries of the output commands in clock cycles.
+        head = 1 if (gcycles.size == 0 or gcycles[0] > 0) else 0
+        seq_stop = self._stop_value()
+        stop = times.max() if times.size else self.start_time
+        if seq_stop is not None:
+            stop = max(stop, seq_stop)
+        stop_cycle = int(self._cycles(stop))
+        last = int(gcycles[-1]) if gcycles.size else 0
+        tail = stop_cycle - last > 1
+
+        bounds = np.concatenate([[0]*head, gcycles, [stop_cycle]*tail])
+        ncout = len(bounds) - 1
+        if len(self.code) != ncout + 2:
+            # Coinciding switches were cancelled in the sequence.
+            return None
+
+        # The parameters on which every edge depends. The front edges of 
+        # the pulses come first, followed by the back edges.
+        t0_deps = a['t0_coef'] != 0
+        edge_deps = np.concatenate([t0_deps, t0_deps | (a['d_coef'] != 0)])
+
+        stop_names = self._stop_names()
+        last_group = group == len(gcycles) - 1
+
+        # The boundaries that depend on each parameter, and the commands 
+        # before and after these boundaries.
+        bound_deps = {}
+        dependencies = {}
+        for name in set(a['names']) | set(stop_names):
+            pos = []
+            if name in a['names']:
+                i = a['names'].index(name)
+                pos.append(group[edge_deps[:, i]] + head)
+
+                # The last edges can extend the sequence.
+                if tail and np.any(edge_deps[last_group, i]):
+                    pos.append([len(bounds) - 1])
+
+            if tail and name in stop_names:
+                pos.append([len(bounds) - 1])
+
+            pos = np.unique(np.concatenate(pos + [[]])).astype(np.int64)
+            j = np.unique(np.concatenate([pos - 1, pos]))
+            j = j[(j >= 0) & (j < ncout)]
+
+            bound_deps[name] = pos
+            dependencies[name] = j + 1
+
+        return {'bounds': bounds, 'head': head, 'tail': tail,
+                'group': group, 'order': order, 'first': first,
+                'npulses': npulses, 'stop_names': stop_names,
+                'bound_deps': bound_deps, 'dependencies': dependencies}
+
+    def _patch(self, changed: list) -> Union[tuple, None]:
+        """Computes the new durations of the commands that depend on
+        the changed parameters.
+
+        Returns:
+            (idx, n), the indices of the words and their new arg2, or None
+            if the order of the state switches changed.
+        """
+
+        s = self._structure
+        if s is None:
+            return None
+
+        # The parameters that are not used do not change the code.
+        changed = [name for name in changed if name in s['bound_deps']]
+        if not changed:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        a = self._get_arrays()
+        bounds = s['bounds'].copy()
+        head, tail = s['head'], s['tail']
+        ngroups = len(s['first'])
+        npulses = s['npulses']
+
+        pos = np.unique(np.concatenate([s['bound_deps'][name]
+                                        for name in changed]))
+        groups = pos - head
+        groups = groups[(groups >= 0) & (groups < ngroups)]
+
+        # The existence and the duration of the last command depend on 
+        # the last group of edges and the stop time.
+        check_stop = (ngroups - 1 in groups
+                      or (tail and len(bounds) - 1 in pos)
+                      or any(name in s['stop_names'] for name in changed))
+        if check_stop and ngroups:
+            groups = np.union1d(groups, [ngroups - 1]).astype(np.int64)
+
+        # The edges in the affected groups.
+        bounds_idx = np.append(s['first'], len(s['order']))
+        edges = np.concatenate(
+            [s['order'][bounds_idx[g]: bounds_idx[g+1]] for g in groups]
+            + [np.empty(0, np.int64)]).astype(np.int64)
+
+        pulses = edges % npulses if npulses else edges
+        t0, d = self._evaluate(pulses)
+        if np.any(d <= 0):
+            raise ValueError('Duration must be greater than zero.')
+
+        times = np.where(edges < npulses, t0, t0 + d)
+        if times.size and np.min(times) < self.start_time:
+            return None
+
+        cycles = self._cycles(times)
+
+        # All edges of a group must stay in the same clock cycle.
+        g_of_edge = s['group'][edges]
+        gc = {}
+        for g, c in zip(g_of_edge.tolist(), cycles.tolist()):
+            if gc.setdefault(g, c) != c:
+                return None
+
+        ch = np.concatenate([a['ch'], a['ch']])[edges]
+        if _has_coinciding(times, ch, g_of_edge):
+            return None
+
+        for g, c in gc.items():
+            bounds[g + head] = c
+
+        # The groups must stay in the same order.
+        gb = bounds[head: head + ngroups]
+        if ngroups and ((gb[0] > 0) != bool(head) or gb[0] < 0
+                        or np.any(np.diff(gb) <= 0)):
+            return None
+
+        if check_stop:
+            stop = self._stop_value()
+            last = times[g_of_edge == ngroups - 1]
+            if last.size:
+                stop = last.max() if stop is None else max(stop, last.max())
+            elif stop is None:
+                stop = self.start_time
+            stop_cycle = int(self._cycles(stop))
+            last_cycle = int(gb[-1]) if ngroups else 0
+
+            if (stop_cycle - last_cycle > 1) != tail:
+                return None
+            if tail:
+                bounds[-1] = stop_cycle
+
+        j = np.unique(np.concatenate([self.dependencies[name]
+                                      for name in changed])) - 1
+        n = bounds[j + 1] - bounds[j] - 1
+        if np.any(n >= (1 << 48)):
+            raise ValueError('arg2 must fit in 48 bits.')
+
+        s['bounds'] = bounds
+        return j + 1, n
+
+
+def _has_coinciding(times, ch, group) -> bool:
+    """Checks if two switches of the same channel have exactly the same time,
+    in which case they cancel each other in a Sequence."""
+
+    key = np.stack([group, ch]).T
+    if len(np.unique(key, axis=0)) == len(key):
+        return False
+
+    pairs = np.stack([ch.astype(float), times]).T
+    return len(np.unique(pairs, axis=0)) != len(pairs)
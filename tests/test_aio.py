@@ -0,0 +1,94 @@
+import asyncio
+import threading
+import time
+import unittest
+
+import numpy as np
+
+from riopulse import Sequence
+from riopulse import PulseGen, Emulator, compile_
+from riopulse.aio import AsyncPulseGen
+
+
+class SlowEmulator(Emulator):
+    """An emulator in which the software trigger takes time."""
+
+    delay = 0.2
+
+    def _register_written(self, name, old, new):
+        if name == 'software trig' and new:
+            time.sleep(self.delay)
+        super()._register_written(name, old, new)
+
+
+class AsyncPulseGenTest(unittest.TestCase):
+
+    def test_program(self):
+        seq1 = Sequence(nchannels=2)
+        seq1.add_pulses(0, np.arange(100)*1e-6, 0.5e-6)
+        seq2 = Sequence(nchannels=2)
+        seq2.add_pulses(1, np.arange(200)*1e-6, 0.3e-6)
+
+        emu = Emulator()
+        threads = set()
+
+        def factory(bitfile, resource):
+            threads.add(threading.current_thread())
+            return emu.session()
+
+        async def main():
+            async with AsyncPulseGen(PulseGen('RIO0', 
+                                              session_factory=factory)) as ap:
+                stats = await ap.program(seq1)
+                await ap.run_single()
+
+                # Compiles the next sequence while the current one is 
+                # being programmed again.
+                compiled = asyncio.ensure_future(ap.compile(seq2))
+                await ap.program(seq1, force=True)
+                await ap.program(await compiled)
+
+                await ap.run_continuous()
+                await ap.stop()
+                return stats
+
+        stats = asyncio.run(main())
+
+        self.assertEqual(stats.words, len(compile_(seq1)))
+        self.assertTrue(emu.played[0].matches(seq1))
+        self.assertTrue(emu.verify(seq2))
+        self.assertEqual(emu.registers['persistent trig'].read(), False)
+
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads.pop(), threading.main_thread())
+
+    def test_timeout(self):
+        emu = SlowEmulator()
+        p = PulseGen('RIO0', session_factory=emu.session)
+
+        async def main():
+            ap = AsyncPulseGen(p, timeout=0.05)
+
+            with self.assertRaises(asyncio.TimeoutError):
+                await ap.run_single()
+
+            # The next call waits for the interrupted one to complete.
+            await ap.run_continuous(timeout=1)
+            self.assertEqual(len(emu.played), 1)
+
+            # A call that has not started when it times out is skipped.
+            t = asyncio.ensure_future(ap.run_single(timeout=1))
+            await asyncio.sleep(0.01)
+            with self.assertRaises(asyncio.TimeoutError):
+                await ap.run_continuous()
+            await t
+            await ap.close()
+
+        asyncio.run(main())
+
+        self.assertEqual(len(emu.played), 2)
+        self.assertEqual(emu.registers['persistent trig'].read(), False)
+
+
+if __name__ == "__main__":
+    unittest.main()
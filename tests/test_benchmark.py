@@ -0,0 +1,44 @@
+import os
+import tempfile
+import unittest
+
+from riopulse import benchmark
+
+
+class BenchmarkTest(unittest.TestCase):
+
+    def test_pulse_trains(self):
+        for n, nch in [(10, 1), (1000, 8)]:
+            seq = benchmark.build(benchmark.pulse_trains(n, nch), nch)
+            self.assertEqual(sum(len(c.switch_times) for c in seq.channels),
+                             n)
+
+    def test_run_compare(self):
+        results = benchmark.run(transitions=[10], channels=[1, 2], repeat=2)
+
+        self.assertEqual([r.name for r in results[:4]], 
+                         ['build/10x1', 'translate/10x1', 'compile/10x1', 
+                          'upload/10x1'])
+        self.assertTrue(all(len(r.times) == 2 for r in results))
+        self.assertTrue(all(r.peak_memory > 0 for r in results))
+
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'results.json')
+            benchmark.save(path, results)
+            loaded = benchmark.load(path)
+
+        self.assertEqual(loaded, results)
+
+        slower = [r._replace(times=[2*t for t in r.times]) 
+                  for r in results[:2]]
+        comparisons = benchmark.compare(results, slower, threshold=0.5)
+
+        self.assertEqual(len(comparisons), 2)
+        self.assertTrue(all(c.regressed for c in comparisons))
+        self.assertAlmostEqual(comparisons[0].time_ratio, 2)
+        self.assertFalse(any(c.regressed for c 
+                             in benchmark.compare(results, results)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,271 @@
+import random
+import unittest
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from riopulse import Sequence
+from riopulse import translate, compile_, MachineCode
+from riopulse import compile_cache, CompileCache
+from riopulse import translate_stream, compile_stream, count_commands
+from riopulse import segment, segment_stream, compress, recompile
+from riopulse import compile_many, pack
+
+
+class CompilationTest(unittest.TestCase):
+
+    def test_compile(self):
+        """Tests the packing of commands into machine code."""
+
+        seq = Sequence(nchannels=8, defaults=[True] + [False]*7)
+        seq.add_pulse(7, 1e-6, 2e-6)
+        seq.add_pulse(3, 2e-6, 4e-6)
+        seq.stop_time = 10e-6
+
+        cmd = translate(seq)
+        ref = [(['init', 'cout', 'trigwait'].index(c[0]) << 56) 
+               + (c[1] << 48) + c[2] for c in cmd]
+
+        mcode = compile_(seq)
+
+        self.assertIsInstance(mcode, MachineCode)
+        self.assertEqual(mcode.words.dtype, np.uint64)
+        self.assertEqual(mcode.tolist(), ref)
+        self.assertEqual(mcode, ref)
+        self.assertEqual(mcode, compile_(cmd))
+        self.assertEqual(mcode[1], ref[1])
+
+        with self.assertRaises(ValueError):
+            compile_([['cout', 256, 0]])
+        with self.assertRaises(ValueError):
+            compile_([['cout', 0, 1 << 48]])
+
+    def test_compile_random(self):
+        """Tests that compiling a sequence directly and via the readable list 
+        of commands gives the same code."""
+
+        rng = random.Random(4)
+        seq = Sequence(nchannels=8)
+        for _ in range(1000):
+            seq.add_pulse(rng.randrange(8), rng.randint(0, 10**5)*1e-8, 
+                          rng.randint(1, 100)*1e-8)
+
+        self.assertEqual(compile_(seq), compile_(translate(seq)))
+
+    def test_stream(self):
+        """Tests that the streaming compilation gives the same result as
+        the compilation of the whole sequence."""
+
+        rng = random.Random(6)
+
+        for clock_period in [None, 1e-8]:
+            seq = Sequence(nchannels=4, defaults=[True, False, False, True],
+                           clock_period=clock_period)
+            for _ in range(500):
+                t0 = rng.randint(0, 10**4)
+                duration = rng.randint(1, 50)
+                if clock_period is None:
+                    t0, duration = t0*5e-9, duration*5e-9
+                seq.add_pulse(rng.randrange(4), t0, duration)
+
+            gen = compile_stream(seq)
+            self.assertFalse(isinstance(gen, list))
+
+            self.assertEqual(list(translate_stream(seq)), translate(seq))
+            self.assertEqual(list(gen), compile_(seq).tolist())
+            self.assertEqual(count_commands(seq), len(compile_(seq)))
+
+    def test_segment(self):
+        seq = Sequence(nchannels=2)
+        seq.add_pulses(0, np.arange(500)*1e-6, 0.5e-6)
+        seq.stop_time = 1e-3
+
+        mcode = compile_(seq)
+        segments = segment(seq, max_commands=100)
+
+        self.assertEqual([len(m) for m in segments], [100]*10 + [22])
+        for m in segments:
+            self.assertEqual(m[0], mcode[0])
+            self.assertEqual(m[-1], mcode[-1])
+
+        body = np.concatenate([m.words[1:-1] for m in segments])
+        self.assertTrue(np.array_equal(body, mcode.words[1:-1]))
+        self.assertEqual(sum(m.cycles for m in segments), mcode.cycles)
+        self.assertEqual(mcode.cycles, 10**5)
+
+        # A program that fits is not split.
+        self.assertEqual(segment(mcode), [mcode])
+
+        with self.assertRaises(ValueError):
+            segment(compile_([['cout', 0, 1]]*5), max_commands=3)
+
+        # The segments generated from the stream are the same.
+        for seq, n in [(seq, 100), (seq, 502), (seq, 10**4), 
+                       (Sequence(nchannels=1), 3)]:
+            self.assertEqual([m.tolist() for m in segment_stream(seq, n)],
+                             [m.tolist() for m in segment(seq, n)])
+
+    def test_compress(self):
+        """Tests the replacement of repeated blocks by loops."""
+
+        cmd = ([['trigwait', 0, 0], ['cout', 0, 5]] 
+               + [['cout', 1, 2], ['cout', 0, 3]]*10
+               + [['cout', 1, 2], ['init', 0, 0]])
+        mcode = compress(cmd)
+
+        self.assertEqual(mcode, compile_([['trigwait', 0, 0], ['cout', 0, 5],
+                                          ['cout', 1, 2], ['cout', 0, 3],
+                                          ['loop', 2, 9], ['cout', 1, 2],
+                                          ['init', 0, 0]]))
+        self.assertEqual(mcode.cycles, compile_(cmd).cycles)
+
+        # Code without repetitions is not changed.
+        cmd = [['trigwait', 0, 0], ['cout', 1, 2], ['cout', 0, 3], 
+               ['init', 0, 0]]
+        self.assertEqual(compress(cmd), compile_(cmd))
+
+        # A 1 kHz pulse train.
+        seq = Sequence(nchannels=2)
+        seq.add_pulses(0, np.arange(10000)*1e-3, 1e-4)
+        seq.add_pulse(1, 0.5, 1e-3)
+
+        mcode = compile_(seq, compress=True)
+
+        self.assertEqual(len(mcode), 11)
+        self.assertEqual(mcode.cycles, compile_(seq).cycles)
+        self.assertNotEqual(mcode, compile_(seq))
+
+    def test_recompile(self):
+        """Compares the code updated in the modified window with the code 
+        compiled from scratch."""
+
+        rng = random.Random(2)
+
+        for _ in range(100):
+            tick = rng.random() < 0.3
+            nch = rng.randint(1, 4)
+            seq = Sequence(nchannels=nch, 
+                           clock_period=1e-8 if tick else None)
+
+            def t(k):
+                if tick:
+                    return k
+                return k*rng.choice([1e-8, 1e-8, 1.3e-8, 0.5e-8])
+
+            for _ in range(rng.randint(0, 30)):
+                seq.add_pulse(rng.randrange(nch), t(rng.randint(1, 300)),
+                              t(rng.randint(1, 20)))
+
+            mcode = compile_(seq, cache=False)
+
+            for _ in range(5):
+                version = seq.version
+
+                op = rng.random()
+                if op < 0.5:
+                    seq.add_pulse(rng.randrange(nch), t(rng.randint(1, 400)),
+                                  t(rng.randint(1, 20)))
+                elif op < 0.8:
+                    ch = seq.channels[rng.randrange(nch)]
+                    if ch.switch_times and rng.random() < 0.5:
+                        ch.add_state_switch(rng.choice(ch.switch_times))
+                    else:
+                        ch.add_state_switch(t(rng.randint(1, 400)))
+                elif op < 0.9:
+                    seq.stop_time = max(seq.stop_time, t(rng.randint(1, 500)))
+                else:
+                    seq.channels[0].default = rng.random() < 0.5
+
+                mcode = recompile(seq, mcode, version)
+                self.assertEqual(mcode, compile_(seq, cache=False))
+
+        self.assertIs(recompile(seq, mcode, seq.version), mcode)
+
+    def test_compile_many(self):
+        rng = random.Random(4)
+
+        sequences = []
+        for i in range(20):
+            clock_period = 1e-8 if i % 3 == 0 else None
+            seq = Sequence(nchannels=3, defaults=[i % 2 == 0, False, True],
+                           clock_period=clock_period)
+            for _ in range(rng.randint(0, 200)):
+                t0, duration = rng.randint(0, 1000), rng.randint(1, 10)
+                if clock_period is None:
+                    t0, duration = t0*1e-8, duration*1e-8
+                seq.add_pulse(rng.randrange(3), t0, duration)
+            sequences.append(seq)
+
+        packed = pack(sequences[1])
+        self.assertEqual(packed.times.dtype, np.float64)
+        self.assertEqual(packed.counts.sum(), len(packed.times))
+
+        for workers in [1, 2]:
+            programs, timings = compile_many(sequences, workers=workers)
+
+            self.assertEqual(len(timings), len(sequences))
+            for seq, mcode in zip(sequences, programs):
+                self.assertEqual(mcode, compile_(seq))
+
+        # An existing pool is used and not shut down.
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            for _ in range(2):
+                programs, timings = compile_many(sequences, workers=2,
+                                                 executor=executor)
+                self.assertEqual(programs[5], compile_(sequences[5]))
+
+        programs, timings = compile_many([])
+        self.assertEqual((programs, len(timings)), ([], 0))
+
+    def test_chunks(self):
+        mcode = MachineCode(np.arange(300))
+        chunks = list(mcode.chunks(128))
+
+        self.assertEqual([len(c) for c in chunks], [128, 128, 44])
+        self.assertTrue(all(np.shares_memory(c, mcode.words) for c in chunks))
+        self.assertEqual(np.concatenate(chunks).tolist(), list(range(300)))
+
+    def test_cache(self):
+        compile_cache.clear()
+
+        seq = Sequence(nchannels=2)
+        seq.add_pulse(0, 1e-6, 2e-6)
+        seq.stop_time = 5e-6
+
+        mcode1 = compile_(seq)
+        mcode2 = compile_(seq)
+
+        self.assertIs(mcode1, mcode2)
+        self.assertEqual((compile_cache.hits, compile_cache.misses), (1, 1))
+        self.assertFalse(mcode1.words.flags.writeable)
+
+        # Any change of the sequence or the clock period changes the key.
+        mcode3 = compile_(seq, dt=2e-8)
+        seq.channels[1].default = True
+        mcode4 = compile_(seq)
+        seq.stop_time = 6e-6
+        mcode5 = compile_(seq)
+        seq.add_pulse(1, 1e-6, 1e-6)
+        mcode6 = compile_(seq)
+
+        self.assertEqual(compile_cache.misses, 5)
+        self.assertEqual(len({id(m) for m in 
+                              [mcode1, mcode3, mcode4, mcode5, mcode6]}), 5)
+        self.assertEqual(mcode6, compile_(seq, cache=False))
+
+    def test_cache_size(self):
+        cache = CompileCache(maxsize=2)
+        cache.put(b'a', 1)
+        cache.put(b'b', 2)
+        cache.get(b'a')
+        cache.put(b'c', 3)  # Discards b, which is the least recently used
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get(b'b'))
+        self.assertEqual(cache.get(b'a'), 1)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
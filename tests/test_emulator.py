@@ -0,0 +1,225 @@
+import random
+import unittest
+
+import numpy as np
+
+from riopulse import Sequence
+from riopulse import PulseGen, Emulator, compile_, emulate
+from riopulse import SequenceTemplate
+from riopulse import metrics
+
+
+class EmulatorTest(unittest.TestCase):
+
+    def test_program(self):
+        """Tests programming and triggering the emulator via PulseGen."""
+
+        seq = Sequence(nchannels=3, defaults=[False, True, False])
+        seq.add_pulse(0, 1e-6, 2e-6)
+        seq.add_pulse(1, 2e-6, 5e-6)
+        seq.add_pulse(2, 0, 1e-6)
+        seq.stop_time = 10e-6
+
+        emu = Emulator()
+        p = PulseGen('emulator', session_factory=emu.session)
+
+        p.init_fpga()
+        p.program(seq)
+
+        self.assertEqual(emu.program, compile_(seq))
+        self.assertEqual(emu.registers['prog ncmd'].read(), 0)
+        self.assertEqual(emu.played, [])
+
+        p.run_single()
+        p.run_single()
+
+        self.assertEqual(len(emu.played), 2)
+        self.assertTrue(emu.played[0].matches(seq))
+        self.assertTrue(emu.verify(seq))
+
+        # Checks the outputs at every clock cycle.
+        wf = emu.played[0].waveform()
+        self.assertEqual(len(wf), 1000)
+        for i, c in enumerate(seq.channels):
+            st = [c.state((k + 0.5)*1e-8) for k in range(1000)]
+            self.assertEqual(((wf >> i) & 1).astype(bool).tolist(), st)
+
+    def test_stream(self):
+        seq = Sequence(nchannels=2)
+        seq.add_pulses(0, np.arange(3000)*1e-6, 0.5e-6)
+        seq.add_pulses(1, np.arange(1000)*3e-6, 1e-6)
+
+        emu = Emulator()
+        p = PulseGen('emulator', session_factory=emu.session, fifo_depth=1000)
+        stats = p.program(seq, stream=True)
+
+        self.assertEqual(stats.words, len(compile_(seq)))
+        self.assertEqual(emu.program, compile_(seq))
+        self.assertTrue(emu.verify(seq))
+
+        # The digest of the streamed code is remembered.
+        self.assertEqual(p.program(seq).words, 0)
+
+    def test_play(self):
+        """Tests playing a sequence that does not fit in the memory."""
+
+        seq = Sequence(nchannels=2)
+        seq.add_pulses(0, np.arange(12000)*1e-7, 0.5e-7)
+        seq.add_pulses(1, np.arange(1000)*1e-6, 3e-7)
+        seq.stop_time = 1.3e-3
+
+        emu = Emulator()
+        p = PulseGen('emulator', session_factory=emu.session, fifo_depth=1000)
+
+        with self.assertRaises(ValueError):
+            p.program(seq)
+        with self.assertRaises(ValueError):
+            p.program(seq, stream=True)
+
+        # The code of the whole sequence is not compiled.
+        with metrics.profile() as m:
+            stats = p.play(seq)
+        self.assertNotIn('compile', m.summary())
+
+        self.assertEqual(len(stats), 3)
+        self.assertEqual(len(emu.played), 3)
+        self.assertEqual(sum(s.words for s in stats), len(compile_(seq)) + 4)
+
+        # The segments together produce the outputs of the whole sequence.
+        full = emulate(compile_(seq))
+        offsets = np.cumsum([0] + [tr.length for tr in emu.played])
+        cycles = np.concatenate([tr.cycles + off for tr, off 
+                                 in zip(emu.played, offsets)])
+        outputs = np.concatenate([tr.outputs for tr in emu.played])
+
+        self.assertTrue(np.array_equal(cycles, full.cycles))
+        self.assertTrue(np.array_equal(outputs, full.outputs))
+        self.assertEqual(offsets[-1], full.length)
+
+        # The board holds the last segment.
+        self.assertEqual(p.program(emu.program).words, 0)
+
+    def test_random_sequences(self):
+        rng = random.Random(5)
+
+        for _ in range(20):
+            nch = rng.randint(1, 8)
+            seq = Sequence(nchannels=nch,
+                           defaults=[rng.random() > 0.5 for _ in range(nch)])
+            for _ in range(rng.randint(0, 100)):
+                seq.add_pulse(rng.randrange(nch), rng.randint(0, 300)*5e-9,
+                              rng.randint(1, 30)*5e-9)
+            seq.stop_time = seq.stop_time + rng.choice([0, 1e-8, 2e-8, 1e-6])
+
+            self.assertTrue(emulate(compile_(seq)).matches(seq))
+
+            # A program of a different sequence does not match.
+            seq2 = Sequence(nchannels=nch, stop_time=seq.stop_time)
+            seq2.add_pulse(0, seq.start_time, 1e-8)
+            self.assertFalse(emulate(compile_(seq2)).matches(seq))
+
+    def test_loops(self):
+        """Tests that compressed code produces the same outputs."""
+
+        rng = random.Random(3)
+
+        for _ in range(20):
+            nch = rng.randint(1, 3)
+            seq = Sequence(nchannels=nch)
+            for i in range(nch):
+                period = rng.randint(2, 6)*1e-7
+                seq.add_pulses(i, np.arange(rng.randint(0, 50))*period, 1e-7)
+            seq.add_pulse(0, rng.randint(0, 100)*1e-8, 3e-8)
+
+            mcode = compile_(seq, compress=True)
+            trace = emulate(mcode)
+
+            self.assertLessEqual(len(mcode), len(compile_(seq)))
+            self.assertTrue(trace.matches(seq))
+            self.assertTrue(np.array_equal(trace.waveform(), 
+                                           emulate(compile_(seq)).waveform()))
+
+        seq = Sequence(nchannels=1)
+        seq.add_pulses(0, np.arange(20000)*1e-3, 1e-4)
+
+        emu = Emulator()
+        p = PulseGen('emulator', session_factory=emu.session, loops=True)
+        stats = p.program(seq)
+
+        self.assertLess(stats.words, 10)
+        self.assertTrue(emu.verify(seq))
+
+    def test_partial_upload(self):
+        """Tests uploading only the changed beginning of the code."""
+
+        seq = Sequence(nchannels=2)
+        seq.add_pulses(0, np.arange(1000)*1e-6, 0.5e-6)
+
+        emu = Emulator()
+        p = PulseGen('emulator', session_factory=emu.session)
+        p.program(seq, partial=True)
+
+        # Makes the 11th pulse longer, which changes the durations of 
+        # two commands.
+        seq.channels[0].add_state_switch(10.5e-6)
+        seq.channels[0].add_state_switch(10.7e-6)
+        stats = p.program(seq, partial=True)
+
+        self.assertEqual(stats.words, 23)
+        self.assertEqual(emu.program, compile_(seq))
+        self.assertTrue(emu.verify(seq))
+
+        # Inserted commands shift the rest of the code, which has to be 
+        # uploaded.
+        seq.add_pulse(1, 1e-6, 0.1e-6)
+        stats = p.program(seq, partial=True)
+
+        self.assertEqual(stats.words, len(compile_(seq)))
+        self.assertTrue(emu.verify(seq))
+
+    def test_partial_template(self):
+        """Tests partial uploads of template code that is patched 
+        in place."""
+
+        tmpl = SequenceTemplate(nchannels=2, params={'w': 2e-6})
+        for i in range(10):
+            tmpl.add_pulse(0, i*1e-5, 1e-6)
+        tmpl.add_pulse(1, 50e-6, 'w')
+
+        emu = Emulator()
+        p = PulseGen('emulator', session_factory=emu.session)
+        p.program(tmpl.compile(), partial=True)
+
+        stats = p.program(tmpl.update(w=3e-6), partial=True)
+
+        self.assertGreater(stats.words, 0)
+        self.assertTrue(emu.verify(tmpl.sequence()))
+
+    def test_partial_transfer(self):
+        """Tests that the commands are moved to the memory only after 
+        the number of commands is set."""
+
+        mcode = compile_([['trigwait', 0, 0], ['cout', 1, 9], 
+                          ['cout', 0, 4], ['init', 0, 0]])
+
+        emu = Emulator()
+        se = emu.session()
+        se.fifos['command'].write(mcode.words[:2])
+        self.assertEqual(emu.ncmd, 0)
+
+        se.registers['prog ncmd'].write(len(mcode))
+        self.assertEqual(se.registers['prog ncmd'].read(), 4)
+
+        se.fifos['command'].write(mcode.words[2:])
+        self.assertEqual(se.registers['prog ncmd'].read(), 0)
+        self.assertEqual(emu.program, mcode)
+
+        trace = emu.trace()
+        self.assertEqual(trace.cycles.tolist(), [0, 10])
+        self.assertEqual(trace.outputs.tolist(), [1, 0])
+        self.assertEqual(trace.length, 15)
+        self.assertTrue(np.array_equal(trace.waveform(), [1]*10 + [0]*5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+import random
+import unittest
+
+import numpy as np
+
+from riopulse import Sequence
+from riopulse import PulseGen, PulseGenGroup, Emulator, compile_
+
+
+class GroupTest(unittest.TestCase):
+
+    def make_group(self, n, **kwargs):
+        emus = [Emulator() for _ in range(n)]
+        boards = [PulseGen(f'RIO{i}', session_factory=emu.session) 
+                  for i, emu in enumerate(emus)]
+        return emus, PulseGenGroup(boards, **kwargs)
+
+    def test_wide_sequence(self):
+        rng = random.Random(2)
+
+        seq = Sequence(nchannels=20, defaults=[i % 3 == 0 for i in range(20)])
+        for _ in range(200):
+            seq.add_pulse(rng.randrange(20), rng.randint(0, 1000)*1e-8,
+                          rng.randint(1, 50)*1e-8)
+        seq.stop_time += 1e-6
+
+        emus, group = self.make_group(3)
+
+        with group:
+            parts = group.split(seq)
+            timings = group.program(seq)
+            trigger = group.run_single()
+
+            # The compilation processes are reused.
+            pool = group._pool
+            self.assertIsNotNone(pool)
+            group.program(seq, force=True)
+            self.assertIs(group._pool, pool)
+
+        self.assertIsNone(group._pool)
+
+        self.assertEqual(sorted(timings), [0, 1, 2])
+        self.assertEqual([len(parts[i].channels) for i in range(3)], 
+                         [8, 8, 4])
+
+        for i, emu in enumerate(emus):
+            self.assertEqual(timings[i].upload.words, len(compile_(parts[i])))
+            self.assertGreaterEqual(timings[i].upload_time, 0)
+            self.assertEqual(len(emu.played), 1)
+            self.assertTrue(emu.played[0].matches(parts[i]))
+
+            # The board outputs the channels of the wide sequence.
+            wf = emu.played[0].waveform()
+            for k, c in enumerate(parts[i].channels):
+                wc = seq.channels[8*i + k]
+                self.assertEqual(c.default, wc.default)
+                st = [wc.state((j + 0.5)*1e-8) for j in range(len(wf))]
+                self.assertEqual(((wf >> k) & 1).astype(bool).tolist(), st)
+
+        self.assertEqual(min(trigger.values()), 0)
+        self.assertEqual(group.last_trigger, trigger)
+
+    def test_mapping(self):
+        seq = Sequence(nchannels=4)
+        seq.add_pulse(1, 1e-6, 1e-6)
+        seq.add_pulse(3, 2e-6, 1e-6)
+
+        emus, group = self.make_group(
+            2, channel_map={0: [3, 1], 1: [0, 2]}, workers=1)
+
+        timings = group.program(seq)
+        group.run_continuous()
+
+        trace = emus[0].trace()
+        self.assertEqual(trace.outputs.tolist(), [0, 2, 1])
+        self.assertEqual(emus[1].trace().outputs.tolist(), [0])
+        self.assertTrue(all(e.registers['persistent trig'].read() 
+                            for e in emus))
+
+        # The board with unchanged code is not uploaded again.
+        seq.add_pulse(1, 0.2e-6, 0.1e-6)
+        timings = group.program(seq)
+        self.assertEqual(timings[1].upload.words, 0)
+        self.assertGreater(timings[0].upload.words, 0)
+
+        group.stop()
+        group.close()
+        self.assertFalse(any(e.registers['persistent trig'].read() 
+                             for e in emus))
+
+        with self.assertRaises(ValueError):
+            PulseGenGroup([PulseGen('RIO0')], channel_map={0: range(9)})
+
+    def test_split_coverage(self):
+        """Tests that every channel of a wide sequence is output once."""
+
+        seq = Sequence(nchannels=20)
+        seq.add_pulse(19, 1e-6, 1e-6)
+
+        # Two boards cannot output 20 channels.
+        emus, group = self.make_group(2, workers=1)
+        with group, self.assertRaises(ValueError):
+            group.program(seq)
+
+        emus, group = self.make_group(3, workers=1)
+        with group:
+            for channel_map in [{0: [0], 1: [2]},               # Missing
+                                {0: [0, 1], 1: [1, 2], 2: []},  # Duplicate
+                                {0: [0, 1], 1: [2], 2: [4]}]:   # Out of range
+                group.channel_map = channel_map
+                with self.assertRaises(ValueError):
+                    group.split(Sequence(nchannels=3))
+
+            group.channel_map = {0: [2], 1: [0, 1]}
+            self.assertEqual(len(group.split(Sequence(nchannels=3))[1]
+                                 .channels), 2)
+
+    def test_codes(self):
+        seqs = [Sequence(nchannels=1) for _ in range(2)]
+        for i, s in enumerate(seqs):
+            s.add_pulses(0, np.arange(10)*(i + 1)*1e-6, 1e-7)
+
+        emus, group = self.make_group(2, workers=1)
+        with group:
+            timings = group.program({0: seqs[0], 1: compile_(seqs[1])})
+
+        self.assertEqual(timings[1].compile_time, 0)
+        self.assertTrue(emus[0].verify(seqs[0]))
+        self.assertTrue(emus[1].verify(seqs[1]))
+
+    def test_sessions(self):
+        """Tests that the triggers use the session handling of PulseGen."""
+
+        seq = Sequence(nchannels=2)
+        seq.add_pulse(1, 1e-6, 1e-6)
+
+        emus = [Emulator() for _ in range(2)]
+        boards = [PulseGen('RIO0', persistent=False,
+                           session_factory=emus[0].session),
+                  PulseGen('RIO1', session_factory=emus[1].session)]
+
+        with PulseGenGroup(boards, workers=1) as group:
+            group.program({0: seq, 1: seq})
+
+            # A lost session is reopened before triggering.
+            class LostSession:
+                @property
+                def registers(self):
+                    raise ConnectionError('Lost connection.')
+
+                def close(self):
+                    pass
+
+            boards[1]._session = LostSession()
+
+            group.run_single()
+
+            # The board that is not persistent holds no session.
+            self.assertIsNone(boards[0]._session)
+            self.assertIsNotNone(boards[1]._session)
+            self.assertNotIsInstance(boards[1]._session, LostSession)
+            self.assertTrue(all(len(e.played) == 1 for e in emus))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import subprocess
+import sys
+import unittest
+
+
+# The time that importing riopulse may add to the import of numpy (s).
+IMPORT_TIME_BUDGET = 0.5
+
+# The packages that are imported only when they are used.
+LAZY_DEPENDENCIES = ['matplotlib', 'PyQt5', 'nifpga', 'IPython',
+                     'concurrent.futures', 'threading']
+
+
+# The names exported by the package, besides its modules.
+PUBLIC_NAMES = [
+    'BOARD_CHANNELS', 'BoardTiming', 'COMMAND_NO', 'CompileCache',
+    'DEFAULT_CLOCK_PERIOD', 'DigitalChannel', 'Emulator', 'MAX_COMMANDS',
+    'MachineCode', 'PackedSequence', 'Parameter', 'PulseGen', 'PulseGenGroup',
+    'Sequence', 'SequenceTemplate', 'Trace', 'UploadStats', 'compile_',
+    'compile_cache', 'compile_many', 'compile_stream', 'compress',
+    'count_commands', 'emulate', 'flip_bit', 'get_bitfile', 'gui', 'pack',
+    'recompile', 'segment', 'segment_stream', 'sequence_key', 'translate',
+    'translate_stream']
+
+
+def run(code: str) -> str:
+    """Runs code in a fresh interpreter and returns its output."""
+
+    result = subprocess.run([sys.executable, '-c', code], check=True,
+                            capture_output=True, text=True)
+    return result.stdout
+
+
+class ImportTest(unittest.TestCase):
+
+    def test_dependencies(self):
+        """Tests that importing the package does not load the dependencies 
+        of plotting, the GUI, the FPGA communication and the thread and 
+        process pools."""
+
+        out = run('import sys\n'
+                  'import riopulse\n'
+                  'from riopulse.gui import gui\n'
+                  f'print([m for m in {LAZY_DEPENDENCIES!r} '
+                  'if m in sys.modules])')
+
+        self.assertEqual(out.strip(), '[]')
+
+    def test_cold_start(self):
+        """Guards the import time of the package for compile-only workers."""
+
+        out = run('import time\n'
+                  'import numpy\n'
+                  't1 = time.perf_counter()\n'
+                  'import riopulse\n'
+                  't2 = time.perf_counter()\n'
+                  'print(t2 - t1)')
+
+        self.assertLess(float(out), IMPORT_TIME_BUDGET)
+
+    def test_public_names(self):
+        out = run('import riopulse\n'
+                  'print(callable(riopulse.gui), '
+                  'callable(riopulse.Sequence.plot))')
+
+        self.assertEqual(out.split(), ['True', 'True'])
+
+        # Only the public names of the modules are exported, besides 
+        # the modules themselves.
+        out = run('import types\n'
+                  'import riopulse\n'
+                  'print(*sorted(k for k, v in vars(riopulse).items()\n'
+                  '              if not k.startswith("_")\n'
+                  '              and not isinstance(v, types.ModuleType)))')
+
+        self.assertEqual(out.split(), sorted(PUBLIC_NAMES))
+
+
+if __name__ == "__main__":
+    unittest.main()
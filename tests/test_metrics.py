@@ -0,0 +1,67 @@
+import unittest
+
+import numpy as np
+
+from riopulse import Sequence
+from riopulse import PulseGen, Emulator, compile_, translate
+from riopulse import metrics
+
+
+class MetricsTest(unittest.TestCase):
+
+    def test_program(self):
+        seq = Sequence(nchannels=2)
+        seq.add_pulses(0, np.arange(100)*1e-6, 0.5e-6)
+
+        emu = Emulator()
+        p = PulseGen('emulator', session_factory=emu.session)
+
+        with metrics.profile() as m:
+            p.program(seq)
+
+        mcode = compile_(seq)
+        summary = m.summary()
+
+        self.assertEqual(list(summary), ['compile', 'digest', 'session open',
+                                         'prog ncmd', 'fifo transfer',
+                                         'program'])
+        self.assertEqual(summary['prog ncmd'].calls, 2)
+        self.assertEqual(summary['compile'].commands, len(mcode))
+        self.assertEqual(summary['fifo transfer'].commands, len(mcode))
+        self.assertEqual(summary['fifo transfer'].nbytes, 8*len(mcode))
+        self.assertEqual(summary['program'].nbytes, 8*len(mcode))
+        self.assertTrue(all(e.duration >= 0 for e in m.events))
+        self.assertGreaterEqual(summary['program'].duration, 
+                                summary['fifo transfer'].duration)
+        self.assertEqual(len(m.report().splitlines()), 7)
+
+        # The listener is removed after the block.
+        self.assertFalse(metrics.enabled())
+        p.program(seq, force=True)
+        self.assertEqual(len(m.events), 7)
+
+    def test_listener(self):
+        seq = Sequence(nchannels=1)
+        seq.add_pulse(0, 1e-6, 1e-6)
+
+        events = []
+        metrics.add_listener(events.append)
+        try:
+            commands = translate(seq)
+            compile_(seq, cache=False)
+        finally:
+            metrics.remove_listener(events.append)
+
+        self.assertEqual([e.stage for e in events], ['translate', 'compile'])
+        self.assertEqual(events[0].commands, len(commands))
+        self.assertEqual(events[0].nbytes, 0)
+        self.assertEqual(events[1].nbytes, 8*len(commands))
+
+        # The uncached compilation reports one event.
+        with metrics.profile() as m:
+            compile_(seq, dt=2e-8)
+        self.assertEqual([e.stage for e in m.events], ['compile'])
+
+
+if __name__ == "__main__":
+    unittest.main()
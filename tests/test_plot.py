@@ -1,3 +1,5 @@
+import numpy as np
+
 from riopulse import Sequence
 
 seq = Sequence(nchannels=1)
@@ -22,4 +24,9 @@ seq.append_pulse(1, 2.5e-6, 0.5e-6)
 # Signature: seq.append_pulse(ch, delay, duration), 
 # delay and duration are in seconds
 
-seq.plot()
\ No newline at end of file
+seq.plot()
+# A long sequence plotted at the resolution of the screen.
+seq = Sequence(nchannels=2)
+seq.add_pulses(0, np.arange(10000)*1e-4, 2e-5)
+seq.add_pulses(1, np.arange(100)*1e-2, 1e-3)
+seq.plot(decimate=True)
@@ -0,0 +1,325 @@
+import unittest
+
+import numpy as np
+
+from riopulse import Sequence
+from riopulse import PulseGen, compile_
+
+
+class FakeRegister:
+
+    def __init__(self, value=0):
+        self.value = value
+        self.history = []
+
+    def write(self, data):
+        self.value = data
+        self.history.append(data)
+
+    def read(self):
+        return self.value
+
+
+class SlowRegister(FakeRegister):
+    """A 'prog ncmd' register that reports the programming as incomplete 
+    for a number of reads, as if the FIFO was still being transferred."""
+
+    def __init__(self, lag):
+        super().__init__()
+        self.lag = lag
+
+    def read(self):
+        if self.lag:
+            self.lag -= 1
+            return 1
+        return self.value
+
+
+class FakeFifo:
+
+    def __init__(self, session):
+        self.session = session
+        self.data = []
+        self.writes = []
+        self.depth = 0
+        self.running = False
+
+    def configure(self, requested_depth):
+        # The actual depth is rounded up to a multiple of 1000 elements.
+        self.depth = -(-requested_depth // 1000) * 1000
+        return self.depth
+
+    def start(self):
+        self.running = True
+
+    def stop(self):
+        self.running = False
+
+    def write(self, data, timeout_ms=0):
+        if self.session.fail:
+            self.session.fail -= 1
+            raise ConnectionError('Lost connection.')
+
+        self.writes.append((data, timeout_ms))
+        self.data += [int(d) for d in data]
+
+        # The FPGA reads the commands as soon as they arrive.
+        ncmd = self.session.registers['prog ncmd']
+        if len(self.data) >= ncmd.value:
+            ncmd.value = 0
+
+        return 0
+
+
+class FakeSession:
+    """Mimics nifpga.Session for the registers and the FIFO used by 
+    PulseGen."""
+
+    def __init__(self, bitfile, resource):
+        self.bitfile = bitfile
+        self.resource = resource
+        self.closed = False
+        self.fail = FakeSession.fail
+        self.registers = {'prog ncmd': FakeRegister(), 
+                          'persistent trig': FakeRegister(False),
+                          'software trig': FakeRegister(False)}
+        self.fifos = {'command': FakeFifo(self)}
+
+        FakeSession.instances.append(self)
+
+    instances = []
+    fail = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_val, trace):
+        self.close()
+
+    def close(self):
+        self.closed = True
+
+    fpga_vi_state = 'Running'
+
+    def download(self):
+        pass
+
+    def run(self):
+        pass
+
+
+class PulseGenTest(unittest.TestCase):
+
+    def setUp(self):
+        FakeSession.instances = []
+        FakeSession.fail = 0
+
+        self.seq = Sequence(nchannels=2)
+        self.seq.add_pulse(0, 1e-6, 2e-6)
+        self.seq.add_pulse(1, 2e-6, 5e-6)
+        self.seq.stop_time = 10e-6
+
+    def test_persistent_session(self):
+        p = PulseGen('RIO0', session_factory=FakeSession)
+
+        p.init_fpga()
+        p.program(self.seq)
+        p.run_single()
+        p.run_continuous()
+        p.stop()
+
+        self.assertEqual(len(FakeSession.instances), 1)
+        se = FakeSession.instances[0]
+        self.assertFalse(se.closed)
+        self.assertEqual(se.fifos['command'].data, compile_(self.seq).tolist())
+        self.assertEqual(se.registers['persistent trig'].history, 
+                         [False, True, False])
+
+        p.close()
+        self.assertTrue(se.closed)
+
+        # The session is reopened on demand.
+        p.stop()
+        self.assertEqual(len(FakeSession.instances), 2)
+
+    def test_context_manager(self):
+        with PulseGen('RIO0', session_factory=FakeSession) as p:
+            p.run_single()
+            p.stop()
+
+        self.assertEqual(len(FakeSession.instances), 1)
+        self.assertTrue(FakeSession.instances[0].closed)
+
+    def test_session_per_call(self):
+        p = PulseGen('RIO0', persistent=False, session_factory=FakeSession)
+
+        p.program(self.seq)
+        p.stop()
+
+        self.assertEqual(len(FakeSession.instances), 2)
+        self.assertTrue(all(se.closed for se in FakeSession.instances))
+
+    def test_reconnect(self):
+        p = PulseGen('RIO0', session_factory=FakeSession)
+        p.stop()
+
+        # The upload fails once on the first session and succeeds on 
+        # a new one.
+        FakeSession.instances[0].fail = 1
+        p.program(self.seq)
+
+        self.assertEqual(len(FakeSession.instances), 2)
+        self.assertTrue(FakeSession.instances[0].closed)
+        self.assertEqual(FakeSession.instances[1].fifos['command'].data,
+                         compile_(self.seq).tolist())
+
+        # The FIFO is configured again in the new session.
+        self.assertEqual(FakeSession.instances[1].fifos['command'].depth, 
+                         9000)
+
+        # An error that persists after reconnecting is raised.
+        FakeSession.fail = 2
+        p.close()
+        with self.assertRaises(ConnectionError) as cm:
+            p.program(self.seq, force=True)
+        self.assertIsInstance(cm.exception.__cause__, ConnectionError)
+
+        # Other errors are not retried, and the words written before 
+        # the error are discarded.
+        FakeSession.fail = 0
+        p.close()
+        n = len(FakeSession.instances)
+
+        def invalid(data, timeout_ms=0):
+            raise TypeError('Invalid data.')
+
+        fifo = p.open().fifos['command']
+        fifo.write = invalid
+        with self.assertRaises(TypeError):
+            p.program(self.seq, force=True)
+        self.assertEqual(len(FakeSession.instances), n + 1)
+        self.assertFalse(fifo.running)
+
+        # Triggering is not retried.
+        def lost(data):
+            raise ConnectionError('Lost connection.')
+
+        p.open().registers['software trig'].write = lost
+        with self.assertRaises(ConnectionError):
+            p.run_single()
+        self.assertEqual(len(FakeSession.instances), n + 1)
+
+    def test_stream_validation(self):
+        """Tests that a stream that cannot be compiled is rejected before 
+        the board enters the programming state."""
+
+        seq = Sequence(nchannels=1)
+        seq.add_pulse(0, 0, 2**49 * 1e-8)
+
+        p = PulseGen('RIO0', session_factory=FakeSession)
+        p.stop()
+
+        with self.assertRaises(ValueError):
+            p.program(seq, stream=True)
+
+        se = FakeSession.instances[0]
+        self.assertEqual(se.registers['prog ncmd'].history, [])
+        self.assertEqual(se.fifos['command'].data, [])
+
+    def test_upload(self):
+        """Tests that the code is written to the FIFO in batches that are 
+        views of the compiled array."""
+
+        seq = Sequence(nchannels=1)
+        seq.add_pulses(0, [i*1e-6 for i in range(2000)], 0.5e-6)
+        mcode = compile_(seq)
+
+        p = PulseGen('RIO0', session_factory=FakeSession, fifo_depth=1500,
+                     timeout_ms=100)
+        stats = p.program(mcode)
+
+        fifo = FakeSession.instances[0].fifos['command']
+
+        self.assertTrue(fifo.running)
+        self.assertEqual(fifo.depth, 2000)
+        self.assertEqual(fifo.data, mcode.tolist())
+        self.assertTrue(all(len(c) == 1000 for c, _ in fifo.writes[:-1]))
+        self.assertTrue(all(t == 100 for _, t in fifo.writes))
+        self.assertTrue(all(np.shares_memory(c, mcode.words) 
+                            for c, _ in fifo.writes))
+
+        self.assertIs(stats, p.last_upload)
+        self.assertEqual(stats.words, len(mcode))
+        self.assertEqual(stats.chunk_size, 1000)
+        self.assertGreater(stats.rate, 0)
+
+        # The FIFO is only configured once per session.
+        fifo.depth = 0
+        p.program(mcode)
+        self.assertEqual(fifo.depth, 0)
+
+    def test_play(self):
+        p = PulseGen('RIO0', session_factory=FakeSession, timeout_ms=1000)
+        se = p.open()
+        segments = [compile_(self.seq, cache=False)]
+        words = segments[0].tolist()
+
+        # The board may read the FIFO after the last write returns.
+        se.registers['prog ncmd'] = SlowRegister(3)
+        stats = p.play(segments)
+        self.assertEqual(stats[0].words, len(words))
+        self.assertEqual(se.registers['software trig'].history[-1], True)
+
+        # The stored code does not change with the segments.
+        segments[0].words[:] = 0
+        self.assertEqual(p._programmed_code.tolist(), words)
+
+        # The programming that does not complete in time is an error.
+        p.timeout_ms = 0
+        se.registers['prog ncmd'] = SlowRegister(3)
+        with self.assertRaises(RuntimeError):
+            p.play([compile_(self.seq)])
+
+        with self.assertRaises(ValueError):
+            p.play([])
+
+    def test_skip_upload(self):
+        p = PulseGen('RIO0', session_factory=FakeSession)
+        p.program(self.seq)
+
+        fifo = FakeSession.instances[0].fifos['command']
+        n = len(fifo.writes)
+
+        # The same code is not uploaded again unless forced.
+        stats = p.program(compile_(self.seq, cache=False))
+        self.assertEqual(len(fifo.writes), n)
+        self.assertEqual((stats.words, stats.rate), (0, 0))
+
+        p.program(self.seq, force=True)
+        self.assertEqual(len(fifo.writes), 2*n)
+
+        seq = Sequence(nchannels=1, stop_time=1e-6)
+        p.program(seq)
+        p.program(self.seq)
+        self.assertEqual(len(fifo.writes), 4*n)
+
+        # Loading the bitfile clears the program.
+        p.init_fpga(check=True)
+        p.program(self.seq)
+        self.assertEqual(len(fifo.writes), 5*n)
+
+        # A failed check of the board state discards the digest.
+        self.assertTrue(p.check_state())
+        FakeSession.instances[0].registers['prog ncmd'].value = 3
+        self.assertFalse(p.check_state())
+        FakeSession.instances[0].registers['prog ncmd'].value = 0
+        p.program(self.seq)
+        self.assertEqual(len(fifo.writes), 6*n)
+
+        FakeSession.instances[0].fpga_vi_state = 'NotRunning'
+        with self.assertRaises(RuntimeError):
+            p.init_fpga(check=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
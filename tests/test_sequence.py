@@ -1,5 +1,10 @@
+import random
 import unittest
 
+from math import inf
+
+import numpy as np
+
 from riopulse import Sequence
 from riopulse import DigitalChannel
 from riopulse import translate
@@ -199,6 +204,57 @@ class SequenceTest(unittest.TestCase):
 
         self.assertEqual(ch11, ch6)
 
+    def test_state_switch_order(self):
+        """Tests that state switches added in an arbitrary order are stored 
+        sorted, and that switches at coinciding times cancel."""
+
+        rng = random.Random(1)
+        times = [rng.randint(0, 50)*1e-6 for _ in range(500)]
+
+        ch = DigitalChannel()
+        ref = set()
+        for t in times:
+            ch.add_state_switch(t)
+            ref ^= {t}
+
+        self.assertEqual(ch.switch_times, sorted(ref))
+
+        for t in [-1e-6, 0, 10e-6, 10.5e-6, 60e-6]:
+            n = len([t1 for t1 in ref if t1 < t])
+            self.assertEqual(ch.state(t), n % 2 == 1)
+
+    def test_bulk_pulses(self):
+        """Tests that adding pulses in bulk gives the same result as adding
+        them one by one."""
+
+        rng = random.Random(2)
+        t0 = [rng.randint(0, 100)*1e-6 for _ in range(300)]
+        duration = [rng.randint(1, 20)*1e-6 for _ in range(300)]
+        delay = [rng.choice([0, 1e-6, 2.5e-6]) for _ in range(300)]
+
+        seq1 = Sequence(nchannels=2, start_time=-1e-6)
+        seq2 = Sequence(nchannels=2, start_time=-1e-6)
+        for t, d, dl in zip(t0, duration, delay):
+            seq1.add_pulse(0, t, d)
+            seq1.append_pulse(1, dl, d)
+
+        seq2.add_pulses(0, t0, duration)
+        seq2.append_pulses(1, delay, duration)
+
+        self.assertEqual(seq1, seq2)
+
+        # Appends to a channel that already contains transitions.
+        seq1.append_pulse(0, 1e-6, 2e-6)
+        seq1.append_pulse(0, 0, 3e-6)
+        seq2.append_pulses(0, [1e-6, 0], [2e-6, 3e-6])
+
+        self.assertEqual(seq1, seq2)
+
+        with self.assertRaises(ValueError):
+            seq2.add_pulses(0, [1e-6, 2e-6], [1e-6, 0])
+        with self.assertRaises(ValueError):
+            seq2.append_pulses(0, [-1e-6], 1e-6)
+
     def test_translation(self):
 
         seq1 = Sequence(nchannels=2, start_time=10e-6)
@@ -222,6 +278,257 @@ class SequenceTest(unittest.TestCase):
 
         self.assertEqual(cmd, ref)
 
+    def test_translation_reference(self):
+        """Compares the translation of random sequences with a reference 
+        implementation that processes the state switches one by one."""
+
+        rng = random.Random(3)
+
+        for _ in range(20):
+            nch = rng.randint(1, 8)
+            seq = Sequence(nchannels=nch,
+                           defaults=[rng.random() > 0.5 for _ in range(nch)],
+                           start_time=rng.choice([0, 1e-6, -2e-6]))
+            for _ in range(rng.randint(0, 200)):
+                # Edges are placed on and between clock cycles, so that 
+                # some of them coincide after quantization.
+                seq.add_pulse(rng.randrange(nch), rng.randint(0, 400)*5e-9, 
+                              rng.randint(1, 40)*5e-9)
+            seq.stop_time = seq.stop_time + rng.choice([0, 5e-9, 1e-8, 1e-6])
+
+            self.assertEqual(translate(seq, dt=10e-9), 
+                             reference_translate(seq, dt=10e-9))
+
+        # An empty sequence.
+        seq = Sequence(nchannels=2, defaults=[True, False], stop_time=1e-6)
+        self.assertEqual(translate(seq), reference_translate(seq))
+
+
+    def test_integer_times(self):
+        """Tests sequences with times in integer numbers of clock cycles."""
+
+        seq1 = Sequence(nchannels=2, start_time=10e-6)
+        seq1.append_pulse(0, 5e-6, 10e-6)
+        seq1.append_pulse(0, 0, 20e-6)
+        seq1.add_pulse(1, 15e-6, 15e-6)
+        seq1.stop_time = 75e-6
+
+        seq2 = Sequence(nchannels=2, start_time=1000, clock_period=10e-9)
+        seq2.append_pulse(0, 500, 1000)
+        seq2.append_pulse(0, 0, 2000)
+        seq2.add_pulses(1, [1500], 1500)
+        seq2.stop_time = 7500
+
+        self.assertEqual(seq2.channels[0].switch_times, [1500, 4500])
+        self.assertEqual(translate(seq1, dt=10e-9), translate(seq2))
+
+        with self.assertRaises(ValueError):
+            translate(seq2, dt=20e-9)
+
+        with self.assertRaises(TypeError):
+            seq2.add_pulse(0, 1e-6, 100)
+        with self.assertRaises(TypeError):
+            seq2.add_pulses(0, [100, 200], [1.5, 1.5])
+        with self.assertRaises(TypeError):
+            seq2.stop_time = 1e-3
+        with self.assertRaises(TypeError):
+            Sequence(nchannels=1, clock_period=1e-8, stop_time=10.7)
+
+        self.assertEqual(seq2.ticks(15e-6), 1500)
+        self.assertEqual(seq2.ticks([0, 1e-6]).tolist(), [0, 100])
+
+        # Switches cancel exactly, also where float times would not.
+        seq3 = Sequence(nchannels=1, clock_period=10e-9)
+        seq3.add_pulse(0, seq3.ticks(0.1e-6), seq3.ticks(0.2e-6))
+        seq3.add_pulse(0, seq3.ticks(0.3e-6), seq3.ticks(0.1e-6))
+        self.assertEqual(seq3.channels[0].switch_times, [10, 40])
+
+        # Very long sequences are represented exactly.
+        seq4 = Sequence(nchannels=1, clock_period=10e-9)
+        seq4.add_pulse(0, 2**47, 1)
+        seq4.stop_time = 2**47 + 10
+        self.assertEqual(translate(seq4)[1:4], 
+                         [['cout', 0, 2**47 - 1], ['cout', 1, 0], 
+                          ['cout', 0, 8]])
+
+        self.assertNotEqual(seq2, Sequence(nchannels=2, start_time=1000, 
+                                           stop_time=7500))
+
+    def test_sample(self):
+        seq = Sequence(nchannels=10, defaults=[False]*9 + [True])
+        seq.add_pulse(0, 1e-6, 2e-6)
+        seq.add_pulses(9, [0, 2e-6], 0.5e-6)
+
+        times = [0, 0.5e-6, 1e-6, 1.5e-6, 2.2e-6, 3e-6, 4e-6]
+        ref = [[c.state(t) for c in seq.channels] for t in times]
+
+        self.assertEqual(seq.channels[0].states_at(times).tolist(), 
+                         [r[0] for r in ref])
+        self.assertEqual(seq.sample(times).tolist(), ref)
+
+        packed = seq.sample(times, packed=True)
+        self.assertEqual(packed.dtype, np.uint8)
+        self.assertEqual(packed.shape, (len(times), 2))
+        self.assertEqual(packed[2].tolist(), [0b0, 0b10])
+        self.assertEqual(packed[3].tolist(), [0b1, 0b10])
+
+        # The curve is built from the sampled states.
+        ch = seq.channels[0]
+        self.assertEqual(ch.curve(), ([1e-6, 1e-6, 3e-6, 3e-6], 
+                                      [False, True, True, False]))
+        self.assertEqual(ch.curve([0, 2e-6]), ([0, 1e-6, 1e-6, 2e-6], 
+                                               [False, False, True, True]))
+        self.assertEqual(repr(seq.channels[9]).splitlines()[1:3], 
+                         ['t=0s\t1->0', 't=5e-07s\t0->1'])
+
+    def test_envelope(self):
+        ch = DigitalChannel()
+        ch.add_state_switches([1e-6, 1.2e-6, 5.5e-6])
+
+        edges, low, high = ch.envelope([0, 8e-6], 4)
+
+        self.assertEqual(len(edges), 5)
+        self.assertEqual(low.tolist(), [False, False, False, True])
+        self.assertEqual(high.tolist(), [True, False, True, True])
+
+    def test_composition(self):
+        a = Sequence(nchannels=2, defaults=[False, True], start_time=10, 
+                     stop_time=110, clock_period=1e-8)
+        a.add_pulse(0, 20, 10)
+        a.add_pulse(1, 50, 60)  # Lasts until the stop time
+
+        b = Sequence(nchannels=2, defaults=[True, False], stop_time=40, 
+                     clock_period=1e-8)
+        b.add_pulse(0, 0, 5)  # Starts at the start time
+        b.add_pulse(1, 30, 10)
+
+        c = a.shift(-10)
+        self.assertEqual((c.start_time, c.stop_time), (0, 100))
+        self.assertEqual(c.channels[0].switch_times, [10, 20])
+        self.assertEqual(a.channels[0].switch_times, [20, 30])
+
+        # Reproduces the states of the blocks over their intervals.
+        ab = Sequence.concat(a, b, a)
+        self.assertEqual((ab.start_time, ab.stop_time), (10, 250))
+        self.assertEqual([ch.default for ch in ab.channels], [False, True])
+
+        # The states are compared in the middle of the clock cycles.
+        ref = np.concatenate([a.sample(np.arange(10, 110) + 0.5),
+                              b.sample(np.arange(0, 40) + 0.5),
+                              a.sample(np.arange(10, 110) + 0.5)])
+        self.assertTrue(np.array_equal(ab.sample(np.arange(10, 250) + 0.5), 
+                                       ref))
+
+        # The switches at the boundaries 110 and 150 to the defaults of 
+        # the next blocks cancel the switches of the blocks.
+        self.assertEqual(ab.channels[0].switch_times, 
+                         [20, 30, 115, 150, 160, 170])
+        self.assertEqual(ab.channels[1].switch_times, [50, 140, 190, 250])
+
+        self.assertEqual(a.repeat(3), a.concat(a, a))
+        self.assertEqual(a.repeat(1), a)
+        self.assertEqual(a.repeat(2).channels[1].switch_times, 
+                         [50, 110, 150, 210])
+
+        # A block that ends in the state other than the default is 
+        # followed by a switch back.
+        d = Sequence(nchannels=1, stop_time=10, clock_period=1e-8)
+        d.channels[0].add_state_switch(2)
+        self.assertEqual(d.repeat(3).channels[0].switch_times, 
+                         [2, 10, 12, 20, 22])
+        with self.assertRaises(ValueError):
+            a.repeat(0)
+
+        # Merging is the same as adding the switches to one sequence.
+        m = a.merge(c)
+        ref = Sequence(nchannels=2, defaults=[False, False], stop_time=110,
+                       clock_period=1e-8)
+        for seq in [a, c]:
+            for x, y in zip(ref.channels, seq.channels):
+                x.add_state_switches(y.switch_times)
+        self.assertEqual(m, ref)
+        self.assertEqual(m.channels[0].switch_times, [10, 30])
+
+        with self.assertRaises(ValueError):
+            a.merge(Sequence(nchannels=3, clock_period=1e-8))
+        with self.assertRaises(ValueError):
+            a.concat(Sequence(nchannels=2))
+
+    def test_composition_float(self):
+        seq = Sequence(nchannels=1)
+        seq.add_pulses(0, np.arange(10)*1e-6, 0.3e-6)
+        seq.stop_time = 9.3e-6  # The last pulse ends at the stop time
+
+        r = seq.repeat(1000)
+
+        # The last pulse of every block joins the first one of the next.
+        self.assertEqual(len(r.channels[0].switch_times), 20*1000 - 2*999)
+        self.assertEqual(r, Sequence.concat(*[seq]*1000))
+        self.assertAlmostEqual(r.stop_time, 9.3e-3)
+
+    def test_changed_window(self):
+        seq = Sequence(nchannels=2)
+        seq.add_pulse(0, 1e-6, 1e-6)
+        seq.stop_time = 10e-6
+        v = seq.version
+
+        self.assertIsNone(seq.changed_window(v))
+
+        seq.add_pulse(1, 3e-6, 1e-6)
+        seq.add_pulses(0, [5e-6, 7e-6], 0.5e-6)
+        self.assertEqual(seq.changed_window(v), (3e-6, 7.5e-6))
+        v = seq.version
+
+        # A single switch changes the states until the end.
+        seq.channels[1].add_state_switch(6e-6)
+        self.assertEqual(seq.changed_window(v), (6e-6, inf))
+
+        seq.stop_time = 12e-6
+        self.assertEqual(seq.changed_window(seq.version - 1), (10e-6, inf))
+
+        seq.channels[0].default = True
+        self.assertEqual(seq.changed_window(v), (-inf, inf))
+
+
+def reference_translate(seq, dt=1e-8):
+    """A direct implementation of translation that loops over the ordered 
+    state switches."""
+
+    times = []
+    channel_numbers = []
+    for i, c in enumerate(seq.channels):
+        times += c.switch_times
+        channel_numbers += [i]*len(c.switch_times)
+
+    sidx = sorted(range(len(times)), key=lambda i: times[i])
+    times = [times[i] for i in sidx]
+    channel_numbers = [channel_numbers[i] for i in sidx]
+
+    t0 = seq.start_time
+    clock_cycles = [round((t-t0)/dt) for t in times]
+
+    commands = [['trigwait', 0, 0]]
+
+    sig = 0
+    for i, c in enumerate(seq.channels):
+        sig = sig | (c.default << i)
+
+    cc = 0
+    for ch, cc_next in zip(channel_numbers, clock_cycles):
+        if cc_next > cc:
+            commands.append(['cout', sig, cc_next-cc-1])
+            cc = cc_next
+        sig = sig ^ (1 << ch)
+
+    cc_next = round((seq.stop_time - seq.start_time)/dt)
+    if cc_next-cc > 1:
+        commands.append(['cout', sig, cc_next-cc-1])
+
+    commands.append(['init', 0, 0])
+
+    return commands
+
+
 def reduce(cmd):
     """Merges sequential cout commands with the same outputs into one
     command"""
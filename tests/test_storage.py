@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from riopulse import Sequence, MachineCode, PulseGen, Emulator, compile_
+from riopulse import storage
+
+
+class StorageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.dir.name, name)
+
+    def test_sequence(self):
+        seq = Sequence(nchannels=3, defaults=[False, True, False], 
+                       start_time=-1e-6)
+        seq.add_pulses(0, np.arange(100)*1e-6, 0.3e-6)
+        seq.add_pulse(2, 5e-6, 2e-6)
+        seq.stop_time = 200e-6
+
+        seq.save(self.path('seq.bin'))
+        seq2 = Sequence.load(self.path('seq.bin'))
+
+        self.assertEqual(seq2, seq)
+        self.assertEqual(MachineCode.load(self.path('seq.bin')), 
+                         compile_(seq))
+
+        # Integer times.
+        seq = Sequence(nchannels=2, clock_period=1e-8, start_time=5)
+        seq.add_pulse(1, 10, 2**40)
+
+        seq.save(self.path('ticks.bin'), code=False)
+        seq2 = Sequence.load(self.path('ticks.bin'))
+
+        self.assertEqual(seq2, seq)
+        self.assertEqual(seq2.channels[1].switch_times, [10, 10 + 2**40])
+
+        with self.assertRaises(ValueError):
+            MachineCode.load(self.path('ticks.bin'))
+
+    def test_code(self):
+        seq = Sequence(nchannels=2)
+        seq.add_pulses(1, np.arange(1000)*1e-6, 0.5e-6)
+        mcode = compile_(seq)
+
+        mcode.save(self.path('code.bin'))
+        data = storage.load(self.path('code.bin'))
+
+        self.assertIsNone(data.sequence)
+        self.assertFalse(data.code.words.flags.owndata)
+        self.assertFalse(data.code.words.flags.writeable)
+        self.assertEqual(data.code, mcode)
+
+        # The memory-mapped code is uploaded directly.
+        emu = Emulator()
+        p = PulseGen('emulator', session_factory=emu.session)
+        p.program(data.code)
+        self.assertTrue(emu.verify(seq))
+
+        with open(self.path('other.bin'), 'wb') as f:
+            f.write(b'\0'*100)
+        with self.assertRaises(ValueError):
+            storage.load(self.path('other.bin'))
@@ -0,0 +1,136 @@
+import random
+import unittest
+
+from riopulse import Sequence, compile_
+from riopulse import SequenceTemplate, Parameter
+
+
+class TemplateTest(unittest.TestCase):
+
+    def test_sequence(self):
+        tmpl = SequenceTemplate(nchannels=2, stop_time='stop',
+                                params={'delay': 1e-6, 'width': 2e-6, 
+                                        'stop': 10e-6})
+        tmpl.add_pulse(0, 0, 'width')
+        tmpl.add_pulse(1, Parameter('delay') + 1e-6, 2*Parameter('width'))
+
+        seq = Sequence(nchannels=2)
+        seq.add_pulse(0, 0, 2e-6)
+        seq.add_pulse(1, 2e-6, 4e-6)
+        seq.stop_time = 10e-6
+
+        self.assertEqual(tmpl.sequence(), seq)
+
+        with self.assertRaises(KeyError):
+            tmpl.sequence(height=1)
+
+    def test_patch(self):
+        """Tests updating the code by patching the durations."""
+
+        tmpl = SequenceTemplate(nchannels=3, params={'delay': 2e-6, 
+                                                     'width': 2e-7})
+        for i in range(100):
+            tmpl.add_pulse(0, i*1e-5, 1e-6)
+        tmpl.add_pulse(1, 'delay', 'width')
+        tmpl.add_pulse(2, 'delay', 1e-6)
+
+        mcode = tmpl.compile()
+        self.assertEqual(mcode, compile_(tmpl.sequence()))
+        self.assertEqual(tmpl.dependencies['width'].tolist(), [3, 4])
+        self.assertEqual(tmpl.dependencies['delay'].tolist(), [2, 3, 4, 5])
+
+        mcode2 = tmpl.update(delay=2.5e-6)
+
+        self.assertIs(mcode2, mcode)
+        self.assertEqual(tmpl.patched.tolist(), [2, 3, 4, 5])
+        self.assertEqual(mcode, compile_(tmpl.sequence()))
+
+        # Moving the pulse across the edges of other pulses changes 
+        # the order of the state switches.
+        tmpl.update(delay=1.1e-5)
+
+        self.assertIsNone(tmpl.patched)
+        self.assertEqual(tmpl.code, compile_(tmpl.sequence()))
+
+        # Unchanged values do not modify the code.
+        tmpl.update(delay=1.1e-5)
+        self.assertEqual(len(tmpl.patched), 0)
+
+    def test_rejected_update(self):
+        """Tests that a rejected update leaves the values and the code 
+        unchanged."""
+
+        tmpl = SequenceTemplate(nchannels=2, params={'delay': 2e-6,
+                                                     'width': 1e-6})
+        tmpl.add_pulse(0, 0, 'width')
+        tmpl.add_pulse(1, 'delay', 1e-6)
+
+        mcode = tmpl.compile()
+        words = mcode.tolist()
+
+        with self.assertRaises(ValueError):
+            tmpl.update(width=-1e-6)
+
+        self.assertEqual(tmpl.values, {'delay': 2e-6, 'width': 1e-6})
+        self.assertIs(tmpl.code, mcode)
+        self.assertEqual(mcode.tolist(), words)
+
+        # The next update starts from the valid state.
+        tmpl.update(delay=3e-6)
+        self.assertEqual(tmpl.code, compile_(tmpl.sequence()))
+
+        # The same holds when the update recompiles the sequence.
+        tmpl.stop_time = 10e-6
+        with self.assertRaises(ValueError):
+            tmpl.update(width=-1e-6)
+        self.assertEqual(tmpl.values, {'delay': 3e-6, 'width': 1e-6})
+
+    def test_clock_period(self):
+        """Tests that the clock period is kept when the template is 
+        recompiled after an edit."""
+
+        tmpl = SequenceTemplate(nchannels=1, params={'width': 1e-6})
+        tmpl.add_pulse(0, 0, 'width')
+        tmpl.compile(2e-8)
+
+        tmpl.add_pulse(0, 5e-6, 1e-6)
+        mcode = tmpl.update(width=2e-6)
+        self.assertEqual(mcode, compile_(tmpl.sequence(), 2e-8))
+
+        tmpl.stop_time = 20e-6
+        mcode = tmpl.update(width=3e-6)
+        self.assertEqual(mcode, compile_(tmpl.sequence(), 2e-8))
+
+    def test_random_updates(self):
+        """Compares the patched code with the code compiled from scratch."""
+
+        rng = random.Random(1)
+        npatched = 0
+
+        for _ in range(50):
+            params = {name: rng.randint(1, 50)*1e-8 for name in 'abc'}
+            tmpl = SequenceTemplate(nchannels=3, params=params,
+                                    stop_time=rng.choice(
+                                        [None, 'c', Parameter('a') + 5e-7]))
+
+            for _ in range(rng.randint(0, 6)):
+                t0 = rng.choice([0, rng.randint(0, 40)*1e-8, 'a', 
+                                 Parameter('b') + 2e-8, 2*Parameter('a')])
+                duration = rng.choice([1e-8, 'c', Parameter('b') + 1e-8])
+                tmpl.add_pulse(rng.randrange(3), t0, duration)
+
+            tmpl.compile()
+
+            for _ in range(10):
+                name = rng.choice('abc')
+                value = (rng.randint(1, 50)*1e-8 
+                         + rng.choice([0, 0.3e-8, 0.5e-8]))
+
+                mcode = tmpl.update(**{name: value})
+                self.assertEqual(mcode, compile_(tmpl.sequence(), 
+                                                 cache=False))
+
+                if tmpl.patched is not None:
+                    npatched += 1
+
+        self.assertGreater(npatched, 0)